@@ -1,20 +1,45 @@
 from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from models import db, User, StudentDetail, MenuItem, Order, OrderDetail
+from models import db, User, StudentDetail, MenuItem, Order, OrderDetail, OrderRollup
+import reports
+from database import init_database, full_table_scans
+import migrations
+from images import RemoteImageCache
+from cache import DashboardCounters, MenuCache, MenuEntry, RenderCache, UserCache
+from cart_store import EMPTY_SUMMARY, create_cart_store
+from security import LoginRateLimiter, password_policy
+from chatbot import ChatBusy, ChatService, ChatTimeout, FakeChatModel, ResponseCache
+from recommender import RecommenderCache
+from instrumentation import Instrumentation, QueryBudgetExceeded
+from search import SearchIndex
+from student_io import StudentImporter, export_students_csv
+from order_export import EXPORT_FORMATS, export_orders
+from order_status import MAX_BULK_ORDERS, ORDER_TRANSITIONS, matching_order_ids, transition_orders
 # werkzeug.security.check_password_hash is not used directly because
 # password checking is handled by User.check_password(); remove unused import
+from sqlalchemy import event, insert
+from sqlalchemy.orm import joinedload, selectinload
 from datetime import datetime, timedelta
 import json
+import click
 from dotenv import load_dotenv
 import google.generativeai as genai
 import os
-import requests
 import io
-from flask import Response, send_file
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import shutil
+import tempfile
+import hmac
+import time
+import uuid
+from flask import Response, abort, g, send_file, stream_with_context
+from markupsafe import Markup
+from werkzeug.middleware.proxy_fix import ProxyFix
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'smart-canteen-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///canteen.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Nạp biến môi trường từ file .env
@@ -22,7 +47,10 @@ load_dotenv()
 
 # Lấy API key từ .env
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
+if os.getenv('CHAT_MODEL') == 'fake':
+    # Model giả để chạy thử / kiểm thử chatbot, không gọi ra ngoài
+    model = FakeChatModel()
+elif GEMINI_API_KEY:
     genai.configure(api_key=GEMINI_API_KEY)
     # Khởi tạo model Gemini - ĐÃ SỬA THÀNH MODEL MỚI
     model = genai.GenerativeModel("gemini-2.5-pro")
@@ -30,23 +58,115 @@ else:
     print("⚠️  Không tìm thấy GEMINI_API_KEY trong file .env")
     model = None
 
-db.init_app(app)
+# Chatbot chạy trong thread pool riêng, giới hạn số lời gọi đồng thời và đang chờ
+chat_service = ChatService(model,
+                           max_workers=app.config.get('CHAT_MAX_WORKERS', 2),
+                           max_queue=app.config.get('CHAT_MAX_QUEUE', 8),
+                           timeout=app.config.get('CHAT_TIMEOUT', 30),
+                           # Nhỏ hơn số thread WSGI: chờ chatbot không chiếm hết thread của đặt món
+                           max_waiters=int(os.getenv('CHAT_MAX_WAITERS', app.config.get('CHAT_MAX_WAITERS', 4))))
+# Câu trả lời cho câu hỏi lặp lại, khóa theo (version thực đơn, câu hỏi chuẩn hóa)
+chat_replies = ResponseCache(max_entries=app.config.get('CHAT_CACHE_SIZE', 512),
+                             ttl=app.config.get('CHAT_CACHE_TTL', 1800))
+
+# Số câu SQL tối đa cho mỗi request của các trang chính
+QUERY_BUDGETS = {
+    'menu': 3, 'cart': 3, 'orders': 3, 'profile': 2, 'api_cart': 2,
+    'admin_dashboard': 4, 'admin_orders': 2, 'admin_menu': 2, 'admin_students': 4,
+    'admin_reports': 7, 'admin_student_detail': 3, 'admin_order_detail': 2,
+}
+
+# Kết nối DB: mặc định SQLite + WAL, đặt DATABASE_URL để dùng PostgreSQL
+init_database(app, db)
+
+# Số câu SQL / thời gian DB / render theo endpoint; vượt QUERY_BUDGETS thì ghi log
+# (QUERY_BUDGET_STRICT=True khi kiểm thử thì request lỗi luôn)
+instrumentation = Instrumentation(budgets=app.config.get('QUERY_BUDGETS', QUERY_BUDGETS))
+with app.app_context():
+    instrumentation.init_app(app, db.engine)
+
+# Chạy sau reverse proxy (nginx...): TRUSTED_PROXIES = số proxy phía trước app.
+# Khi đó IP lấy từ X-Forwarded-For để giới hạn đăng nhập theo IP thật của sinh viên,
+# không phải IP của proxy. Không đặt khi app nhận kết nối trực tiếp (header giả được).
+TRUSTED_PROXIES = int(os.getenv('TRUSTED_PROXIES', app.config.get('TRUSTED_PROXIES', 0)))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES, x_proto=TRUSTED_PROXIES)
+
+# Băm mật khẩu theo PASSWORD_HASH_METHOD; giới hạn lượt đăng nhập theo username/IP
+password_policy.configure(method=os.getenv('PASSWORD_HASH_METHOD', app.config.get('PASSWORD_HASH_METHOD')))
+login_limiter = LoginRateLimiter(**app.config.get('LOGIN_RATE_LIMITS', {}))
+
+# Bộ đếm dashboard cache trong process, nạp lại từ DB sau COUNTER_CACHE_TTL giây
+dashboard_counters = DashboardCounters(ttl=app.config.get('COUNTER_CACHE_TTL', 300))
+
+
+# Giỏ hàng lưu phía server ('sql' hoặc 'memory'); session chỉ giữ cart_id
+cart_store = create_cart_store(os.getenv('CART_STORE', app.config.get('CART_STORE', 'sql')))
+CART_MAX_AGE = 7 * 24 * 3600
+
+
+def current_cart_id(create=False):
+    """Id giỏ hàng của session; chuyển giỏ cũ (session['cart']) sang store nếu còn."""
+    cart_id = session.get('cart_id')
+    legacy = session.pop('cart', None)
+    if cart_id is None and (create or legacy):
+        cart_id = session['cart_id'] = uuid.uuid4().hex
+    if legacy:
+        for line in legacy.values():
+            cart_store.add(cart_id, line, line['quantity'])
+    return cart_id
+
+
+def cart_summary():
+    """Tổng số lượng / số dòng / tổng tiền của giỏ, đọc một lần mỗi request."""
+    if 'cart_summary' not in g:
+        cart_id = current_cart_id()
+        g.cart_summary = cart_store.summary(cart_id) if cart_id else EMPTY_SUMMARY
+    return g.cart_summary
+
+
+def cart_quantity():
+    return cart_summary().count
 
 
 @app.context_processor
 def inject_cart_count():
-    cart = session.get('cart', {})
-    total_qty = sum(item.get('quantity', 0) for item in cart.values())
-    return dict(cart_quantity=total_qty)
+    return dict(cart_quantity=cart_quantity())
+
+
+_static_hashes = {}
+
+
+@app.template_global()
+def static_url(filename):
+    """URL file tĩnh kèm hash nội dung (?v=...), được cache vĩnh viễn ở trình duyệt."""
+    digest = _static_hashes.get(filename)
+    if digest is None:
+        with open(os.path.join(app.static_folder, filename), 'rb') as f:
+            digest = _static_hashes[filename] = hashlib.sha256(f.read()).hexdigest()[:12]
+    return url_for('static', filename=filename, v=digest)
+
+
+@app.after_request
+def cache_versioned_static(response):
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    return response
 
 # Flask-Login setup
 login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.init_app(app)
 
+# current_user lấy từ cache trong process, không truy vấn DB ở mỗi request
+user_cache = UserCache(ttl=app.config.get('USER_CACHE_TTL', 60))
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 # Tạo dữ liệu mẫu
 def create_sample_data():
@@ -144,9 +264,18 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
+        # Chặn trước khi băm mật khẩu để dò mật khẩu không tốn CPU
+        if not login_limiter.allow(username, request.remote_addr):
+            flash('Bạn đăng nhập quá nhiều lần, vui lòng thử lại sau ít phút!', 'error')
+            return render_template('login.html'), 429
+        
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            if db.session.is_modified(user):
+                # Hash cũ vừa được băm lại theo cấu hình hiện tại
+                db.session.commit()
+            login_limiter.reset(username)
             login_user(user)
             flash('Đăng nhập thành công!', 'success')
             
@@ -168,75 +297,142 @@ def logout():
 
 # ========== STUDENT ROUTES ==========
 
+# Mô tả, ảnh và icon cho các món đã biết (không lưu trong DB)
+MENU_DESCRIPTIONS = {
+    'Cơm gà xối mỡ': 'Cơm gà vàng ruộm, thấm vị, ăn kèm dưa leo và nước sốt đặc trưng.',
+    'Phở bò': 'Phở thơm, nước dùng đậm đà, thịt bò mềm và bánh phở tươi.',
+    'Bún chả': 'Bún tươi kèm chả nướng, nước mắm chua ngọt và rau sống.',
+    'Bánh mì pate': 'Bánh mì giòn rụm, pate thơm béo, thêm dưa chuột và hành chua.',
+    'Xôi gà': 'Xôi dẻo, gà xé thấm gia vị, rắc ruốc và hành phi.' ,
+    'Cafe sữa': 'Cà phê phin thơm nồng, hòa quyện sữa đặc ngọt dịu.'
+}
+
+# Map display names to slug keys used by the server-side proxy
+MENU_IMAGE_KEYS = {
+    'Phở bò': 'pho_bo',
+    'Cơm gà xối mỡ': 'com_ga_xoi_mo',
+    'Bún chả': 'bun_cha',
+    'Bánh mì pate': 'banh_mi_pate',
+    'Xôi gà': 'xoi_ga',
+    'Cafe sữa': 'cafe_sua'
+}
+
+# Provide a simple emoji icon for each dish to use as a fallback or preferred display
+MENU_ICONS = {
+    'Phở bò': '🍜',
+    'Cơm gà xối mỡ': '🍗',
+    'Bún chả': '🍖',
+    'Bánh mì pate': '🥖',
+    'Xôi gà': '🍚',
+    'Cafe sữa': '☕'
+}
+
+
+def prefetch_menu_image(item):
+    """Món vừa thêm / đổi tên có ảnh định sẵn thì tải nền ngay nếu chưa có."""
+    key = MENU_IMAGE_KEYS.get(item.ten_mon)
+    if key:
+        remote_images.prefetch_missing([key])
+
+
+def build_menu_entries():
+    """Đọc thực đơn từ DB và trang trí sẵn ảnh, icon, mô tả cho từng món."""
+    entries = []
+    missing_images = []
+    for item in MenuItem.query.order_by(MenuItem.loai, MenuItem.ten_mon).all():
+        srcset = ''
+        if item.ten_mon in MENU_IMAGE_KEYS:
+            # Use a server-side proxy for the specific images to avoid hotlink/CORS issues
+            key = MENU_IMAGE_KEYS[item.ten_mon]
+            digest = remote_images.digest(key)
+            image = url_for('remote_image', name=key, v=digest)
+            if not digest:
+                missing_images.append(key)
+            else:
+                srcset = ', '.join(f"{url_for('remote_image', name=key, v=digest, w=width)} {width}w"
+                                   for width in remote_images.widths(key))
+        else:
+            # Fallback to Unsplash using the category as query
+            q = item.loai or 'food'
+            image = f'https://source.unsplash.com/800x480/?{q.replace(" ", ",")}'
+
+        entries.append(MenuEntry(
+            id=item.id,
+            ten_mon=item.ten_mon,
+            gia=item.gia,
+            loai=item.loai,
+            is_available=item.is_available,
+            image=image,
+            image_srcset=srcset,
+            icon_emoji=MENU_ICONS.get(item.ten_mon, '🍽️'),
+            # description: use sample if available else generic based on category
+            description=MENU_DESCRIPTIONS.get(item.ten_mon,
+                                              f"{item.ten_mon} — một lựa chọn ngon thuộc hạng {item.loai}.")
+        ))
+    # Chỉ tải các ảnh chưa có trong cache; dựng lại snapshot (hết TTL) không gọi ra CDN
+    remote_images.prefetch_missing(missing_images)
+    return entries
+
+
+# Thực đơn đọc rất nhiều nhưng ít khi đổi: dựng một lần, xóa khi admin sửa món
+menu_cache = MenuCache(build_menu_entries, ttl=app.config.get('MENU_CACHE_TTL', 60))
+
+# Tìm kiếm sinh viên / món ăn (SQLite FTS5, hoặc bảng search_term nếu không có)
+search_index = SearchIndex(backend=os.getenv('SEARCH_BACKEND', app.config.get('SEARCH_BACKEND')),
+                           menu_description=lambda item: MENU_DESCRIPTIONS.get(item.ten_mon, ''))
+
+
+@app.before_request
+def ensure_search_index():
+    # Chạy một lần mỗi process, khi session chưa có thay đổi nào
+    if search_index.backend is None and request.endpoint != 'static':
+        search_index.ensure()
+
+
+# Phần danh sách món (giống nhau với mọi sinh viên) chỉ render một lần mỗi version
+render_cache = RenderCache()
+
+
 @app.route('/menu')
 @login_required
 def menu():
     if current_user.role == 'admin':
         return redirect(url_for('admin_dashboard'))
     
-    # Load available menu items
-    menu_items = MenuItem.query.order_by(MenuItem.loai, MenuItem.ten_mon).all()
-
-    # Enhance items with image and description for better UI without changing DB schema
-    sample_descriptions = {
-        'Cơm gà xối mỡ': 'Cơm gà vàng ruộm, thấm vị, ăn kèm dưa leo và nước sốt đặc trưng.',
-        'Phở bò': 'Phở thơm, nước dùng đậm đà, thịt bò mềm và bánh phở tươi.',
-        'Bún chả': 'Bún tươi kèm chả nướng, nước mắm chua ngọt và rau sống.',
-        'Bánh mì pate': 'Bánh mì giòn rụm, pate thơm béo, thêm dưa chuột và hành chua.',
-        'Xôi gà': 'Xôi dẻo, gà xé thấm gia vị, rắc ruốc và hành phi.' ,
-        'Cafe sữa': 'Cà phê phin thơm nồng, hòa quyện sữa đặc ngọt dịu.'
-    }
-
-    # Map display names to slug keys used by the server-side proxy
-    name_to_key = {
-        'Phở bò': 'pho_bo',
-        'Cơm gà xối mỡ': 'com_ga_xoi_mo',
-        'Bún chả': 'bun_cha',
-        'Bánh mì pate': 'banh_mi_pate',
-        'Xôi gà': 'xoi_ga',
-        'Cafe sữa': 'cafe_sua'
-    }
-
-    for idx, item in enumerate(menu_items):
-        # assign rotating placeholder images (static SVGs added earlier)
-        # choose an illustrative image from Unsplash using query keywords (no external download needed)
-        # Map known dish names to queries for better matches, otherwise fallback to category
-        # First prefer explicit image URLs provided for known dishes (these come from the user)
-        # Use a server-side proxy for the specific images to avoid hotlink/CORS issues
-        # We expose them via the route '/remote_image/<key>' below.
-        # Provide a simple emoji icon for each dish to use as a fallback or preferred display
-        icon_map = {
-            'Phở bò': '🍜',
-            'Cơm gà xối mỡ': '🍗',
-            'Bún chả': '🍖',
-            'Bánh mì pate': '🥖',
-            'Xôi gà': '🍚',
-            'Cafe sữa': '☕'
-        }
-
-        if item.ten_mon in name_to_key:
-            key = name_to_key[item.ten_mon]
-            item.image = url_for('remote_image', name=key)
-        else:
-            # Fallback to Unsplash if no explicit mapping exists
-            queries = {
-                'Cơm gà xối mỡ': 'chicken rice vietnamese',
-                'Phở bò': 'vietnamese pho beef soup',
-                'Bún chả': 'bun cha vietnamese grill pork',
-                'Bánh mì pate': 'banh mi sandwich',
-                'Xôi gà': 'sticky rice chicken',
-                'Cafe sữa': 'vietnamese coffee'
-            }
-            q = queries.get(item.ten_mon, item.loai or 'food')
-            item.image = f'https://source.unsplash.com/800x480/?{q.replace(" ", ",")}'
-
-        item.icon_emoji = icon_map.get(item.ten_mon, '🍽️')
-
-        # description: use sample if available else generic based on category
-        item.description = sample_descriptions.get(item.ten_mon,
-                                                   f"{item.ten_mon} — một lựa chọn ngon thuộc hạng {item.loai}.")
-
-    return render_template('menu.html', menu_items=menu_items)
+    snapshot = menu_cache.get()
+    search = request.args.get('q', '').strip()
+
+    # Trang chỉ khác nhau giữa các sinh viên ở badge giỏ hàng, nên ETag gồm
+    # version thực đơn và số món trong giỏ. Khi còn flash message thì luôn render
+    # và không gửi ETag.
+    qty = cart_quantity()
+    etag = f"menu-{snapshot.version}-{qty}"
+    has_flashes = '_flashes' in session
+    if not has_flashes and request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif search:
+        # Kết quả tìm kiếm không cache; thứ tự giữ theo thực đơn
+        ids = set(search_index.search_ids('menu', search))
+        items = [item for item in snapshot.items if item.id in ids]
+        menu_body = render_template('_menu_items.html', menu_items=items)
+        response = app.make_response(render_template('menu.html', menu_body=Markup(menu_body),
+                                                      search=search, result_count=len(items)))
+    else:
+        menu_body = render_cache.get_or_render(
+            ('menu', snapshot.version),
+            lambda: render_template('_menu_items.html', menu_items=snapshot.items))
+        response = app.make_response(render_template('menu.html', menu_body=Markup(menu_body)))
+
+    response.cache_control.private = True
+    if has_flashes:
+        # Trang có flash message không được lưu / xác thực lại bằng ETag, nếu không
+        # lần vào sau nhận 304 và trình duyệt hiện lại bản cũ kèm flash đã đọc
+        response.cache_control.no_store = True
+    else:
+        response.set_etag(etag)
+        response.last_modified = datetime.utcfromtimestamp(int(snapshot.built_at))
+        response.cache_control.no_cache = True
+    return response
 
 @app.route('/add_to_cart', methods=['POST'])
 @login_required
@@ -249,26 +445,18 @@ def add_to_cart():
     form_item_id = request.form.get('item_id')
     quantity = int(request.form.get('quantity', 1))
 
-    # Ensure we query with an int id and always store keys as strings in session
+    # Ensure we query with an int id
     menu_item = MenuItem.query.get(int(form_item_id))
     if not menu_item:
         flash('Món ăn không tồn tại!', 'error')
         return redirect(url_for('menu'))
-    item_id = str(menu_item.id)
 
-    cart = session.get('cart', {})
-    if item_id in cart:
-        cart[item_id]['quantity'] += quantity
-    else:
-        cart[item_id] = {
-            'id': menu_item.id,
-            'name': menu_item.ten_mon,
-            'price': menu_item.gia,
-            'quantity': quantity,
-            'loai': menu_item.loai
-        }
-    
-    session['cart'] = cart
+    cart_store.add(current_cart_id(create=True), {
+        'id': menu_item.id,
+        'name': menu_item.ten_mon,
+        'price': menu_item.gia,
+        'loai': menu_item.loai
+    }, quantity)
     flash(f'Đã thêm {menu_item.ten_mon} vào giỏ hàng!', 'success')
     return redirect(url_for('menu'))
 
@@ -278,9 +466,9 @@ def cart():
     if current_user.role == 'admin':
         return redirect(url_for('admin_dashboard'))
     
-    cart = session.get('cart', {})
-    total = sum(item['price'] * item['quantity'] for item in cart.values())
-    return render_template('cart.html', cart=cart, total=total)
+    cart_id = current_cart_id()
+    cart = cart_store.items(cart_id) if cart_id else {}
+    return render_template('cart.html', cart=cart, total=cart_summary().total)
 
 @app.route('/checkout', methods=['POST'])
 @login_required
@@ -289,30 +477,62 @@ def checkout():
         flash('Admin không thể đặt hàng!', 'error')
         return redirect(url_for('admin_dashboard'))
     
-    cart = session.get('cart', {})
+    cart_id = current_cart_id()
+    cart = cart_store.items(cart_id) if cart_id else {}
     if not cart:
         flash('Giỏ hàng trống!', 'error')
         return redirect(url_for('cart'))
     
-    # Tạo đơn hàng
-    total_amount = sum(item['price'] * item['quantity'] for item in cart.values())
-    order = Order(user_id=current_user.id, total_amount=total_amount, status='pending')
-    db.session.add(order)
-    db.session.commit()
-    
-    # Tạo chi tiết đơn hàng
-    for item_id, item_data in cart.items():
-        # item_id stored as string in session; convert to int for DB foreign key
-        order_detail = OrderDetail(
-            order_id=order.id,
-            menu_item_id=int(item_id),
-            quantity=item_data['quantity'],
-            price=item_data['price']
-        )
-        db.session.add(order_detail)
-    
-    db.session.commit()
-    session['cart'] = {}
+    started = time.perf_counter()
+
+    # Kiểm tra lại giá và trạng thái món bằng một truy vấn IN (...)
+    lines = {int(item_id): item_data for item_id, item_data in cart.items()}
+    menu_items = {item.id: item for item in
+                  MenuItem.query.filter(MenuItem.id.in_(lines.keys())).all()}
+
+    unavailable = [item_data['name'] for item_id, item_data in lines.items()
+                   if item_id not in menu_items or not menu_items[item_id].is_available]
+    if unavailable:
+        flash(f'Món không còn phục vụ: {", ".join(unavailable)}. Vui lòng xóa khỏi giỏ hàng!', 'error')
+        return redirect(url_for('cart'))
+
+    changed = [item_id for item_id, item_data in lines.items()
+               if item_data['price'] != menu_items[item_id].gia]
+    if changed:
+        # Cập nhật giá mới vào giỏ và để sinh viên xác nhận lại
+        for item_id in changed:
+            cart_store.set_price(cart_id, item_id, menu_items[item_id].gia)
+        flash('Giá một số món đã thay đổi, vui lòng kiểm tra lại giỏ hàng!', 'error')
+        return redirect(url_for('cart'))
+
+    total_amount = sum(item_data['price'] * item_data['quantity'] for item_data in lines.values())
+
+    # Đơn hàng, chi tiết và rollup nằm trong cùng một transaction
+    try:
+        order = Order(user_id=current_user.id, total_amount=total_amount, status='pending')
+        db.session.add(order)
+        db.session.flush()
+
+        db.session.execute(insert(OrderDetail), [{
+            'order_id': order.id,
+            'menu_item_id': item_id,
+            'quantity': item_data['quantity'],
+            'price': item_data['price']
+        } for item_id, item_data in lines.items()])
+
+        reports.record_order_placed(order)
+        order_id = order.id
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        app.logger.exception('Checkout failed for user %s', current_user.id)
+        flash('Có lỗi xảy ra khi đặt hàng, vui lòng thử lại!', 'error')
+        return redirect(url_for('cart'))
+
+    dashboard_counters.order_placed(total_amount)
+    cart_store.clear(cart_id)
+    app.logger.info('Checkout order=%s lines=%d took %.1fms',
+                    order_id, len(lines), (time.perf_counter() - started) * 1000)
     
     flash('Đặt hàng thành công! Đơn hàng đang được xử lý.', 'success')
     return redirect(url_for('orders'))
@@ -332,13 +552,16 @@ def profile():
     if current_user.role == 'admin':
         return redirect(url_for('admin_dashboard'))
     
-    student = StudentDetail.query.filter_by(user_id=current_user.id).first()
+    # Thông tin sinh viên có sẵn trong current_user (cache), chỉ truy vấn khi sửa
+    student = current_user.student_detail
     
     if request.method == 'POST':
+        student = StudentDetail.query.filter_by(user_id=current_user.id).first()
         student.ho_ten = request.form['ho_ten']
         student.email = request.form['email']
         student.sdt = request.form['sdt']
         db.session.commit()
+        user_cache.invalidate(current_user.id)
         flash('Cập nhật thông tin thành công!', 'success')
         return redirect(url_for('profile'))
     
@@ -353,27 +576,30 @@ def update_cart_quantity():
     if current_user.role == 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    # Ensure item_id is a string to match session keys
-    item_id = str(request.json.get('item_id'))
+    item_id = request.json.get('item_id')
     action = request.json.get('action')  # 'increase' or 'decrease'
     
-    cart = session.get('cart', {})
+    cart_id = current_cart_id()
+    line = cart_store.line(cart_id, item_id) if cart_id else None
     
-    if item_id in cart:
+    if line:
         if action == 'increase':
-            cart[item_id]['quantity'] += 1
+            quantity = line['quantity'] + 1
         elif action == 'decrease':
-            if cart[item_id]['quantity'] > 1:
-                cart[item_id]['quantity'] -= 1
+            if line['quantity'] > 1:
+                quantity = line['quantity'] - 1
             else:
                 # Nếu số lượng = 1 mà giảm thì xóa luôn
                 return remove_from_cart()
+        else:
+            quantity = line['quantity']
         
-        session['cart'] = cart
+        line, summary = cart_store.set_quantity(cart_id, item_id, quantity)
         return jsonify({
             'success': True, 
-            'new_quantity': cart[item_id]['quantity'],
-            'item_total': cart[item_id]['price'] * cart[item_id]['quantity']
+            'new_quantity': line['quantity'],
+            'item_total': line['price'] * line['quantity'],
+            'total_amount': summary.total
         })
     
     return jsonify({'success': False, 'message': 'Item not found'})
@@ -385,19 +611,17 @@ def remove_from_cart():
     if current_user.role == 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    item_id = str(request.json.get('item_id'))
+    item_id = request.json.get('item_id')
 
-    cart = session.get('cart', {})
+    cart_id = current_cart_id()
+    removed_item, summary = cart_store.remove(cart_id, item_id) if cart_id else (None, None)
     
-    if item_id in cart:
-        removed_item = cart.pop(item_id)
-        session['cart'] = cart
-        
+    if removed_item:
         return jsonify({
             'success': True, 
             'message': f'Đã xóa {removed_item["name"]} khỏi giỏ hàng',
-            'cart_count': len(cart),
-            'total_amount': sum(item['price'] * item['quantity'] for item in cart.values())
+            'cart_count': summary.lines,
+            'total_amount': summary.total
         })
     
     return jsonify({'success': False, 'message': 'Item not found'})
@@ -409,9 +633,136 @@ def clear_cart():
     if current_user.role == 'admin':
         return jsonify({'success': False, 'message': 'Unauthorized'})
     
-    session['cart'] = {}
+    cart_id = current_cart_id()
+    if cart_id:
+        cart_store.clear(cart_id)
     return jsonify({'success': True, 'message': 'Đã xóa toàn bộ giỏ hàng'})
 
+# ========== API GIỎ HÀNG (JSON) ==========
+# Mỗi thao tác chỉ trả về dòng vừa đổi và tổng mới của giỏ, để trang thực đơn
+# cập nhật tại chỗ thay vì redirect và render lại cả trang.
+
+CART_MAX_QUANTITY = 50
+CART_BATCH_LIMIT = 50
+
+
+def cart_totals(summary):
+    return {'count': summary.count, 'lines': summary.lines, 'total': summary.total}
+
+
+def apply_cart_update(cart_id, item_id, quantity, op):
+    """Áp dụng một thao tác ('add' hoặc 'set') lên giỏ; trả về (dòng, tổng) hoặc lỗi (str)."""
+    try:
+        item_id, quantity = int(item_id), int(quantity)
+    except (TypeError, ValueError):
+        return 'Dữ liệu không hợp lệ'
+    if op not in ('add', 'set') or quantity < (1 if op == 'add' else 0):
+        return 'Dữ liệu không hợp lệ'
+
+    line = cart_store.line(cart_id, item_id)
+    new_quantity = quantity + (line['quantity'] if line and op == 'add' else 0)
+    if new_quantity > CART_MAX_QUANTITY:
+        return f'Mỗi món tối đa {CART_MAX_QUANTITY} phần'
+
+    if line is not None:
+        return cart_store.set_quantity(cart_id, item_id, new_quantity)
+    if new_quantity == 0:
+        return None, cart_store.summary(cart_id)
+
+    # Món mới: lấy tên/giá từ snapshot thực đơn, checkout sẽ kiểm tra lại giá
+    entry = menu_cache.entry(item_id)
+    if entry is None:
+        return 'Món ăn không tồn tại!'
+    if not entry.is_available:
+        return f'{entry.ten_mon} đã hết hàng!'
+    return cart_store.add(cart_id, {
+        'id': entry.id,
+        'name': entry.ten_mon,
+        'price': entry.gia,
+        'loai': entry.loai
+    }, new_quantity)
+
+
+def cart_line_json(item_id, line):
+    if line is None:
+        return {'id': int(item_id), 'quantity': 0, 'item_total': 0}
+    return dict(line, item_total=line['price'] * line['quantity'])
+
+
+@app.route('/api/cart')
+@login_required
+def api_cart():
+    """Tổng hiện tại của giỏ (badge)"""
+    if current_user.role == 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+    return jsonify({'success': True, 'cart': cart_totals(cart_summary())})
+
+
+def cart_update_response(op):
+    if current_user.role == 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+
+    data = request.get_json(silent=True) or {}
+    item_id = data.get('item_id')
+    result = apply_cart_update(current_cart_id(create=True), item_id,
+                               data.get('quantity', 1 if op == 'add' else None), op)
+    if isinstance(result, str):
+        return jsonify({'success': False, 'message': result})
+
+    line, summary = result
+    return jsonify({'success': True, 'line': cart_line_json(item_id, line), 'cart': cart_totals(summary)})
+
+
+@app.route('/api/cart/add', methods=['POST'])
+@login_required
+def api_cart_add():
+    """Thêm món: {item_id, quantity (mặc định 1)}"""
+    return cart_update_response('add')
+
+
+@app.route('/api/cart/set', methods=['POST'])
+@login_required
+def api_cart_set():
+    """Đặt số lượng: {item_id, quantity}; quantity = 0 là xóa khỏi giỏ"""
+    return cart_update_response('set')
+
+
+@app.route('/api/cart/batch', methods=['POST'])
+@login_required
+def api_cart_batch():
+    """Nhiều thao tác một lần: {updates: [{item_id, quantity, op: 'add'|'set'}]}"""
+    if current_user.role == 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'})
+
+    updates = (request.get_json(silent=True) or {}).get('updates')
+    if not isinstance(updates, list) or not 0 < len(updates) <= CART_BATCH_LIMIT:
+        return jsonify({'success': False, 'message': f'Cần từ 1 đến {CART_BATCH_LIMIT} thao tác'})
+
+    cart_id = current_cart_id(create=True)
+    lines, errors = {}, []
+    summary = None
+    for update in updates:
+        if not isinstance(update, dict):
+            errors.append({'item_id': None, 'message': 'Dữ liệu không hợp lệ'})
+            continue
+        item_id = update.get('item_id')
+        result = apply_cart_update(cart_id, item_id, update.get('quantity'), update.get('op', 'set'))
+        if isinstance(result, str):
+            errors.append({'item_id': item_id, 'message': result})
+            continue
+        line, summary = result
+        # Cùng một món xuất hiện nhiều lần: chỉ trả về trạng thái cuối
+        lines[str(item_id)] = cart_line_json(item_id, line)
+
+    if summary is None:
+        summary = cart_store.summary(cart_id)
+    return jsonify({
+        'success': not errors,
+        'lines': list(lines.values()),
+        'errors': errors,
+        'cart': cart_totals(summary)
+    })
+
 @app.route('/cancel_order/<int:order_id>', methods=['POST'])
 @login_required
 def cancel_order(order_id):
@@ -432,7 +783,9 @@ def cancel_order(order_id):
         return redirect(url_for('orders'))
     
     order.status = 'cancelled'
+    reports.record_status_change(order, 'pending')
     db.session.commit()
+    dashboard_counters.order_status_changed('pending', 'cancelled')
     
     flash('Đã hủy đơn hàng thành công!', 'success')
     return redirect(url_for('orders'))
@@ -452,6 +805,63 @@ def order_details(order_id):
 
 # ========== ADMIN ROUTES CƠ BẢN ==========
 
+ORDERS_PER_PAGE = 50
+ORDER_STATUSES = ('pending', 'confirmed', 'completed', 'cancelled')
+
+
+def parse_order_filters(args):
+    """Đọc bộ lọc đơn hàng (status, from, to) từ query string.
+
+    Ngày có dạng YYYY-MM-DD; giá trị không hợp lệ bị bỏ qua. `month=YYYY-MM`
+    (khi không có from/to) là cả tháng đó.
+    """
+    def parse_date(value):
+        try:
+            return datetime.strptime(value, '%Y-%m-%d') if value else None
+        except ValueError:
+            return None
+
+    status = args.get('status') or None
+    date_from, date_to = parse_date(args.get('from')), parse_date(args.get('to'))
+    if not (date_from or date_to) and args.get('month'):
+        try:
+            date_from = datetime.strptime(args.get('month'), '%Y-%m')
+            date_to = (date_from + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        except ValueError:
+            pass
+    return {
+        'status': status if status in ORDER_STATUSES else None,
+        'date_from': date_from,
+        'date_to': date_to,
+    }
+
+
+def filter_orders(query, filters):
+    """Áp dụng bộ lọc từ parse_order_filters() lên một query Order."""
+    if filters['status']:
+        query = query.filter(Order.status == filters['status'])
+    if filters['date_from']:
+        query = query.filter(Order.created_at >= filters['date_from'])
+    if filters['date_to']:
+        # 'to' tính cả ngày cuối
+        query = query.filter(Order.created_at < filters['date_to'] + timedelta(days=1))
+    return query
+
+
+def encode_order_cursor(order):
+    return f"{order.created_at.isoformat()}_{order.id}"
+
+
+def decode_order_cursor(value):
+    """Giải mã cursor '<created_at ISO>_<id>'; trả về None nếu không hợp lệ."""
+    if not value:
+        return None
+    try:
+        created_at, order_id = value.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except ValueError:
+        return None
+
 @app.route('/admin')
 @login_required
 def admin_dashboard():
@@ -459,18 +869,16 @@ def admin_dashboard():
         flash('Bạn không có quyền truy cập!', 'error')
         return redirect(url_for('menu'))
     
-    total_orders = Order.query.count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    total_students = User.query.filter_by(role='student').count()
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
+    counters = dashboard_counters.snapshot()
     
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    recent_orders = Order.query.options(joinedload(Order.user).joinedload(User.student_detail))\
+        .order_by(Order.created_at.desc()).limit(5).all()
     
     return render_template('admin_dashboard.html',
-                         total_orders=total_orders,
-                         pending_orders=pending_orders,
-                         total_students=total_students,
-                         total_revenue=total_revenue,
+                         total_orders=counters['total_orders'],
+                         pending_orders=counters['pending_orders'],
+                         total_students=counters['total_students'],
+                         total_revenue=counters['total_revenue'],
                          recent_orders=recent_orders)
 
 @app.route('/admin/orders')
@@ -480,8 +888,62 @@ def admin_orders():
         flash('Bạn không có quyền truy cập!', 'error')
         return redirect(url_for('menu'))
     
-    orders = Order.query.order_by(Order.created_at.desc()).all()
-    return render_template('admin_orders.html', orders=orders)
+    filters = parse_order_filters(request.args)
+    query = filter_orders(Order.query, filters).options(
+        joinedload(Order.user).joinedload(User.student_detail))
+
+    cursor = decode_order_cursor(request.args.get('after'))
+    if cursor:
+        created_at, order_id = cursor
+        query = query.filter(db.or_(
+            Order.created_at < created_at,
+            db.and_(Order.created_at == created_at, Order.id < order_id)))
+
+    # Lấy dư 1 bản ghi để biết còn trang sau hay không
+    orders = query.order_by(Order.created_at.desc(), Order.id.desc())\
+        .limit(ORDERS_PER_PAGE + 1).all()
+    next_cursor = None
+    if len(orders) > ORDERS_PER_PAGE:
+        orders = orders[:ORDERS_PER_PAGE]
+        next_cursor = encode_order_cursor(orders[-1])
+
+    return render_template('admin_orders.html',
+                         orders=orders,
+                         filters=filters,
+                         next_cursor=next_cursor,
+                         order_statuses=ORDER_STATUSES)
+
+@app.route('/admin/export_orders')
+@login_required
+def admin_export_orders():
+    """Xuất đơn hàng (CSV / NDJSON, gzip tùy chọn) theo bộ lọc của trang đơn hàng"""
+    if current_user.role != 'admin':
+        flash('Bạn không có quyền truy cập!', 'error')
+        return redirect(url_for('menu'))
+
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'success': False, 'message': f'Định dạng không hỗ trợ: {fmt}'}), 400
+    filters = parse_order_filters(request.args)
+    use_gzip = request.args.get('gzip') in ('1', 'true')
+
+    parts = ['don_hang']
+    if filters['status']:
+        parts.append(filters['status'])
+    if filters['date_from']:
+        parts.append(filters['date_from'].strftime('%Y%m%d'))
+    if filters['date_to']:
+        parts.append(filters['date_to'].strftime('%Y%m%d'))
+    filename = '_'.join(parts) + ('.csv' if fmt == 'csv' else '.ndjson') + ('.gz' if use_gzip else '')
+    mimetype = 'application/gzip' if use_gzip else \
+        ('text/csv' if fmt == 'csv' else 'application/x-ndjson')
+
+    body = export_orders(filter_orders, filters, fmt=fmt, gzip=use_gzip,
+                         chunk_size=app.config.get('EXPORT_CHUNK_SIZE', 1000))
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}',
+                             'X-Accel-Buffering': 'no'})
+
 
 @app.route('/admin/update_order_status/<int:order_id>')
 @login_required
@@ -490,17 +952,68 @@ def update_order_status(order_id):
         flash('Bạn không có quyền thực hiện thao tác này!', 'error')
         return redirect(url_for('menu'))
     
-    order = Order.query.get_or_404(order_id)
-    
-    if order.status == 'pending':
-        order.status = 'confirmed'
-    elif order.status == 'confirmed':
-        order.status = 'completed'
-    
+    # UPDATE ... WHERE status = trạng thái cũ: hai admin bấm cùng lúc thì chỉ một lần được tính
+    (outcome,), changes = transition_orders([order_id])
+    if outcome['result'] == 'not_found':
+        abort(404)
     db.session.commit()
-    flash('Đã cập nhật trạng thái đơn hàng!', 'success')
+    for (old_status, new_status), count in changes.items():
+        dashboard_counters.order_status_changed(old_status, new_status, count)
+
+    if outcome['result'] == 'updated':
+        flash('Đã cập nhật trạng thái đơn hàng!', 'success')
+    else:
+        flash('Đơn hàng đã được cập nhật bởi người khác hoặc không thể chuyển trạng thái!', 'error')
     return redirect(url_for('admin_orders'))
 
+@app.route('/admin/orders/bulk_status', methods=['POST'])
+@login_required
+def bulk_update_order_status():
+    """Chuyển trạng thái nhiều đơn một lần.
+
+    JSON: {order_ids: [...]} hoặc {filter: {status, older_than_minutes}}, và
+    `to` ('confirmed' | 'completed'; bỏ trống thì mỗi đơn tiến một bước).
+    """
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+    data = request.get_json(silent=True) or {}
+    to = data.get('to') or None
+    if to is not None and to not in ORDER_TRANSITIONS.values():
+        return jsonify({'success': False, 'message': f'Trạng thái đích không hợp lệ: {to}'}), 400
+
+    has_more = False
+    if 'order_ids' in data:
+        order_ids = data['order_ids']
+        if not isinstance(order_ids, list) or not 0 < len(order_ids) <= MAX_BULK_ORDERS \
+                or not all(type(order_id) is int for order_id in order_ids):
+            return jsonify({'success': False,
+                            'message': f'order_ids phải là danh sách 1 đến {MAX_BULK_ORDERS} mã đơn'}), 400
+    elif isinstance(data.get('filter'), dict):
+        status = data['filter'].get('status')
+        older_than = data['filter'].get('older_than_minutes')
+        if status not in ORDER_TRANSITIONS:
+            return jsonify({'success': False, 'message': 'filter.status phải là pending hoặc confirmed'}), 400
+        if older_than is not None and (type(older_than) is not int or older_than < 0):
+            return jsonify({'success': False, 'message': 'older_than_minutes không hợp lệ'}), 400
+        order_ids, has_more = matching_order_ids(status, older_than)
+    else:
+        return jsonify({'success': False, 'message': 'Cần order_ids hoặc filter'}), 400
+
+    outcomes, changes = transition_orders(order_ids, to) if order_ids else ([], {})
+    db.session.commit()
+    for (old_status, new_status), count in changes.items():
+        dashboard_counters.order_status_changed(old_status, new_status, count)
+
+    updated = sum(changes.values())
+    return jsonify({
+        'success': updated == len(outcomes),
+        'updated': updated,
+        'results': outcomes,
+        # Bộ lọc khớp nhiều hơn MAX_BULK_ORDERS đơn: gọi lại để xử lý tiếp
+        'has_more': has_more
+    })
+
 # ========== ADMIN QUẢN LÝ MENU ==========
 
 @app.route('/admin/menu')
@@ -529,7 +1042,11 @@ def add_menu_item():
         
         menu_item = MenuItem(ten_mon=ten_mon, gia=gia, loai=loai)
         db.session.add(menu_item)
+        db.session.flush()
+        search_index.index_menu_item(menu_item)
         db.session.commit()
+        menu_cache.invalidate()
+        prefetch_menu_image(menu_item)
         
         flash('Thêm món ăn thành công!', 'success')
         return redirect(url_for('admin_menu'))
@@ -549,6 +1066,7 @@ def toggle_menu_item(item_id):
     menu_item = MenuItem.query.get_or_404(item_id)
     menu_item.is_available = not menu_item.is_available
     db.session.commit()
+    menu_cache.invalidate()
     
     status = "có sẵn" if menu_item.is_available else "tạm ngừng"
     flash(f'Đã cập nhật trạng thái món {menu_item.ten_mon} thành {status}', 'success')
@@ -568,8 +1086,10 @@ def delete_menu_item(item_id):
     if order_details:
         return jsonify({'success': False, 'message': 'Không thể xóa món ăn đã có trong đơn hàng!'})
     
+    search_index.remove_menu_item(menu_item)
     db.session.delete(menu_item)
     db.session.commit()
+    menu_cache.invalidate()
     
     return jsonify({'success': True, 'message': 'Đã xóa món ăn thành công!'})
 
@@ -590,8 +1110,11 @@ def edit_menu_item():
         menu_item.ten_mon = ten_mon
         menu_item.gia = gia
         menu_item.loai = loai
+        search_index.index_menu_item(menu_item)
         
         db.session.commit()
+        menu_cache.invalidate()
+        prefetch_menu_image(menu_item)
         
         return jsonify({'success': True, 'message': 'Cập nhật món ăn thành công!'})
     
@@ -600,26 +1123,50 @@ def edit_menu_item():
 
 # ========== ADMIN QUẢN LÝ SINH VIÊN ==========
 
+STUDENTS_PER_PAGE = 50
+
+
 @app.route('/admin/students')
 @login_required
 def admin_students():
-    """Quản lý sinh viên cho admin"""
+    """Quản lý sinh viên cho admin: tìm kiếm và phân trang phía server"""
     if current_user.role != 'admin':
         flash('Bạn không có quyền truy cập!', 'error')
         return redirect(url_for('menu'))
-    
-    students = StudentDetail.query.all()
-    
+
+    search = request.args.get('q', '').strip()
+    query = StudentDetail.query.options(joinedload(StudentDetail.user))
+    matching = search_index.matching('student', search)
+    if matching is not None:
+        query = query.filter(StudentDetail.id.in_(matching))
+
+    # Phân trang theo mã SV (unique) thay vì OFFSET
+    after = request.args.get('after')
+    if after:
+        query = query.filter(StudentDetail.ma_sv > after)
+
+    # Lấy dư 1 bản ghi để biết còn trang sau hay không
+    students = query.order_by(StudentDetail.ma_sv).limit(STUDENTS_PER_PAGE + 1).all()
+    next_cursor = None
+    if len(students) > STUDENTS_PER_PAGE:
+        students = students[:STUDENTS_PER_PAGE]
+        next_cursor = students[-1].ma_sv
+
+    # Số đơn / tổng chi / đơn gần nhất của sinh viên trong trang, một truy vấn
+    order_stats = reports.student_order_stats([student.user_id for student in students])
+
     # Thống kê
-    total_orders = Order.query.count()
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-    ngành_học_count = db.session.query(StudentDetail.nganh_hoc).distinct().count()
-    
+    counters = dashboard_counters.snapshot()
+
     return render_template('admin_students.html',
                          students=students,
-                         total_orders=total_orders,
-                         total_revenue=total_revenue,
-                         ngành_học_count=ngành_học_count)
+                         order_stats=order_stats,
+                         search=search,
+                         next_cursor=next_cursor,
+                         total_students=counters['total_students'],
+                         total_orders=counters['total_orders'],
+                         total_revenue=counters['total_revenue'],
+                         ngành_học_count=counters['major_count'])
 
 
 @app.route('/admin/student/<int:user_id>')
@@ -695,8 +1242,11 @@ def admin_edit_student():
             student.nganh_hoc = nganh_hoc or student.nganh_hoc
             student.email = email or student.email
             student.sdt = sdt or student.sdt
+            search_index.index_student(student)
 
         db.session.commit()
+        dashboard_counters.invalidate('major_count')
+        user_cache.invalidate(user_id)
         return jsonify({'success': True, 'message': 'Cập nhật sinh viên thành công!'})
 
     except Exception as e:
@@ -710,7 +1260,11 @@ def admin_order_detail(order_id):
         flash('Bạn không có quyền truy cập!', 'error')
         return redirect(url_for('menu'))
 
-    order = Order.query.get_or_404(order_id)
+    # Nạp sẵn sinh viên và các món để số câu SQL không phụ thuộc số dòng trong đơn
+    order = Order.query.options(
+        joinedload(Order.user).joinedload(User.student_detail),
+        selectinload(Order.order_details).joinedload(OrderDetail.menu_item))\
+        .filter(Order.id == order_id).first_or_404()
     return render_template('admin_order_detail.html', order=order)
 
 @app.route('/admin/add_student', methods=['POST'])
@@ -756,7 +1310,10 @@ def add_student():
             sdt=sdt
         )
         db.session.add(student)
+        db.session.flush()
+        search_index.index_student(student)
         db.session.commit()
+        dashboard_counters.student_added()
         
         flash('Thêm sinh viên thành công!', 'success')
         return redirect(url_for('admin_students'))
@@ -765,6 +1322,69 @@ def add_student():
         flash('Có lỗi xảy ra khi thêm sinh viên!', 'error')
         return redirect(url_for('admin_students'))
 
+# Băm mật khẩu khi nhập CSV qua web: thread pool dùng chung (hashlib nhả GIL khi
+# băm), không fork worker Flask giữa request. CLI import-students dùng process pool riêng.
+import_hash_executor = ThreadPoolExecutor(
+    max_workers=app.config.get('IMPORT_HASH_WORKERS') or os.cpu_count() or 1,
+    thread_name_prefix='import-hash')
+
+
+def student_importer(executor=import_hash_executor):
+    return StudentImporter(password_policy, search_index=search_index, counters=dashboard_counters,
+                           chunk_size=app.config.get('IMPORT_CHUNK_SIZE', 500), executor=executor)
+
+
+@app.route('/admin/import_students', methods=['POST'])
+@login_required
+def import_students():
+    """Nhập sinh viên từ CSV; trả về tiến độ từng lô dạng NDJSON"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'success': False, 'message': 'Chưa chọn file CSV!'}), 400
+    # File upload bị đóng khi request kết thúc, trước khi luồng trả về chạy xong:
+    # chép ra file tạm (trên đĩa) để generator tự giữ
+    spool = tempfile.TemporaryFile()
+    shutil.copyfileobj(upload.stream, spool)
+    spool.seek(0)
+    text_stream = io.TextIOWrapper(spool, encoding='utf-8-sig', newline='')
+    try:
+        progress = student_importer().run(text_stream)
+        # Đọc lô đầu ngay để lỗi thiếu cột trả về 400 thay vì giữa luồng
+        first = next(progress)
+    except (ValueError, UnicodeDecodeError) as e:
+        text_stream.close()
+        return jsonify({'success': False, 'message': f'File không hợp lệ: {e}'}), 400
+
+    def generate():
+        sent_errors = 0
+        try:
+            for report in itertools.chain([first], progress):
+                line = report.to_dict(errors_from=sent_errors)
+                sent_errors = len(report.errors)
+                yield json.dumps(line, ensure_ascii=False) + '\n'
+        finally:
+            progress.close()
+            text_stream.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'X-Accel-Buffering': 'no'})
+
+
+@app.route('/admin/export_students.csv')
+@login_required
+def export_students():
+    """Xuất toàn bộ sinh viên ra CSV, ghi dần theo luồng"""
+    if current_user.role != 'admin':
+        flash('Bạn không có quyền truy cập!', 'error')
+        return redirect(url_for('menu'))
+    filename = f"sinh_vien_{datetime.now().strftime('%Y%m%d')}.csv"
+    return Response(stream_with_context(export_students_csv()), mimetype='text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 @app.route('/admin/delete_student/<int:user_id>', methods=['POST'])
 @login_required
 def delete_student(user_id):
@@ -782,11 +1402,14 @@ def delete_student(user_id):
         # Xóa student detail trước
         student_detail = StudentDetail.query.filter_by(user_id=user_id).first()
         if student_detail:
+            search_index.remove_student(student_detail)
             db.session.delete(student_detail)
         
         # Xóa user
         db.session.delete(user)
         db.session.commit()
+        dashboard_counters.student_deleted()
+        user_cache.invalidate(user_id)
         
         return jsonify({'success': True, 'message': 'Đã xóa sinh viên thành công!'})
     
@@ -803,67 +1426,24 @@ def admin_reports():
         flash('Bạn không có quyền truy cập!', 'error')
         return redirect(url_for('menu'))
     
-    # Thống kê tổng quan
-    total_orders = Order.query.count()
-    total_revenue = db.session.query(db.func.sum(Order.total_amount)).scalar() or 0
-    total_students = User.query.filter_by(role='student').count()
-    total_menu_items = MenuItem.query.count()
-    
-    # Tính giá trị đơn hàng trung bình
-    avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
-    
-    # Tỷ lệ hoàn thành đơn hàng
-    completed_orders = Order.query.filter_by(status='completed').count()
-    completion_rate = round((completed_orders / total_orders * 100), 1) if total_orders > 0 else 0
-    
-    stats = {
-        'total_orders': total_orders,
-        'total_revenue': total_revenue,
-        'total_students': total_students,
-        'total_menu_items': total_menu_items,
-        'avg_order_value': round(avg_order_value),
-        'completion_rate': completion_rate
-    }
-    
-    # Thống kê trạng thái đơn hàng
-    order_stats = {
-        'pending': Order.query.filter_by(status='pending').count(),
-        'confirmed': Order.query.filter_by(status='confirmed').count(),
-        'completed': Order.query.filter_by(status='completed').count()
-    }
-    
-    # Top món ăn bán chạy
-    top_items = MenuItem.query.all()
-    for item in top_items:
-        item.total_sold = sum(detail.quantity for detail in item.order_details)
-    
-    top_items = sorted(top_items, key=lambda x: x.total_sold, reverse=True)[:5]
-    
-    # Thống kê doanh thu 7 ngày gần nhất (dummy data)
-    revenue_data = [1500000, 1800000, 2200000, 1900000, 2100000, 2400000, 2300000]
-    revenue_labels = ['T2', 'T3', 'T4', 'T5', 'T6', 'T7', 'CN']
-    
-    # Thống kê theo ngành học
-    major_stats = []
-    majors = db.session.query(StudentDetail.nganh_hoc).distinct().all()
-    for major in majors:
-        if major[0]:  # Kiểm tra nếu không phải None
-            student_count = StudentDetail.query.filter_by(nganh_hoc=major[0]).count()
-            total_spent = db.session.query(db.func.sum(Order.total_amount))\
-                .join(User)\
-                .join(StudentDetail)\
-                .filter(StudentDetail.nganh_hoc == major[0])\
-                .scalar() or 0
-            major_stats.append({
-                'nganh_hoc': major[0],
-                'student_count': student_count,
-                'total_spent': total_spent
-            })
-    
-    # Thống kê giờ đặt hàng (dummy data)
-    hour_stats = {f"{i:02d}": i * 2 + 5 for i in range(7, 22)}
-    max_hour_orders = max(hour_stats.values()) if hour_stats else 1
-    
+    # Thống kê tổng quan + trạng thái đơn hàng (một câu GROUP BY status)
+    stats, order_stats = reports.overview_stats()
+    total_students = stats['total_students']
+
+    # Top món ăn bán chạy (GROUP BY menu_item_id)
+    top_items = reports.top_selling_items(limit=5)
+
+    # Doanh thu theo ngày và đơn theo giờ, đọc từ bảng rollup
+    days = request.args.get('days', 7, type=int)
+    if days not in reports.REPORT_RANGES:
+        days = 7
+    revenue_labels, revenue_data = reports.revenue_by_day(days)
+    hour_stats = reports.orders_by_hour(days)
+    max_hour_orders = max(hour_stats.values()) or 1
+
+    # Thống kê theo ngành học (GROUP BY nganh_hoc)
+    major_stats = reports.major_stats()
+
     return render_template('admin_reports.html',
                          stats=stats,
                          order_stats=order_stats,
@@ -873,7 +1453,181 @@ def admin_reports():
                          major_stats=major_stats,
                          hour_stats=hour_stats,
                          max_hour_orders=max_hour_orders,
-                         total_students=total_students)
+                         total_students=total_students,
+                         days=days,
+                         report_ranges=reports.REPORT_RANGES)
+
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Tính lại bảng rollup báo cáo từ toàn bộ đơn hàng."""
+    buckets = reports.rebuild_order_rollups()
+    print(f"Đã tính lại {buckets} ô rollup.")
+
+
+@app.cli.command('purge-carts')
+def purge_carts_command():
+    """Xóa giỏ hàng không thay đổi quá CART_MAX_AGE giây."""
+    removed = cart_store.purge(CART_MAX_AGE)
+    print(f"Đã xóa {removed} giỏ hàng cũ.")
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Dựng lại chỉ mục tìm kiếm sinh viên và món ăn."""
+    counts = search_index.rebuild()
+    print(f"Đã đánh chỉ mục {counts['student']} sinh viên, {counts['menu']} món ăn "
+          f"({search_index.backend.name}).")
+
+
+@app.cli.command('import-students')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_students_command(path):
+    """Nhập sinh viên từ file CSV (username, password, ma_sv, ho_ten, nganh_hoc, email, sdt)."""
+    search_index.ensure()
+    started = time.time()
+    with open(path, encoding='utf-8-sig', newline='') as f, \
+            ProcessPoolExecutor(app.config.get('IMPORT_HASH_WORKERS')) as executor:
+        try:
+            for report in student_importer(executor).run(f):
+                print(f"{report.rows} dòng: {report.created} đã tạo, {report.error_count} lỗi "
+                      f"({time.time() - started:.1f}s)")
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    for line, message in report.errors:
+        print(f"Dòng {line}: {message}")
+    if report.error_count > len(report.errors):
+        print(f"... và {report.error_count - len(report.errors)} lỗi khác")
+
+
+@app.cli.command('export-students')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+def export_students_command(path):
+    """Xuất toàn bộ sinh viên ra file CSV."""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for chunk in export_students_csv():
+            f.write(chunk)
+    print(f"Đã xuất sinh viên ra {path}.")
+
+
+@app.cli.command('export-orders')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='csv')
+@click.option('--month', help='YYYY-MM')
+@click.option('--from', 'date_from', help='YYYY-MM-DD')
+@click.option('--to', 'date_to', help='YYYY-MM-DD')
+@click.option('--status', type=click.Choice(ORDER_STATUSES))
+@click.option('--gzip', 'use_gzip', is_flag=True)
+def export_orders_command(path, fmt, month, date_from, date_to, status, use_gzip):
+    """Xuất đơn hàng + chi tiết món + sinh viên cho kế toán."""
+    filters = parse_order_filters({'month': month, 'from': date_from, 'to': date_to, 'status': status})
+    chunks = export_orders(filter_orders, filters, fmt=fmt, gzip=use_gzip,
+                           chunk_size=app.config.get('EXPORT_CHUNK_SIZE', 1000))
+    if use_gzip:
+        with open(path, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    else:
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            for chunk in chunks:
+                f.write(chunk)
+    print(f"Đã xuất đơn hàng ra {path}.")
+
+
+@app.cli.command('db-upgrade')
+def db_upgrade_command():
+    """Tạo bảng còn thiếu và chạy các migration chưa áp dụng."""
+    db.create_all()
+    applied = migrations.upgrade(db)
+    print(f"Đã áp dụng migration: {applied}" if applied else "Schema đã mới nhất.")
+
+
+# Các trang GET được kiểm tra kế hoạch truy vấn (role, url)
+QUERY_PLAN_PAGES = [
+    ('student', '/menu'), ('student', '/menu?q=pho bo'), ('student', '/cart'), ('student', '/orders'), ('student', '/profile'),
+    ('admin', '/admin'), ('admin', '/admin/orders'),
+    ('admin', '/admin/orders?status=pending&from=2020-01-01&to=2099-12-31'),
+    ('admin', '/admin/export_orders?format=ndjson&month=2026-01'),
+    ('admin', '/admin/menu'), ('admin', '/admin/students'), ('admin', '/admin/students?after=B20DCCN001'),
+    ('admin', '/admin/students?q=nguyen van'),
+    ('admin', '/admin/reports'),
+    # {order_id} / {student_id}: đơn mới nhất và sinh viên đầu tiên trong DB
+    ('admin', '/admin/order/{order_id}'), ('admin', '/admin/student/{student_id}'),
+]
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Gọi các trang chính, báo lỗi nếu có truy vấn quét toàn bảng (SQLite) hoặc vượt QUERY_BUDGETS."""
+    engine = db.engine
+    tables = set(db.metadata.tables)
+    user_ids = {role: user.id for role in ('admin', 'student')
+                for user in [User.query.filter_by(role=role).first()] if user}
+    if engine.dialect.name != 'sqlite':
+        print('Chỉ hỗ trợ SQLite (EXPLAIN QUERY PLAN).')
+        return
+
+    # Dựng chỉ mục tìm kiếm trước (quét toàn bảng một lần, không tính vào trang nào)
+    search_index.ensure()
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append((statement, parameters))
+
+    sample_ids = {'order_id': db.session.query(db.func.max(Order.id)).scalar(),
+                  'student_id': user_ids.get('student')}
+    failures = []
+    budget_failures = []
+    skipped = []
+    # Vượt QUERY_BUDGETS thì request ném lỗi ngay để được tính là thất bại
+    saved = app.testing, app.config.get('QUERY_BUDGET_STRICT')
+    app.testing, app.config['QUERY_BUDGET_STRICT'] = True, True
+    event.listen(engine, 'before_cursor_execute', capture)
+    try:
+        for role, url in QUERY_PLAN_PAGES:
+            if role not in user_ids:
+                continue
+            missing = [name for name, value in sample_ids.items() if value is None and f'{{{name}}}' in url]
+            if missing:
+                skipped.append(url)
+                continue
+            url = url.format(**sample_ids)
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['_user_id'] = str(user_ids[role])
+            statements.clear()
+            # App context mới cho mỗi request để Flask-Login không giữ user cũ trong g
+            with app.app_context():
+                try:
+                    # Đọc hết body và đóng response: truy vấn của response dạng luồng
+                    # cũng được kiểm tra, ngân sách của chúng được tính lúc đóng
+                    response = client.get(url)
+                    response.get_data()
+                    response.close()
+                except QueryBudgetExceeded as e:
+                    budget_failures.append((url, str(e)))
+            raw = engine.raw_connection()
+            try:
+                for statement, parameters in statements:
+                    scanned = full_table_scans(raw.driver_connection, statement, parameters, tables)
+                    if scanned:
+                        failures.append((url, scanned, ' '.join(statement.split())))
+            finally:
+                raw.close()
+    finally:
+        event.remove(engine, 'before_cursor_execute', capture)
+        app.testing, app.config['QUERY_BUDGET_STRICT'] = saved
+
+    for url, scanned, statement in failures:
+        print(f"FULL SCAN {', '.join(scanned)} tại {url}: {statement[:200]}")
+    for url, message in budget_failures:
+        print(f"QUERY BUDGET tại {url}: {message}")
+    for url in skipped:
+        print(f"Bỏ qua {url}: DB chưa có dữ liệu mẫu cho trang này")
+    if failures or budget_failures:
+        raise SystemExit(1)
+    print(f"OK: {len(QUERY_PLAN_PAGES) - len(skipped)} trang không có truy vấn quét toàn bảng, không vượt ngân sách SQL.")
 
 
 # ----- Server-side image proxy for specific menu photos -----
@@ -887,58 +1641,126 @@ CUSTOM_IMAGES = {
 }
 
 
+# Ảnh được tải nền và lưu trong static/images; request không bao giờ chờ CDN.
+# Khi có ảnh mới thì dựng lại snapshot thực đơn để URL/srcset dùng hash mới.
+remote_images = RemoteImageCache(CUSTOM_IMAGES, os.path.join(app.root_path, 'static', 'images'),
+                                 on_update=lambda key: menu_cache.invalidate())
+PLACEHOLDER_IMAGE = os.path.join(app.root_path, 'static', 'images', 'food1.svg')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
 @app.route('/remote_image/<name>')
 def remote_image(name):
-    """Fetch a predefined remote image server-side and return it so the browser sees it as a local URL.
+    """Serve a predefined remote image from the local cache so the browser sees it as a local URL.
 
     This avoids hotlink/CORS problems from some image hosts. Only predefined keys are allowed.
+    On a cache miss the download is scheduled in the background and the placeholder is
+    returned immediately (marked no-store so the browser asks again later).
+
+    `w` picks the smallest resized variant at least that wide, WebP is served to browsers
+    that accept it, and URLs carrying the content hash as `v` are cached as immutable.
     """
-    # Only allow predefined names
-    if name not in CUSTOM_IMAGES:
-        return send_file(os.path.join(app.root_path, 'static', 'images', 'food1.svg'))
-
-    # Ensure static images directory exists
-    images_dir = os.path.join(app.root_path, 'static', 'images')
-    os.makedirs(images_dir, exist_ok=True)
-
-    # Cached filename pattern: remote_<name>.<ext>
-    # Check for existing cached files with common extensions
-    for ext in ('.jpg', '.jpeg', '.png', '.webp', '.svg'):
-        cached_path = os.path.join(images_dir, f'remote_{name}{ext}')
-        if os.path.exists(cached_path):
-            return send_file(cached_path)
-
-    # If no cached file, fetch remote image and cache it
-    url = CUSTOM_IMAGES[name]
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-
-        content_type = resp.headers.get('Content-Type', '')
-        # Determine extension from content-type
-        if 'svg' in content_type:
-            ext = '.svg'
-        elif 'png' in content_type:
-            ext = '.png'
-        elif 'webp' in content_type:
-            ext = '.webp'
-        else:
-            # default to jpg for other image types
-            ext = '.jpg'
+    cached_path = remote_images.best_match(name,
+                                          width=request.args.get('w', type=int),
+                                          accept_webp='image/webp' in request.headers.get('Accept', ''))
+    if cached_path:
+        # URL có hash nội dung (v) thì nội dung không bao giờ đổi
+        versioned = bool(request.args.get('v')) and request.args.get('v') == remote_images.digest(name)
+        response = send_file(cached_path, conditional=True,
+                             max_age=IMMUTABLE_MAX_AGE if versioned else None)
+        response.vary.add('Accept')
+        if versioned:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
+
+    remote_images.prefetch(name)
+    response = send_file(PLACEHOLDER_IMAGE)
+    response.cache_control.no_store = True
+    return response
 
-        cached_path = os.path.join(images_dir, f'remote_{name}{ext}')
+# ====================== ROUTE CHATBOT GỢI Ý MÓN ĂN ======================
+CHAT_MESSAGE_MAX_LENGTH = 500
+CHAT_BUSY_REPLY = "Chatbot đang bận, vui lòng thử lại sau ít giây."
+CHAT_TIMEOUT_REPLY = "Chatbot phản hồi quá lâu, vui lòng thử lại."
+CHAT_UNAVAILABLE_REPLY = "Chatbot tạm thời không khả dụng. Vui lòng kiểm tra cấu hình API key."
 
-        # Write bytes to file
-        with open(cached_path, 'wb') as f:
-            f.write(resp.content)
 
-        return send_file(cached_path, mimetype=content_type or 'image/jpeg')
+# Gợi ý theo ngân sách/bữa ăn/độ phổ biến trả lời tại chỗ, không cần gọi model
+recommenders = RecommenderCache(reports.item_popularity, ttl=app.config.get('RECOMMENDER_TTL', 600))
+
+# Phần menu trong prompt, dựng lại khi version thực đơn đổi: (version, text)
+_chat_menu_info = (None, '')
+
+
+def chat_menu_info(snapshot):
+    global _chat_menu_info
+    version, menu_info = _chat_menu_info
+    if version != snapshot.version:
+        menu_info = "".join(f"- {item.ten_mon}: {item.gia:,}đ ({item.loai})\n"
+                            for item in snapshot.items if item.is_available)
+        _chat_menu_info = (snapshot.version, menu_info)
+    return menu_info
+
+
+def build_chat_prompt(user_message, snapshot):
+    """Prompt gửi cho model, lấy menu từ snapshot (không truy vấn DB, không trong worker)."""
+    menu_info = chat_menu_info(snapshot)
+
+    return f"""
+    Bạn là chatbot hỗ trợ căng tin trường học. Dưới đây là menu hiện có:
+
+    {menu_info}
+
+    Hãy sử dụng thông tin menu trên để:
+    - Gợi ý món ăn phù hợp với yêu cầu
+    - Tư vấn về giá cả
+    - Phân loại món theo bữa ăn (sáng, trưa, tối)
+    - Hỗ trợ chọn món theo ngân sách
+
+    Câu hỏi của người dùng: {user_message}
+
+    Lưu ý: 
+    - Chỉ gợi ý các món có trong menu trên
+    - Đề cập đến giá cả cụ thể
+    - Trả lời thân thiện, hữu ích
+    - Nếu không có thông tin, hãy nói rõ
+    """
+
+
+@app.route('/admin/chat_stats')
+@login_required
+def admin_chat_stats():
+    """Tỉ lệ trúng cache câu trả lời chatbot"""
+    if current_user.role != 'admin':
+        return jsonify({'success': False, 'message': 'Unauthorized'}), 403
+    return jsonify({'success': True, 'replies': chat_replies.stats()})
+
+
+def chat_gauges():
+    stats = chat_replies.stats()
+    return [('canteen_chat_cache_entries', 'Số câu trả lời chatbot đang cache', stats['entries']),
+            ('canteen_chat_cache_hits', 'Số lần trúng cache chatbot', stats['hits']),
+            ('canteen_chat_cache_misses', 'Số lần trượt cache chatbot', stats['misses'])]
+
+
+instrumentation.add_gauges(chat_gauges)
+
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Số liệu theo endpoint dạng Prometheus (admin, hoặc Bearer METRICS_TOKEN cho máy thu thập)"""
+    token = os.getenv('METRICS_TOKEN', app.config.get('METRICS_TOKEN'))
+    authorized = token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not (current_user.is_authenticated and current_user.role == 'admin'):
+        return Response('Unauthorized\n', status=403, mimetype='text/plain')
+    return Response(instrumentation.prometheus(), mimetype='text/plain; version=0.0.4')
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-    except Exception:
-        # On any failure, fall back to local placeholder image
-        return send_file(os.path.join(app.root_path, 'static', 'images', 'food1.svg'))
 
-# ====================== ROUTE CHATBOT GỢI Ý MÓN ĂN ======================
 @app.route("/chat", methods=["GET", "POST"])
 @login_required
 def chat():
@@ -946,53 +1768,94 @@ def chat():
     bot_reply = ""
     
     if request.method == "POST":
-        user_message = request.form.get("message", "")
+        # Trình duyệt không chạy JavaScript: chờ kết quả trong request (vẫn có giới hạn)
+        user_message = request.form.get("message", "")[:CHAT_MESSAGE_MAX_LENGTH]
         
+        snapshot = menu_cache.get()
+        local_reply = recommenders.get(snapshot).answer(user_message) if user_message.strip() else None
         if not user_message.strip():
             bot_reply = "Xin hãy nhập nội dung nào đó 👀"
+        elif local_reply is not None:
+            bot_reply = local_reply
+        elif not chat_service.available:
+            bot_reply = CHAT_UNAVAILABLE_REPLY
         else:
+            bot_reply = chat_replies.get(snapshot.version, user_message)
             try:
-                if model is None:
-                    bot_reply = "Chatbot tạm thời không khả dụng. Vui lòng kiểm tra cấu hình API key."
-                else:
-                    # Lấy menu hiện tại từ database - ĐÃ THÊM TÍNH NĂNG NÀY
-                    menu_items = MenuItem.query.filter_by(is_available=True).all()
-                    menu_info = ""
-                    for item in menu_items:
-                        menu_info += f"- {item.ten_mon}: {item.gia:,}đ ({item.loai})\n"
-                    
-                    # Gửi prompt cho Gemini AI với thông tin menu thực tế - ĐÃ SỬA
-                    prompt = f"""
-                    Bạn là chatbot hỗ trợ căng tin trường học. Dưới đây là menu hiện có:
-
-                    {menu_info}
-
-                    Hãy sử dụng thông tin menu trên để:
-                    - Gợi ý món ăn phù hợp với yêu cầu
-                    - Tư vấn về giá cả
-                    - Phân loại món theo bữa ăn (sáng, trưa, tối)
-                    - Hỗ trợ chọn món theo ngân sách
-
-                    Câu hỏi của người dùng: {user_message}
-
-                    Lưu ý: 
-                    - Chỉ gợi ý các món có trong menu trên
-                    - Đề cập đến giá cả cụ thể
-                    - Trả lời thân thiện, hữu ích
-                    - Nếu không có thông tin, hãy nói rõ
-                    """
-                    response = model.generate_content(prompt)
-                    bot_reply = response.text
+                if bot_reply is None:
+                    bot_reply = chat_service.submit(build_chat_prompt(user_message, snapshot)).result()
+                    chat_replies.put(snapshot.version, user_message, bot_reply)
+            except ChatBusy:
+                bot_reply = CHAT_BUSY_REPLY
+            except ChatTimeout:
+                bot_reply = CHAT_TIMEOUT_REPLY
             except Exception as e:
                 bot_reply = f"Xin lỗi, tôi gặp sự cố kỹ thuật. Vui lòng thử lại sau. Lỗi: {str(e)}"
 
-        return render_template("chat.html", bot_reply=bot_reply, user_message=user_message)
-
     return render_template("chat.html", user_message=user_message, bot_reply=bot_reply)
+
+
+@app.route("/chat/stream")
+@login_required
+def chat_stream():
+    """Trả lời dạng server-sent events: các event token, rồi done hoặc error."""
+    user_message = request.args.get("message", "")[:CHAT_MESSAGE_MAX_LENGTH]
+
+    def single(event, text):
+        return Response(sse_event(event, {'text': text}), mimetype='text/event-stream')
+
+    if not user_message.strip():
+        return single('error', "Xin hãy nhập nội dung nào đó 👀")
+
+    snapshot = menu_cache.get()
+    local_reply = recommenders.get(snapshot).answer(user_message)
+    if local_reply is not None:
+        return Response(sse_event('token', {'text': local_reply}) + sse_event('done', {'local': True}),
+                        mimetype='text/event-stream')
+    if not chat_service.available:
+        return single('error', CHAT_UNAVAILABLE_REPLY)
+
+    cached = chat_replies.get(snapshot.version, user_message)
+    if cached is not None:
+        return Response(sse_event('token', {'text': cached}) + sse_event('done', {'cached': True}),
+                        mimetype='text/event-stream')
+    try:
+        job = chat_service.submit(build_chat_prompt(user_message, snapshot))
+    except ChatBusy:
+        return single('error', CHAT_BUSY_REPLY)
+
+    def generate():
+        parts = []
+        try:
+            for text in job.stream():
+                parts.append(text)
+                yield sse_event('token', {'text': text})
+            # Chỉ lưu câu trả lời đã nhận đủ
+            chat_replies.put(snapshot.version, user_message, ''.join(parts))
+            yield sse_event('done', {})
+        except ChatTimeout:
+            yield sse_event('error', {'text': CHAT_TIMEOUT_REPLY})
+        except Exception as e:
+            yield sse_event('error', {'text': f"Xin lỗi, tôi gặp sự cố kỹ thuật. Lỗi: {str(e)}"})
+        finally:
+            # Trình duyệt đóng kết nối giữa chừng: báo worker dừng, trả chỗ chờ
+            job.close()
+
+    response = Response(generate(), mimetype='text/event-stream')
+    # Trả chỗ chờ kể cả khi trình duyệt ngắt trước khi generate() kịp chạy
+    response.call_on_close(job.close)
+    response.headers['Cache-Control'] = 'no-cache'
+    # Không để proxy (nginx) gom cả response rồi mới gửi
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 # =======================================================================
 
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        migrations.upgrade(db)
         create_sample_data()
+        # Dữ liệu cũ chưa có rollup thì tính lại một lần
+        if OrderRollup.query.first() is None and Order.query.first() is not None:
+            reports.rebuild_order_rollups()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,67 @@
+"""Thông lượng đăng nhập trên một core với các cấu hình băm mật khẩu.
+
+Chạy:  python benchmarks/bench_login.py [--seconds 2] [--peak 600 --window 120]
+
+Với mỗi cấu hình in số lần xác thực/giây trên một core khi chưa có cache
+(đăng nhập lần đầu) và khi đã cache, rồi số core cần để `--peak` sinh viên
+đăng nhập trong `--window` giây (vd. 600 sinh viên trong 2 phút lúc 11:30).
+Dòng cuối đo chi phí của LoginRateLimiter cho mỗi lượt.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from security import DEFAULT_HASH_METHOD, LoginRateLimiter, PasswordPolicy  # noqa: E402
+
+METHODS = [
+    DEFAULT_HASH_METHOD,      # scrypt, mặc định của werkzeug
+    'pbkdf2:sha256',          # mặc định pbkdf2 của werkzeug
+    'pbkdf2:sha256:600000',
+]
+
+
+def rate(fn, seconds):
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        fn(count)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def bench_method(method, seconds):
+    policy = PasswordPolicy(method, cache_size=0)
+    password_hash = policy.hash('sv001')
+    cold = rate(lambda i: policy.verify(password_hash, 'sv001'), seconds)
+
+    cached = PasswordPolicy(method)
+    cached_hash = cached.hash('sv001')
+    cached.verify(cached_hash, 'sv001')
+    warm = rate(lambda i: cached.verify(cached_hash, 'sv001'), seconds)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=2)
+    parser.add_argument('--peak', type=int, default=600, help='số sinh viên đăng nhập lúc cao điểm')
+    parser.add_argument('--window', type=float, default=120, help='trong bao nhiêu giây')
+    args = parser.parse_args()
+
+    needed = args.peak / args.window
+    print(f'Cao điểm: {args.peak} lượt / {args.window:.0f}s = {needed:.1f} lượt/s')
+    print(f'{"cấu hình":<24}{"lượt/s/core":>14}{"ms/lượt":>10}{"đã cache/s":>14}{"core cần":>10}')
+    for method in METHODS:
+        cold, warm = bench_method(method, args.seconds)
+        print(f'{method:<24}{cold:>14.1f}{1000 / cold:>10.1f}{warm:>14.0f}{needed / cold:>10.2f}')
+
+    limiter = LoginRateLimiter()
+    per_second = rate(lambda i: limiter.allow(f'sv{i % 5000:04d}', f'10.0.{i % 250}.1'), args.seconds)
+    print(f'LoginRateLimiter.allow: {per_second:,.0f} lượt/s ({1e6 / per_second:.1f} µs/lượt)')
+
+
+if __name__ == '__main__':
+    main()
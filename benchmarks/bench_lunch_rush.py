@@ -0,0 +1,297 @@
+"""Mô phỏng giờ cao điểm buổi trưa trên các route thật của ứng dụng.
+
+Chạy:  python benchmarks/bench_lunch_rush.py [--students 300] [--items 40] [--months 3]
+                                              [--users 20] [--admins 2] [--seconds 20]
+
+Tạo một DB SQLite tạm (giống cấu hình chạy thật: WAL + pool), sinh dữ liệu theo
+quy mô tùy chọn (sinh viên, món, số tháng lịch sử đơn hàng) rồi cho `--users`
+sinh viên ảo chạy song song vòng: đăng nhập -> xem thực đơn -> thêm 1-3 món ->
+checkout -> xem đơn hàng, cùng `--admins` admin mở dashboard và báo cáo.
+
+In p50/p95/p99, số request/giây và số câu SQL trung bình cho mỗi route, rồi
+ghi kết quả (kèm commit git) vào benchmarks/results/lunch_rush.jsonl và so
+sánh với lần chạy trước cùng quy mô để thấy hồi quy giữa các commit.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+RESULTS_FILE = os.path.join(ROOT, 'benchmarks', 'results', 'lunch_rush.jsonl')
+
+MAJORS = ['Công nghệ thông tin', 'Kỹ thuật phần mềm', 'An toàn thông tin', 'Kế toán',
+          'Quản trị kinh doanh', 'Marketing', 'Điện tử viễn thông', 'Đa phương tiện']
+CATEGORIES = [('Món chính', 30000, 45000), ('Đồ ăn sáng', 15000, 30000),
+              ('Đồ ăn nhanh', 10000, 25000), ('Đồ uống', 8000, 20000)]
+# Phân bố giờ đặt hàng trong ngày (giờ địa phương): dồn vào sáng sớm và 11-12h
+ORDER_HOURS = [6, 6, 7, 7, 7, 10, 11, 11, 11, 11, 12, 12, 12, 13, 17, 18]
+BENCH_PASSWORD = 'bench'
+
+
+def setup_app(db_path):
+    """Import app với DB tạm; phải gọi trước mọi import khác của app."""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('CHAT_MODEL', 'fake')
+    sys.path.insert(0, ROOT)
+    import app as canteen
+    canteen.app.config['TESTING'] = True
+    return canteen
+
+
+def seed(canteen, students, items, months, orders_per_month, rng):
+    """Dữ liệu mẫu + sinh viên/món/đơn hàng sinh ngẫu nhiên, ghi theo lô."""
+    from sqlalchemy import insert
+    from models import db, User, StudentDetail, MenuItem, Order, OrderDetail
+
+    with canteen.app.app_context():
+        db.create_all()
+        canteen.create_sample_data()
+
+        # Băm một lần, dùng chung cho mọi sinh viên ảo
+        password_hash = canteen.password_policy.hash(BENCH_PASSWORD)
+
+        db.session.execute(insert(User), [
+            {'username': f'bench{i:05d}', 'password_hash': password_hash, 'role': 'student'}
+            for i in range(students)])
+        user_ids = [row.id for row in db.session.query(User.id)
+                    .filter(User.username.like('bench%')).order_by(User.id)]
+        db.session.execute(insert(StudentDetail), [{
+            'user_id': user_id,
+            'ma_sv': f'BENCH{i:05d}',
+            'ho_ten': f'Sinh viên {i}',
+            'nganh_hoc': MAJORS[i % len(MAJORS)],
+            'email': f'bench{i:05d}@student.edu.vn',
+            'sdt': f'09{i:08d}'
+        } for i, user_id in enumerate(user_ids)])
+
+        db.session.execute(insert(MenuItem), [{
+            'ten_mon': f'{category} {i}',
+            'gia': rng.randrange(low, high + 1, 1000),
+            'loai': category,
+            'is_available': rng.random() > 0.1
+        } for i in range(items) for category, low, high in [CATEGORIES[i % len(CATEGORIES)]]])
+        menu = [(row.id, row.gia) for row in db.session.query(MenuItem.id, MenuItem.gia)]
+
+        # Lịch sử đơn hàng: orders_per_month đơn / sinh viên / tháng
+        now = datetime.utcnow()
+        tz_offset = canteen.reports.DEFAULT_TZ_OFFSET_HOURS
+        total_orders = students * months * orders_per_month
+        orders, details = [], []
+        for order_id in range(1, total_orders + 1):
+            day = (now - timedelta(days=rng.randrange(30 * months))).replace(
+                hour=0, minute=0, second=0, microsecond=0)
+            # created_at lưu UTC
+            created_at = day + timedelta(hours=rng.choice(ORDER_HOURS) - tz_offset,
+                                         minutes=rng.randrange(60))
+            lines = rng.sample(menu, k=min(len(menu), rng.choice((1, 1, 2, 2, 3))))
+            quantities = [rng.choice((1, 1, 1, 2)) for _ in lines]
+            orders.append({
+                'id': order_id,
+                'user_id': rng.choice(user_ids),
+                'total_amount': sum(gia * qty for (_, gia), qty in zip(lines, quantities)),
+                'status': rng.choices(('completed', 'cancelled', 'confirmed', 'pending'), (85, 5, 5, 5))[0],
+                'created_at': created_at,
+            })
+            details.extend({'order_id': order_id, 'menu_item_id': item_id, 'quantity': qty, 'price': gia}
+                           for (item_id, gia), qty in zip(lines, quantities))
+        # DB mới chưa có đơn nào nên tự đặt id để ghi chi tiết cùng lô
+        if orders:
+            db.session.execute(insert(Order), orders)
+            db.session.execute(insert(OrderDetail), details)
+        db.session.commit()
+
+        canteen.reports.rebuild_order_rollups()
+        canteen.dashboard_counters.invalidate()
+        canteen.menu_cache.invalidate()
+        available = [row.id for row in db.session.query(MenuItem.id).filter_by(is_available=True)]
+    return [f'bench{i:05d}' for i in range(students)], available
+
+
+class Recorder:
+    """Độ trễ và số câu SQL theo route; câu SQL được gán cho route đang chạy trên thread."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.queries = {}
+        self.errors = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        route = getattr(self._local, 'route', None)
+        if route is not None:
+            self._local.queries += 1
+
+    def call(self, route, fn, ok=lambda response: response.status_code < 400):
+        self._local.route, self._local.queries = route, 0
+        started = time.perf_counter()
+        try:
+            response = fn()
+            failed = not ok(response)
+        except Exception:
+            response, failed = None, True
+        elapsed = time.perf_counter() - started
+        self._local.route = None
+        with self._lock:
+            self.latencies.setdefault(route, []).append(elapsed)
+            self.queries.setdefault(route, []).append(self._local.queries)
+            if failed:
+                self.errors[route] = self.errors.get(route, 0) + 1
+        return response
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def student_loop(canteen, recorder, username, menu_ids, deadline, think, rng, index):
+    client = canteen.app.test_client()
+    # Mỗi sinh viên một IP, như khi đăng nhập từ điện thoại riêng
+    client.environ_base['REMOTE_ADDR'] = f'10.{index // 250}.{index % 250}.1'
+    recorder.call('POST /login', lambda: client.post(
+        '/login', data={'username': username, 'password': BENCH_PASSWORD}),
+        ok=lambda r: r.status_code == 302 and '/login' not in r.headers.get('Location', ''))
+    while time.time() < deadline:
+        recorder.call('GET /menu', lambda: client.get('/menu'))
+        for item_id in rng.sample(menu_ids, k=min(len(menu_ids), rng.randint(1, 3))):
+            recorder.call('POST /add_to_cart', lambda: client.post('/add_to_cart', data={'item_id': item_id}))
+        recorder.call('POST /checkout', lambda: client.post('/checkout'),
+                      ok=lambda r: r.status_code == 302 and r.headers.get('Location', '').endswith('/orders'))
+        recorder.call('GET /orders', lambda: client.get('/orders'))
+        time.sleep(rng.uniform(0, think))
+
+
+def admin_loop(canteen, recorder, deadline, think, rng, index):
+    client = canteen.app.test_client()
+    client.environ_base['REMOTE_ADDR'] = f'172.16.0.{index + 1}'
+    recorder.call('POST /login', lambda: client.post('/login', data={'username': 'admin', 'password': 'admin123'}))
+    while time.time() < deadline:
+        recorder.call('GET /admin', lambda: client.get('/admin'))
+        recorder.call('GET /admin/reports', lambda: client.get('/admin/reports'))
+        time.sleep(rng.uniform(0, think * 4))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def summarize(recorder, seconds):
+    routes = {}
+    for route in sorted(recorder.latencies):
+        latencies = recorder.latencies[route]
+        routes[route] = {
+            'count': len(latencies),
+            'rps': round(len(latencies) / seconds, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'queries': round(sum(recorder.queries[route]) / len(latencies), 1),
+            'errors': recorder.errors.get(route, 0),
+        }
+    return routes
+
+
+def previous_result(scale):
+    if not os.path.exists(RESULTS_FILE):
+        return None
+    previous = None
+    with open(RESULTS_FILE, encoding='utf-8') as f:
+        for line in f:
+            result = json.loads(line)
+            if result.get('scale') == scale:
+                previous = result
+    return previous
+
+
+def print_report(result, previous):
+    print(f"\n{'route':<22}{'req':>7}{'req/s':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'sql':>7}{'err':>6}"
+          + ('   p95 so với ' + (previous['commit'] or '?') if previous else ''))
+    for route, stats in result['routes'].items():
+        line = (f"{route:<22}{stats['count']:>7}{stats['rps']:>8.1f}{stats['p50_ms']:>9.1f}"
+                f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['queries']:>7.1f}{stats['errors']:>6}")
+        before = previous and previous['routes'].get(route)
+        if before and before['p95_ms']:
+            change = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100
+            line += f"   {change:+.0f}% (sql {before['queries']:.1f})"
+        print(line)
+    print(f"\nTổng: {result['total_requests']} request, {result['throughput_rps']:.1f} req/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--items', type=int, default=40)
+    parser.add_argument('--months', type=int, default=3)
+    parser.add_argument('--orders-per-month', type=int, default=8, help='đơn / sinh viên / tháng')
+    parser.add_argument('--users', type=int, default=20, help='sinh viên ảo chạy đồng thời')
+    parser.add_argument('--admins', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--think', type=float, default=0.2, help='thời gian nghỉ tối đa giữa hai vòng (giây)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--no-save', action='store_true', help='không ghi kết quả vào results/')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    db_path = os.path.join(tempfile.mkdtemp(prefix='canteen-bench-'), 'bench.db')
+    canteen = setup_app(db_path)
+
+    started = time.perf_counter()
+    usernames, menu_ids = seed(canteen, args.students, args.items, args.months, args.orders_per_month, rng)
+    print(f'Đã sinh dữ liệu ({args.students} sinh viên, {args.items} món, {args.months} tháng) '
+          f'trong {time.perf_counter() - started:.1f}s, DB: {db_path}')
+
+    from sqlalchemy import event
+    recorder = Recorder()
+    with canteen.app.app_context():
+        engine = canteen.db.engine
+    event.listen(engine, 'before_cursor_execute', recorder.on_execute)
+
+    deadline = time.time() + args.seconds
+    threads = [threading.Thread(target=student_loop, args=(
+        canteen, recorder, usernames[i % len(usernames)], menu_ids, deadline, args.think,
+        random.Random(args.seed * 1000 + i), i)) for i in range(args.users)]
+    threads += [threading.Thread(target=admin_loop, args=(
+        canteen, recorder, deadline, args.think, random.Random(-i - 1), i)) for i in range(args.admins)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    routes = summarize(recorder, elapsed)
+    scale = {key: getattr(args, key) for key in
+             ('students', 'items', 'months', 'orders_per_month', 'users', 'admins', 'think')}
+    result = {
+        'commit': git_commit(),
+        'ran_at': datetime.now().isoformat(timespec='seconds'),
+        'scale': scale,
+        'seconds': round(elapsed, 1),
+        'total_requests': sum(stats['count'] for stats in routes.values()),
+        'throughput_rps': round(sum(stats['count'] for stats in routes.values()) / elapsed, 1),
+        'routes': routes,
+    }
+    print_report(result, previous_result(scale))
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+        with open(RESULTS_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+        print(f'Đã ghi kết quả vào {os.path.relpath(RESULTS_FILE, ROOT)}')
+
+
+if __name__ == '__main__':
+    main()
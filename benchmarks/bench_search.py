@@ -0,0 +1,95 @@
+"""Tốc độ tìm sinh viên với chỉ mục FTS5 / search_term so với LIKE '%...%'.
+
+Chạy:  python benchmarks/bench_search.py [--students 50000] [--repeat 20]
+
+Tạo DB SQLite tạm với `--students` sinh viên tên tiếng Việt ngẫu nhiên, dựng
+chỉ mục bằng từng backend rồi đo thời gian câu truy vấn của trang
+/admin/students (lọc theo chỉ mục, sắp theo mã SV, 50 dòng) cho vài câu tìm
+không dấu / tiền tố. Dòng "like" là cách lọc cũ bằng LIKE trên các cột.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+HO = ['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng', 'Huỳnh', 'Phan', 'Vũ', 'Võ', 'Đặng', 'Bùi', 'Đỗ']
+DEM = ['Văn', 'Thị', 'Đức', 'Minh', 'Ngọc', 'Thanh', 'Quốc', 'Gia', 'Hữu', 'Thu']
+TEN = ['An', 'Bình', 'Châu', 'Dũng', 'Giang', 'Hà', 'Hùng', 'Khánh', 'Linh', 'Long', 'Mai',
+       'Nam', 'Phúc', 'Quân', 'Sơn', 'Thắng', 'Trang', 'Tuấn', 'Uyên', 'Yến']
+MAJORS = ['Công nghệ thông tin', 'Kỹ thuật phần mềm', 'An toàn thông tin', 'Kế toán',
+          'Quản trị kinh doanh', 'Marketing', 'Điện tử viễn thông', 'Đa phương tiện']
+QUERIES = ['nguyen van thang', 'tran thi', 'le duc', 'B20DCCN0123', 'ky thuat phan mem hung',
+           'dang', '0912', 'khong co ai']
+PAGE = 50
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ.setdefault('CHAT_MODEL', 'fake')
+    sys.path.insert(0, ROOT)
+    from sqlalchemy import insert
+    import app as canteen
+    from models import db, User, StudentDetail
+    from search import SearchIndex
+
+    rng = random.Random(1)
+    with canteen.app.app_context():
+        db.create_all()
+        db.session.execute(insert(User), [
+            {'username': f'sv{i:06d}', 'password_hash': '-', 'role': 'student'}
+            for i in range(args.students)])
+        user_ids = [row.id for row in db.session.query(User.id).order_by(User.id)]
+        db.session.execute(insert(StudentDetail), [{
+            'user_id': user_id,
+            'ma_sv': f'B20DCCN{i:04d}' if i < 10000 else f'B{20 + i // 10000}DCAT{i % 10000:04d}',
+            'ho_ten': f'{rng.choice(HO)} {rng.choice(DEM)} {rng.choice(TEN)}',
+            'nganh_hoc': rng.choice(MAJORS),
+            'email': f'sv{i:06d}@student.edu.vn',
+            'sdt': f'09{rng.randrange(10 ** 8):08d}'
+        } for i, user_id in enumerate(user_ids)])
+        db.session.commit()
+        print(f'{args.students} sinh viên, {args.repeat} lần mỗi câu tìm')
+
+        def timed(run):
+            samples = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                rows = run()
+                samples.append((time.perf_counter() - started) * 1000)
+            return statistics.median(samples), max(samples), len(rows)
+
+        def page(query):
+            return query.order_by(StudentDetail.ma_sv).limit(PAGE + 1).all()
+
+        for backend in ('fts5', 'terms'):
+            index = SearchIndex(backend=backend)
+            started = time.perf_counter()
+            index.rebuild()
+            print(f'\n[{backend}] dựng chỉ mục: {time.perf_counter() - started:.2f}s')
+            for q in QUERIES:
+                median, worst, found = timed(lambda: page(StudentDetail.query.filter(
+                    StudentDetail.id.in_(index.matching('student', q)))))
+                print(f'  {q:<26} p50 {median:7.2f}ms  max {worst:7.2f}ms  {found:>3} dòng')
+
+        print('\n[like]')
+        for q in QUERIES:
+            median, worst, found = timed(lambda: page(StudentDetail.query.filter(db.or_(
+                *[column.contains(q, autoescape=True) for column in (
+                    StudentDetail.ma_sv, StudentDetail.ho_ten, StudentDetail.nganh_hoc,
+                    StudentDetail.email, StudentDetail.sdt)]))))
+            print(f'  {q:<26} p50 {median:7.2f}ms  max {worst:7.2f}ms  {found:>3} dòng')
+
+
+if __name__ == '__main__':
+    main()
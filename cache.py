@@ -0,0 +1,265 @@
+"""Các cache trong process: bộ đếm dashboard, snapshot thực đơn, HTML đã render
+và người dùng đang đăng nhập.
+
+Các route thay đổi dữ liệu (checkout, hủy đơn, đổi trạng thái, thêm/xóa sinh
+viên, sửa món) cập nhật hoặc xóa cache ngay sau khi commit, nên các trang đọc
+nhiều không phải truy vấn DB ở mỗi request. Mỗi cache còn được nạp lại sau
+`ttl` giây để các worker khác nhau không lệch nhau quá lâu.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from flask_login import UserMixin
+from sqlalchemy.orm import joinedload
+
+from models import db, User, StudentDetail, Order
+
+
+class CounterBackend:
+    """Giao diện lưu trữ bộ đếm; có thể thay bằng store dùng chung (Redis...)."""
+
+    def get_many(self, keys):
+        """Trả về dict {key: value} cho các key đang có."""
+        raise NotImplementedError
+
+    def set_many(self, mapping):
+        raise NotImplementedError
+
+    def incr(self, key, delta):
+        """Cộng delta vào key nếu key đang có; bỏ qua nếu chưa nạp."""
+        raise NotImplementedError
+
+    def delete(self, keys):
+        raise NotImplementedError
+
+
+class LocalCounterBackend(CounterBackend):
+    """Lưu bộ đếm trong dict của process hiện tại."""
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        with self._lock:
+            return {key: self._values[key] for key in keys if key in self._values}
+
+    def set_many(self, mapping):
+        with self._lock:
+            self._values.update(mapping)
+
+    def incr(self, key, delta):
+        with self._lock:
+            if key in self._values:
+                self._values[key] += delta
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._values.pop(key, None)
+
+
+class DashboardCounters:
+    """Tổng đơn, đơn chờ, doanh thu, số sinh viên và số ngành học."""
+
+    KEYS = ('total_orders', 'pending_orders', 'total_revenue', 'total_students', 'major_count')
+    LOADED_AT = 'loaded_at'
+
+    def __init__(self, backend=None, ttl=300):
+        self.backend = backend or LocalCounterBackend()
+        self.ttl = ttl
+
+    def _load(self):
+        """Nạp toàn bộ bộ đếm bằng một câu SELECT gồm các subquery vô hướng."""
+        def scalar(query):
+            return query.scalar_subquery()
+
+        row = db.session.query(
+            scalar(db.session.query(db.func.count(Order.id))),
+            scalar(db.session.query(db.func.count(Order.id)).filter(Order.status == 'pending')),
+            scalar(db.session.query(db.func.coalesce(db.func.sum(Order.total_amount), 0))),
+            scalar(db.session.query(db.func.count(User.id)).filter(User.role == 'student')),
+            scalar(db.session.query(db.func.count(db.distinct(StudentDetail.nganh_hoc))))
+        ).one()
+        values = dict(zip(self.KEYS, row))
+        self.backend.set_many({**values, self.LOADED_AT: time.time()})
+        return values
+
+    def snapshot(self):
+        values = self.backend.get_many(self.KEYS + (self.LOADED_AT,))
+        loaded_at = values.pop(self.LOADED_AT, None)
+        if len(values) < len(self.KEYS) or loaded_at is None or time.time() - loaded_at > self.ttl:
+            return self._load()
+        return values
+
+    def invalidate(self, *keys):
+        self.backend.delete(keys or self.KEYS)
+
+    # ----- Các sự kiện, gọi sau khi commit thành công -----
+
+    def order_placed(self, total_amount):
+        self.backend.incr('total_orders', 1)
+        self.backend.incr('pending_orders', 1)
+        self.backend.incr('total_revenue', total_amount or 0)
+
+    def order_status_changed(self, old_status, new_status, count=1):
+        if old_status == new_status or not count:
+            return
+        if old_status == 'pending':
+            self.backend.incr('pending_orders', -count)
+        elif new_status == 'pending':
+            self.backend.incr('pending_orders', count)
+
+    def student_added(self, count=1):
+        self.backend.incr('total_students', count)
+        # Số ngành học có thể đổi; để lần đọc sau nạp lại
+        self.invalidate('major_count')
+
+    def student_deleted(self):
+        self.backend.incr('total_students', -1)
+        self.invalidate('major_count')
+
+
+MenuEntry = namedtuple('MenuEntry', 'id ten_mon gia loai is_available image image_srcset icon_emoji description')
+MenuSnapshot = namedtuple('MenuSnapshot', 'version built_at items by_id')
+
+
+class MenuCache:
+    """Snapshot bất biến của thực đơn đã trang trí sẵn cho trang /menu.
+
+    `builder` trả về danh sách MenuEntry; version là hash nội dung nên mọi
+    worker có cùng dữ liệu sẽ có cùng version. invalidate() tăng `_generation`:
+    lần dựng lại đang chạy dở (đọc DB trước khi admin sửa) không được đánh dấu
+    là mới, request sau sẽ dựng lại.
+    """
+
+    def __init__(self, builder, ttl=60):
+        self.builder = builder
+        self.ttl = ttl
+        self._snapshot = None
+        self._loaded_at = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._loaded_at <= self.ttl:
+            return snapshot
+        with self._lock:
+            # Request khác có thể đã dựng lại trong lúc chờ lock
+            if self._snapshot is not None and time.time() - self._loaded_at <= self.ttl:
+                return self._snapshot
+            return self._rebuild()
+
+    def _rebuild(self):
+        generation = self._generation
+        items = tuple(self.builder())
+        version = hashlib.sha1(repr(items).encode('utf-8')).hexdigest()[:16]
+        previous = self._snapshot
+        if previous is not None and previous.version == version:
+            # Dữ liệu không đổi: giữ nguyên thời điểm tạo
+            snapshot = previous
+        else:
+            snapshot = MenuSnapshot(version=version, built_at=time.time(), items=items,
+                                    by_id={item.id: item for item in items})
+        self._snapshot = snapshot
+        # Có invalidate() trong lúc builder() chạy: dữ liệu có thể đã cũ, để hết hạn
+        self._loaded_at = time.time() if self._generation == generation else 0
+        return snapshot
+
+    def entry(self, item_id):
+        """MenuEntry theo id món (không truy vấn DB), hoặc None."""
+        return self.get().by_id.get(item_id)
+
+    def invalidate(self):
+        self._generation += 1
+        self._loaded_at = 0
+
+
+class RenderCache:
+    """Giữ các đoạn HTML đã render, khóa theo (tên, version), bỏ bớt theo LRU."""
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        html = render()
+        with self._lock:
+            self._entries[key] = html
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+
+StudentSnapshot = namedtuple('StudentSnapshot', 'id user_id ma_sv ho_ten nganh_hoc email sdt')
+
+
+class CachedUser(UserMixin):
+    """Bản sao gọn của User + StudentDetail, không gắn với session DB.
+
+    Có cùng các thuộc tính mà view dùng qua current_user (id, username, role,
+    student_detail) nên dùng thay được cho đối tượng ORM.
+    """
+
+    def __init__(self, id, username, role, student_detail):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.student_detail = student_detail
+
+    @classmethod
+    def from_model(cls, user):
+        detail = user.student_detail
+        student = None
+        if detail is not None:
+            student = StudentSnapshot(detail.id, detail.user_id, detail.ma_sv, detail.ho_ten,
+                                      detail.nganh_hoc, detail.email, detail.sdt)
+        return cls(user.id, user.username, user.role, student)
+
+
+class UserCache:
+    """Cache TTL/LRU cho user_loader của Flask-Login, khóa theo user id.
+
+    Các route sửa tài khoản hoặc thông tin sinh viên gọi invalidate(user_id)
+    sau khi commit; worker khác thấy thay đổi sau tối đa `ttl` giây.
+    """
+
+    def __init__(self, ttl=60, max_entries=4096):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+
+        user = (User.query.options(joinedload(User.student_detail))
+                .filter(User.id == user_id).first())
+        if user is None:
+            self.invalidate(user_id)
+            return None
+        snapshot = CachedUser.from_model(user)
+        with self._lock:
+            self._entries[user_id] = (now, snapshot)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
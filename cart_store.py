@@ -0,0 +1,319 @@
+"""Giỏ hàng lưu phía server.
+
+Cookie session chỉ giữ `cart_id`; nội dung giỏ nằm trong một CartStore. Mỗi
+thao tác (thêm, đổi số lượng, xóa) chỉ đụng tới một dòng và cộng dồn tổng số
+lượng / tổng tiền, nên đọc badge giỏ hàng là O(1), không phải cộng lại cả giỏ.
+
+Mỗi dòng giỏ là dict {'id', 'name', 'price', 'quantity', 'loai'} như giỏ cũ
+trong session, khóa theo str(id món).
+"""
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, Cart, CartItem
+
+CartSummary = namedtuple('CartSummary', 'count lines total')
+EMPTY_SUMMARY = CartSummary(0, 0, 0)
+
+LINE_FIELDS = ('id', 'name', 'price', 'quantity', 'loai')
+
+
+class CartStore:
+    """Giao diện lưu giỏ hàng; có thể thay bằng store dùng chung (Redis...).
+
+    Các hàm thay đổi giỏ trả về (dòng sau khi đổi, CartSummary mới). Dòng bị
+    xóa được trả về với quantity = 0; None nghĩa là món không có trong giỏ.
+    """
+
+    def items(self, cart_id):
+        """Dict {str(id món): dòng giỏ} theo thứ tự thêm vào."""
+        raise NotImplementedError
+
+    def line(self, cart_id, item_id):
+        """Một dòng giỏ, hoặc None nếu món không có trong giỏ."""
+        raise NotImplementedError
+
+    def summary(self, cart_id):
+        raise NotImplementedError
+
+    def add(self, cart_id, line, quantity):
+        """Thêm `quantity` phần của `line`; cộng dồn nếu món đã có trong giỏ."""
+        raise NotImplementedError
+
+    def set_quantity(self, cart_id, item_id, quantity):
+        """Đặt số lượng tuyệt đối; quantity <= 0 thì xóa dòng."""
+        raise NotImplementedError
+
+    def set_price(self, cart_id, item_id, price):
+        raise NotImplementedError
+
+    def remove(self, cart_id, item_id):
+        raise NotImplementedError
+
+    def clear(self, cart_id):
+        raise NotImplementedError
+
+    def purge(self, max_age):
+        """Xóa các giỏ không đổi trong `max_age` giây; trả về số giỏ đã xóa."""
+        raise NotImplementedError
+
+
+class MemoryCartStore(CartStore):
+    """Lưu giỏ trong dict của process; chỉ dùng khi chạy một worker."""
+
+    def __init__(self):
+        self._carts = {}
+        self._lock = threading.Lock()
+
+    def _cart(self, cart_id):
+        cart = self._carts.get(cart_id)
+        if cart is None:
+            cart = self._carts[cart_id] = {'lines': OrderedDict(), 'count': 0, 'total': 0}
+        cart['updated_at'] = time.time()
+        return cart
+
+    @staticmethod
+    def _summary(cart):
+        return CartSummary(cart['count'], len(cart['lines']), cart['total'])
+
+    def _change(self, cart, key, quantity):
+        """Đổi số lượng một dòng và cập nhật tổng; trả về bản sao dòng."""
+        line = cart['lines'][key]
+        delta = quantity - line['quantity']
+        cart['count'] += delta
+        cart['total'] += delta * line['price']
+        if quantity > 0:
+            line['quantity'] = quantity
+            return dict(line)
+        del cart['lines'][key]
+        return dict(line, quantity=0)
+
+    def items(self, cart_id):
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None:
+                return OrderedDict()
+            return OrderedDict((key, dict(line)) for key, line in cart['lines'].items())
+
+    def line(self, cart_id, item_id):
+        line = self._carts.get(cart_id, {}).get('lines', {}).get(str(item_id))
+        return dict(line) if line is not None else None
+
+    def summary(self, cart_id):
+        cart = self._carts.get(cart_id)
+        return self._summary(cart) if cart is not None else EMPTY_SUMMARY
+
+    def add(self, cart_id, line, quantity):
+        key = str(line['id'])
+        with self._lock:
+            cart = self._cart(cart_id)
+            if key not in cart['lines']:
+                cart['lines'][key] = dict({field: line.get(field) for field in LINE_FIELDS}, quantity=0)
+            current = cart['lines'][key]['quantity']
+            return self._change(cart, key, current + quantity), self._summary(cart)
+
+    def set_quantity(self, cart_id, item_id, quantity):
+        key = str(item_id)
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None or key not in cart['lines']:
+                return None, self.summary(cart_id)
+            cart['updated_at'] = time.time()
+            return self._change(cart, key, max(quantity, 0)), self._summary(cart)
+
+    def set_price(self, cart_id, item_id, price):
+        key = str(item_id)
+        with self._lock:
+            cart = self._carts.get(cart_id)
+            if cart is None or key not in cart['lines']:
+                return None, self.summary(cart_id)
+            line = cart['lines'][key]
+            cart['total'] += (price - line['price']) * line['quantity']
+            line['price'] = price
+            cart['updated_at'] = time.time()
+            return dict(line), self._summary(cart)
+
+    def remove(self, cart_id, item_id):
+        return self.set_quantity(cart_id, item_id, 0)
+
+    def clear(self, cart_id):
+        with self._lock:
+            self._carts.pop(cart_id, None)
+
+    def purge(self, max_age):
+        cutoff = time.time() - max_age
+        with self._lock:
+            stale = [cart_id for cart_id, cart in self._carts.items() if cart['updated_at'] < cutoff]
+            for cart_id in stale:
+                del self._carts[cart_id]
+        return len(stale)
+
+
+class SqlCartStore(CartStore):
+    """Lưu giỏ trong bảng cart / cart_item; dùng được với nhiều worker.
+
+    Bảng cart giữ tổng số lượng, số dòng và tổng tiền, cập nhật cùng transaction
+    với dòng giỏ, nên mỗi thao tác chỉ đọc/ghi theo khóa chính. Tổng được cộng
+    bằng SQL sau khi khóa dòng cart, nên nhiều request cùng lúc không làm lệch.
+    """
+
+    @staticmethod
+    def _line(row, quantity=None):
+        return {
+            'id': row.menu_item_id,
+            'name': row.name,
+            'price': row.price,
+            'quantity': row.quantity if quantity is None else quantity,
+            'loai': row.loai,
+        }
+
+    @staticmethod
+    def _summary(cart):
+        if cart is None:
+            return EMPTY_SUMMARY
+        return CartSummary(cart.item_count, cart.line_count, cart.total)
+
+    def items(self, cart_id):
+        rows = (CartItem.query.filter_by(cart_id=cart_id)
+                .order_by(CartItem.added_at, CartItem.menu_item_id).all())
+        return OrderedDict((str(row.menu_item_id), self._line(row)) for row in rows)
+
+    @staticmethod
+    def _row(cart_id, item_id):
+        try:
+            return db.session.get(CartItem, (cart_id, int(item_id)))
+        except (TypeError, ValueError):
+            return None
+
+    def line(self, cart_id, item_id):
+        row = self._row(cart_id, item_id)
+        return self._line(row) if row is not None else None
+
+    def summary(self, cart_id):
+        return self._summary(db.session.get(Cart, cart_id))
+
+    @staticmethod
+    def _insert(model):
+        dialect = db.session.get_bind().dialect.name
+        return (postgresql.insert if dialect == 'postgresql' else sqlite.insert)(model)
+
+    def _lock(self, cart_id, create=False):
+        """Khóa giỏ trong transaction hiện tại (UPDATE dòng cart); trả về False nếu chưa có giỏ.
+
+        Mọi thao tác ghi đều bắt đầu bằng câu này nên các request đồng thời trên
+        cùng một giỏ chạy lần lượt (khóa dòng trên PostgreSQL, khóa ghi trên SQLite).
+        """
+        now = datetime.utcnow()
+        if create:
+            # Hai request đầu tiên của một giỏ mới có thể cùng tạo dòng cart
+            db.session.execute(self._insert(Cart).values(
+                id=cart_id, item_count=0, line_count=0, total=0, updated_at=now
+            ).on_conflict_do_nothing(index_elements=['id']))
+        return db.session.execute(
+            db.update(Cart).where(Cart.id == cart_id).values(updated_at=now)
+            .execution_options(synchronize_session=False)).rowcount > 0
+
+    def _bump(self, cart_id, count, lines, total):
+        """Cộng dồn tổng bằng SQL (không đọc-sửa-ghi trong Python) rồi commit."""
+        cart = db.session.execute(
+            db.update(Cart).where(Cart.id == cart_id)
+            .values(item_count=Cart.item_count + count, line_count=Cart.line_count + lines,
+                    total=Cart.total + total)
+            .returning(Cart.item_count, Cart.line_count, Cart.total)
+            .execution_options(synchronize_session=False)).one()
+        db.session.commit()
+        return CartSummary(*cart)
+
+    @staticmethod
+    def _current(cart_id, item_id):
+        """Đọc dòng giỏ trực tiếp từ DB (không qua identity map của session)."""
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        return db.session.execute(
+            db.select(CartItem.menu_item_id, CartItem.name, CartItem.price, CartItem.quantity, CartItem.loai)
+            .where(CartItem.cart_id == cart_id, CartItem.menu_item_id == item_id)).first()
+
+    def add(self, cart_id, line, quantity):
+        self._lock(cart_id, create=True)
+        stmt = self._insert(CartItem).values(
+            cart_id=cart_id, menu_item_id=line['id'], name=line['name'], price=line['price'],
+            quantity=quantity, loai=line['loai'], added_at=datetime.utcnow())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['cart_id', 'menu_item_id'],
+            set_={'quantity': CartItem.quantity + stmt.excluded.quantity})
+        row = db.session.execute(stmt.returning(
+            CartItem.menu_item_id, CartItem.name, CartItem.price, CartItem.quantity, CartItem.loai)).one()
+        # Dòng có quantity 0 bị xóa ngay, nên quantity == phần vừa thêm nghĩa là dòng mới
+        summary = self._bump(cart_id, quantity, 1 if row.quantity == quantity else 0, quantity * row.price)
+        return self._line(row), summary
+
+    def set_quantity(self, cart_id, item_id, quantity):
+        if not self._lock(cart_id):
+            db.session.rollback()
+            return None, EMPTY_SUMMARY
+        row = self._current(cart_id, item_id)
+        if row is None:
+            db.session.rollback()
+            return None, self.summary(cart_id)
+        quantity = max(quantity, 0)
+        where = (CartItem.cart_id == cart_id, CartItem.menu_item_id == row.menu_item_id)
+        if quantity > 0:
+            db.session.execute(db.update(CartItem).where(*where).values(quantity=quantity)
+                               .execution_options(synchronize_session=False))
+        else:
+            db.session.execute(db.delete(CartItem).where(*where)
+                               .execution_options(synchronize_session=False))
+        delta = quantity - row.quantity
+        summary = self._bump(cart_id, delta, 0 if quantity > 0 else -1, delta * row.price)
+        return self._line(row, quantity=quantity), summary
+
+    def set_price(self, cart_id, item_id, price):
+        if not self._lock(cart_id):
+            db.session.rollback()
+            return None, EMPTY_SUMMARY
+        row = self._current(cart_id, item_id)
+        if row is None:
+            db.session.rollback()
+            return None, self.summary(cart_id)
+        db.session.execute(
+            db.update(CartItem)
+            .where(CartItem.cart_id == cart_id, CartItem.menu_item_id == row.menu_item_id)
+            .values(price=price).execution_options(synchronize_session=False))
+        summary = self._bump(cart_id, 0, 0, (price - row.price) * row.quantity)
+        return dict(self._line(row), price=price), summary
+
+    def remove(self, cart_id, item_id):
+        return self.set_quantity(cart_id, item_id, 0)
+
+    def clear(self, cart_id):
+        CartItem.query.filter_by(cart_id=cart_id).delete()
+        Cart.query.filter_by(id=cart_id).delete()
+        db.session.commit()
+
+    def purge(self, max_age):
+        cutoff = datetime.utcnow() - timedelta(seconds=max_age)
+        stale = db.session.query(Cart.id).filter(Cart.updated_at < cutoff)
+        CartItem.query.filter(CartItem.cart_id.in_(stale.scalar_subquery())).delete(
+            synchronize_session=False)
+        count = Cart.query.filter(Cart.updated_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return count
+
+
+CART_STORES = {
+    'sql': SqlCartStore,
+    'memory': MemoryCartStore,
+}
+
+
+def create_cart_store(kind='sql'):
+    try:
+        return CART_STORES[kind]()
+    except KeyError:
+        raise ValueError(f'CART_STORE không hợp lệ: {kind!r} (chọn {", ".join(CART_STORES)})')
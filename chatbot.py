@@ -0,0 +1,222 @@
+"""Chạy chatbot trong thread pool riêng, có hàng đợi và timeout.
+
+Lời gọi model (Gemini) mất vài giây; nếu chạy ngay trong request thì mỗi người
+chat giữ một worker WSGI và checkout phải chờ. ChatService giới hạn số lời gọi
+đang chạy (`max_workers`) và đang chờ (`max_queue`); vượt quá thì từ chối ngay
+(ChatBusy) thay vì xếp hàng vô hạn. Route vẫn phải giữ thread WSGI trong lúc
+chờ (.result() hoặc SSE), nên số request đang chờ chatbot còn bị giới hạn riêng
+bởi `max_waiters`, đặt nhỏ hơn số thread WSGI để luôn còn thread cho đặt món. Kết quả được đẩy từng đoạn (stream) qua
+một queue để route SSE gửi dần cho trình duyệt.
+
+Model chỉ cần có `generate_content(prompt, stream=True)` trả về các chunk có
+thuộc tính `.text` (như google.generativeai). FakeChatModel dùng khi chạy thử
+hoặc kiểm thử không có API key (CHAT_MODEL=fake).
+
+ResponseCache giữ câu trả lời cho các câu hỏi lặp lại (theo version thực
+đơn), để câu hỏi quen thuộc được trả lời ngay mà không gọi model.
+"""
+import queue
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChatBusy(Exception):
+    """Đã đủ số lời gọi đang chạy và đang chờ."""
+
+
+class ChatTimeout(Exception):
+    pass
+
+
+_DONE = object()
+
+
+class ChatJob:
+    """Một lời gọi model; đọc kết quả bằng stream() hoặc result()."""
+
+    def __init__(self, prompt, timeout, on_close=None):
+        self.prompt = prompt
+        self.deadline = time.monotonic() + timeout
+        self.cancelled = threading.Event()
+        self._chunks = queue.Queue()
+        self._on_close = on_close
+        self._close_lock = threading.Lock()
+
+    def cancel(self):
+        """Người dùng đóng trang / hết giờ: worker dừng ở chunk kế tiếp."""
+        self.cancelled.set()
+
+    def close(self):
+        """Request không chờ job nữa: hủy nếu chưa xong và trả chỗ chờ (gọi nhiều lần được)."""
+        self.cancel()
+        with self._close_lock:
+            on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+    def _put(self, item):
+        self._chunks.put(item)
+
+    def stream(self):
+        """Sinh từng đoạn text; ném ChatTimeout nếu quá hạn, lỗi của model nếu có."""
+        try:
+            while True:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ChatTimeout()
+                try:
+                    item = self._chunks.get(timeout=remaining)
+                except queue.Empty:
+                    raise ChatTimeout()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def result(self):
+        return ''.join(self.stream())
+
+
+class ChatService:
+    def __init__(self, model, max_workers=2, max_queue=8, timeout=30, max_waiters=None):
+        self.model = model
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        # Số request đang giữ thread WSGI để chờ kết quả; mặc định không chặt hơn hàng đợi
+        self._waiters = threading.BoundedSemaphore(max_waiters or max_workers + max_queue)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='chat')
+
+    @property
+    def available(self):
+        return self.model is not None
+
+    def submit(self, prompt):
+        """Đưa prompt vào hàng đợi; ném ChatBusy nếu đã đầy.
+
+        Người gọi phải đọc hết job.stream() / job.result() hoặc gọi job.close()
+        để trả chỗ chờ.
+        """
+        if not self._waiters.acquire(blocking=False):
+            raise ChatBusy()
+        if not self._slots.acquire(blocking=False):
+            self._waiters.release()
+            raise ChatBusy()
+        job = ChatJob(prompt, self.timeout, on_close=self._waiters.release)
+        try:
+            self._executor.submit(self._run, job)
+        except Exception:
+            self._slots.release()
+            job.close()
+            raise
+        return job
+
+    def _run(self, job):
+        try:
+            if job.cancelled.is_set() or time.monotonic() >= job.deadline:
+                # Chờ trong hàng đợi quá lâu hoặc người dùng đã bỏ đi
+                return
+            for chunk in self.model.generate_content(job.prompt, stream=True):
+                if job.cancelled.is_set():
+                    return
+                text = getattr(chunk, 'text', '')
+                if text:
+                    job._put(text)
+        except Exception as e:
+            job._put(e)
+        finally:
+            job._put(_DONE)
+            self._slots.release()
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeChatModel:
+    """Model giả trả lời cố định theo từng từ, có độ trễ giả lập."""
+
+    def __init__(self, reply=None, delay=0.02):
+        self.reply = reply
+        self.delay = delay
+
+    def generate_content(self, prompt, stream=False):
+        text = self.reply or 'Đây là câu trả lời thử nghiệm của chatbot căng tin.'
+        words = [word + ' ' for word in text.split(' ')]
+        if not stream:
+            time.sleep(self.delay * len(words))
+            return FakeChunk(''.join(words).rstrip())
+        return self._stream(words)
+
+    def _stream(self, words):
+        for word in words:
+            time.sleep(self.delay)
+            yield FakeChunk(word)
+
+
+_PUNCTUATION = re.compile(r'[^\w\s]', re.UNICODE)
+_SPACES = re.compile(r'\s+')
+
+
+def normalize_question(text):
+    """Chuẩn hóa câu hỏi để các cách gõ giống nhau dùng chung cache.
+
+    "Món gì dưới 30k???" và "  món gì  dưới 30k" cho cùng một khóa.
+    """
+    text = unicodedata.normalize('NFC', text).lower()
+    text = _PUNCTUATION.sub(' ', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+class ResponseCache:
+    """Câu trả lời đã có, khóa theo (version thực đơn, câu hỏi đã chuẩn hóa).
+
+    Thực đơn đổi thì version đổi nên câu trả lời cũ tự hết hiệu lực.
+    """
+
+    def __init__(self, max_entries=512, ttl=1800):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, menu_version, question):
+        key = (menu_version, normalize_question(question))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, menu_version, question, reply):
+        key = (menu_version, normalize_question(question))
+        with self._lock:
+            self._entries[key] = (time.time(), reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            }
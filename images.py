@@ -0,0 +1,238 @@
+"""Cache ảnh món ăn lấy từ CDN bên ngoài.
+
+Ảnh được tải trong thread nền, mỗi key chỉ có tối đa một lượt tải đang chạy
+(single-flight). File được ghi ra file tạm rồi đổi tên (atomic) thành
+`remote_<key>.<sha256 12 ký tự>.<ext>`, nên tên file đổi khi nội dung đổi.
+Danh sách file đã cache được giữ trong bộ nhớ, request không phải stat đĩa.
+
+Nếu có Pillow, mỗi ảnh còn được thu nhỏ theo VARIANT_WIDTHS và chuyển sang
+WebP (`remote_<key>.<hash>.w<width>.<ext>`) để điện thoại tải ảnh vừa cỡ.
+"""
+import hashlib
+import io
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow là tuỳ chọn; không có thì chỉ phục vụ ảnh gốc
+    Image = None
+
+VARIANT_WIDTHS = (320, 640, 960)
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+
+CONTENT_TYPE_EXTENSIONS = (
+    ('svg', '.svg'),
+    ('png', '.png'),
+    ('webp', '.webp'),
+)
+
+# remote_<key>.<hash>[.w<width>].<ext>, hoặc remote_<key>.<ext> do phiên bản cũ tạo ra
+_CACHED_FILE = re.compile(r'^remote_(?P<key>\w+?)(?:\.(?P<digest>[0-9a-f]{12}))?'
+                          r'(?:\.w(?P<width>\d+))?\.(?P<ext>jpg|jpeg|png|webp|svg)$')
+
+
+def extension_for(content_type):
+    for marker, ext in CONTENT_TYPE_EXTENSIONS:
+        if marker in (content_type or ''):
+            return ext
+    # default to jpg for other image types
+    return '.jpg'
+
+
+class RemoteImageCache:
+    """Tải và lưu ảnh của các key định trước (`sources`: key -> URL)."""
+
+    def __init__(self, sources, cache_dir, max_workers=2, timeout=10, retry_after=60,
+                 on_update=None):
+        self.sources = sources
+        self.cache_dir = cache_dir
+        self.timeout = timeout
+        self.retry_after = retry_after
+        # Gọi sau khi một ảnh mới được lưu (vd. để dựng lại snapshot thực đơn)
+        self.on_update = on_update
+        self._index = {}
+        self._digests = {}
+        self._variants = {}
+        self._inflight = {}
+        self._failed_at = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='image-fetch')
+        os.makedirs(cache_dir, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        """Dựng index từ các file đã có trên đĩa (một lần listdir khi khởi động)."""
+        variants = []
+        for filename in sorted(os.listdir(self.cache_dir)):
+            match = _CACHED_FILE.match(filename)
+            if not match or match.group('key') not in self.sources:
+                continue
+            key, digest = match.group('key'), match.group('digest')
+            path = os.path.join(self.cache_dir, filename)
+            if match.group('width'):
+                variants.append((key, digest, int(match.group('width')), match.group('ext'), path))
+            elif key not in self._index or digest:
+                # Ưu tiên file có hash trong tên
+                self._index[key] = path
+                self._digests[key] = digest
+        for key, digest, width, ext, path in variants:
+            if digest and self._digests.get(key) == digest:
+                self._variants.setdefault(key, {})[(width, ext)] = path
+
+    def lookup(self, key):
+        """Đường dẫn file đã cache, hoặc None nếu chưa có."""
+        return self._index.get(key)
+
+    def digest(self, key):
+        """Hash nội dung của ảnh đang cache (dùng làm version trong URL)."""
+        return self._digests.get(key)
+
+    def widths(self, key):
+        return sorted({width for width, _ in self._variants.get(key, {})})
+
+    def best_match(self, key, width=None, accept_webp=False):
+        """Chọn file phù hợp nhất: biến thể nhỏ nhất rộng >= `width`, ưu tiên WebP."""
+        original = self._index.get(key)
+        variants = self._variants.get(key, {})
+        if original is None or not variants:
+            return original
+
+        widths = sorted({w for w, _ in variants})
+        if width:
+            candidates = [w for w in widths if w >= width]
+            # Không có biến thể đủ rộng: dùng ảnh gốc (hoặc WebP cùng cỡ)
+            chosen = candidates[0] if candidates else widths[-1]
+        else:
+            chosen = widths[-1]
+        if accept_webp and (chosen, 'webp') in variants:
+            return variants[(chosen, 'webp')]
+        for ext in ('jpg', 'png'):
+            if (chosen, ext) in variants:
+                return variants[(chosen, ext)]
+        return original
+
+    def prefetch(self, key):
+        """Lên lịch tải `key` nếu chưa có và chưa có lượt tải nào đang chạy.
+
+        Ảnh đã có trên đĩa nhưng chưa có biến thể (cache cũ) thì được xử lý lại.
+        """
+        if key not in self.sources:
+            return None
+        if key in self._index:
+            if key in self._variants or Image is None:
+                return None
+            job = self._reprocess
+        else:
+            job = self._fetch
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            failed_at = self._failed_at.get(key)
+            if failed_at is not None and time.time() - failed_at < self.retry_after:
+                return None
+            future = self._executor.submit(job, key)
+            self._inflight[key] = future
+            return future
+
+    def prefetch_missing(self, keys=None):
+        """Lên lịch tải các key (mặc định: mọi key) chưa có ảnh, hoặc có ảnh nhưng chưa có biến thể.
+
+        Ảnh đã cache đầy đủ thì bỏ qua, không gọi ra CDN.
+        """
+        keys = self.sources if keys is None else keys
+        stale = [key for key in keys if key in self.sources and (
+            key not in self._index or (Image is not None and key not in self._variants))]
+        return [future for future in map(self.prefetch, stale) if future is not None]
+
+    def _fetch(self, key):
+        try:
+            resp = requests.get(self.sources[key], timeout=self.timeout)
+            resp.raise_for_status()
+            return self._ingest(key, resp.content, extension_for(resp.headers.get('Content-Type', '')))
+        except Exception:
+            self._failed_at[key] = time.time()
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _reprocess(self, key):
+        try:
+            path = self._index[key]
+            with open(path, 'rb') as f:
+                content = f.read()
+            return self._ingest(key, content, os.path.splitext(path)[1])
+        except Exception:
+            self._variants[key] = {}
+            return None
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _ingest(self, key, content, ext):
+        """Lưu ảnh gốc theo hash nội dung, tạo biến thể rồi mới cập nhật index."""
+        digest = hashlib.sha256(content).hexdigest()[:12]
+        path = os.path.join(self.cache_dir, f'remote_{key}.{digest}{ext}')
+        self._atomic_write(path, content)
+        variants = self._make_variants(key, digest, content) if ext != '.svg' else {}
+        self._variants[key] = variants
+        self._digests[key] = digest
+        self._index[key] = path
+        self._failed_at.pop(key, None)
+        if self.on_update:
+            self.on_update(key)
+        return path
+
+    def _atomic_write(self, path, content):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix='.remote_', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def _make_variants(self, key, digest, content):
+        """Thu nhỏ ảnh theo VARIANT_WIDTHS và tạo bản WebP; trả về {(width, ext): path}."""
+        if Image is None:
+            return {}
+        try:
+            image = Image.open(io.BytesIO(content))
+            image.load()
+        except Exception:
+            return {}
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        variants = {}
+        # Các cỡ nhỏ hơn ảnh gốc, cộng thêm cỡ gốc (chỉ WebP vì JPEG/PNG gốc đã có)
+        widths = [w for w in VARIANT_WIDTHS if w < image.width] + [image.width]
+        for width in widths:
+            if width == image.width:
+                resized, formats = image, [('webp', 'WEBP')]
+            else:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+                fallback = ('png', 'PNG') if resized.mode == 'RGBA' else ('jpg', 'JPEG')
+                formats = [('webp', 'WEBP'), fallback]
+            for ext, fmt in formats:
+                buffer = io.BytesIO()
+                options = {'quality': WEBP_QUALITY if fmt == 'WEBP' else JPEG_QUALITY}
+                if fmt == 'PNG':
+                    options = {'optimize': True}
+                resized.save(buffer, fmt, **options)
+                path = os.path.join(self.cache_dir, f'remote_{key}.{digest}.w{width}.{ext}')
+                self._atomic_write(path, buffer.getvalue())
+                variants[(width, ext)] = path
+        return variants
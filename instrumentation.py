@@ -0,0 +1,255 @@
+"""Đo chi phí mỗi request: số câu SQL, thời gian DB, thời gian render template.
+
+Gắn vào event của SQLAlchemy engine và hook request của Flask:
+
+- Debug (hoặc METRICS_HEADERS=True): mỗi response có X-Query-Count,
+  X-DB-Time-Ms, X-Template-Time-Ms và Server-Timing để xem ngay trên DevTools.
+- Tổng hợp theo endpoint, xuất dạng Prometheus tại /admin/metrics.
+- Giữ các câu SQL chậm nhất (>= SLOW_QUERY_MS thì ghi log).
+- Ngân sách số câu SQL theo endpoint: vượt thì ghi log; nếu QUERY_BUDGET_STRICT
+  (khi kiểm thử) thì request ném QueryBudgetExceeded để test thất bại.
+
+Response dạng luồng (xuất CSV, nhập sinh viên, /chat/stream) chạy phần lớn SQL
+sau after_request, lúc đang sinh body: số liệu của request được giữ tới khi
+response đóng rồi mới cộng vào tổng / kiểm tra ngân sách. Riêng các header
+debug thì đã gửi trước body nên chỉ tính các câu SQL trước khi bắt đầu luồng.
+"""
+import heapq
+import threading
+import time
+
+from flask import before_render_template, request, template_rendered
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestStats:
+    __slots__ = ('endpoint', 'started', 'queries', 'db_time', 'template_time', 'template_depth',
+                 'template_started', 'statement_started', 'streaming')
+
+    def __init__(self, endpoint=None):
+        self.endpoint = endpoint or 'unknown'
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.template_started = 0.0
+        self.statement_started = 0.0
+        self.streaming = False
+
+
+class EndpointTotals:
+    __slots__ = ('requests', 'statuses', 'duration', 'buckets', 'queries', 'db_time',
+                 'template_time', 'over_budget')
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses = {}
+        self.duration = 0.0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.over_budget = 0
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+
+class Instrumentation:
+    def __init__(self, budgets=None, slow_query_ms=100, keep_slowest=10):
+        self.budgets = dict(budgets or {})
+        self.slow_query_ms = slow_query_ms
+        self.keep_slowest = keep_slowest
+        self.app = None
+        self._local = threading.local()
+        self._totals = {}
+        self._slowest = []  # heap (duration, endpoint, statement)
+        self._gauges = []
+        self._lock = threading.Lock()
+
+    def init_app(self, app, engine):
+        self.app = app
+        self.slow_query_ms = app.config.get('SLOW_QUERY_MS', self.slow_query_ms)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        self.attach_engine(engine)
+
+    def attach_engine(self, engine):
+        from sqlalchemy import event
+        event.listen(engine, 'before_cursor_execute', self._before_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_execute)
+
+    def add_gauges(self, collect):
+        """Thêm số liệu khác vào /admin/metrics; `collect()` trả về [(tên, mô tả, giá trị)]."""
+        self._gauges.append(collect)
+
+    # ----- Hook -----
+
+    @property
+    def current(self):
+        return getattr(self._local, 'stats', None)
+
+    def _before_request(self):
+        self._local.stats = RequestStats(request.endpoint)
+
+    def _teardown_request(self, exc):
+        stats = self.current
+        # Body dạng luồng có thể còn chạy sau teardown; _finish sẽ dọn khi response đóng
+        if stats is not None and not stats.streaming:
+            self._local.stats = None
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current
+        if stats is not None:
+            stats.statement_started = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = self.current
+        if stats is None:
+            return
+        elapsed = time.perf_counter() - stats.statement_started
+        stats.queries += 1
+        stats.db_time += elapsed
+        endpoint = stats.endpoint
+        with self._lock:
+            entry = (elapsed, endpoint, ' '.join(statement.split())[:300])
+            if len(self._slowest) < self.keep_slowest:
+                heapq.heappush(self._slowest, entry)
+            elif elapsed > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+        if elapsed * 1000 >= self.slow_query_ms:
+            self.app.logger.warning('Slow query %.1fms on %s: %s', elapsed * 1000, endpoint, entry[2])
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = self.current
+        if stats is not None:
+            # Chỉ đo template ngoài cùng; template lồng nằm trong thời gian đó
+            if stats.template_depth == 0:
+                stats.template_started = time.perf_counter()
+            stats.template_depth += 1
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = self.current
+        if stats is not None and stats.template_depth > 0:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_time += time.perf_counter() - stats.template_started
+
+    def _after_request(self, response):
+        stats = self.current
+        if stats is None:
+            return response
+        if self.app.debug or self.app.config.get('METRICS_HEADERS'):
+            duration = time.perf_counter() - stats.started
+            response.headers['X-Query-Count'] = str(stats.queries)
+            response.headers['X-DB-Time-Ms'] = f'{stats.db_time * 1000:.1f}'
+            response.headers['X-Template-Time-Ms'] = f'{stats.template_time * 1000:.1f}'
+            response.headers['Server-Timing'] = (f'db;dur={stats.db_time * 1000:.1f}, '
+                                                 f'tpl;dur={stats.template_time * 1000:.1f}, '
+                                                 f'total;dur={duration * 1000:.1f}')
+        if response.is_streamed:
+            stats.streaming = True
+            status = response.status_code
+            response.call_on_close(lambda: self._finish(stats, status))
+        else:
+            self._finish(stats, response.status_code)
+        return response
+
+    def _finish(self, stats, status):
+        """Cộng số liệu của một request vào tổng theo endpoint và kiểm tra ngân sách."""
+        if self.current is stats:
+            self._local.stats = None
+        endpoint = stats.endpoint
+        duration = time.perf_counter() - stats.started
+        budget = self.budgets.get(endpoint)
+        over_budget = budget is not None and stats.queries > budget
+
+        with self._lock:
+            totals = self._totals.get(endpoint)
+            if totals is None:
+                totals = self._totals[endpoint] = EndpointTotals()
+            totals.requests += 1
+            totals.statuses[status] = totals.statuses.get(status, 0) + 1
+            totals.duration += duration
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    totals.buckets[i] += 1
+            totals.queries += stats.queries
+            totals.db_time += stats.db_time
+            totals.template_time += stats.template_time
+            totals.over_budget += over_budget
+
+        if over_budget:
+            message = f'{endpoint} chạy {stats.queries} câu SQL, vượt ngân sách {budget}'
+            if self.app.config.get('QUERY_BUDGET_STRICT'):
+                raise QueryBudgetExceeded(message)
+            self.app.logger.warning(message)
+
+    # ----- Xuất số liệu -----
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: {
+                'requests': totals.requests,
+                'avg_queries': round(totals.queries / totals.requests, 2),
+                'avg_db_ms': round(totals.db_time / totals.requests * 1000, 2),
+                'avg_template_ms': round(totals.template_time / totals.requests * 1000, 2),
+                'avg_ms': round(totals.duration / totals.requests * 1000, 2),
+                'over_budget': totals.over_budget,
+            } for endpoint, totals in self._totals.items()}
+
+    def slowest(self):
+        with self._lock:
+            return sorted(self._slowest, reverse=True)
+
+    def prometheus(self):
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels)
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        with self._lock:
+            totals = sorted(self._totals.items())
+            slowest = sorted(self._slowest, reverse=True)
+
+        metric('canteen_requests_total', 'counter', 'Số request theo endpoint và mã trạng thái',
+               [((('endpoint', endpoint), ('status', status)), count)
+                for endpoint, t in totals for status, count in sorted(t.statuses.items())])
+        lines.append('# HELP canteen_request_duration_seconds Thời gian xử lý request (giây)')
+        lines.append('# TYPE canteen_request_duration_seconds histogram')
+        for endpoint, t in totals:
+            name = _label(endpoint)
+            for bound, count in zip(DURATION_BUCKETS, t.buckets):
+                lines.append(f'canteen_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {count}')
+            lines.append(f'canteen_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {t.requests}')
+            lines.append(f'canteen_request_duration_seconds_sum{{endpoint="{name}"}} {round(t.duration, 6)}')
+            lines.append(f'canteen_request_duration_seconds_count{{endpoint="{name}"}} {t.requests}')
+        metric('canteen_db_queries_total', 'counter', 'Số câu SQL theo endpoint',
+               [((('endpoint', endpoint),), t.queries) for endpoint, t in totals])
+        metric('canteen_db_time_seconds_total', 'counter', 'Thời gian chạy SQL theo endpoint (giây)',
+               [((('endpoint', endpoint),), round(t.db_time, 6)) for endpoint, t in totals])
+        metric('canteen_template_time_seconds_total', 'counter', 'Thời gian render template (giây)',
+               [((('endpoint', endpoint),), round(t.template_time, 6)) for endpoint, t in totals])
+        metric('canteen_query_budget_exceeded_total', 'counter', 'Số request vượt ngân sách câu SQL',
+               [((('endpoint', endpoint),), t.over_budget) for endpoint, t in totals])
+        metric('canteen_slow_query_seconds', 'gauge', 'Các câu SQL chậm nhất từ khi khởi động',
+               [((('endpoint', endpoint), ('statement', statement)), round(elapsed, 6))
+                for elapsed, endpoint, statement in slowest])
+        for collect in self._gauges:
+            for name, help_text, value in collect():
+                metric(name, 'gauge', help_text, [((), value)])
+        return '\n'.join(lines) + '\n'
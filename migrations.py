@@ -0,0 +1,68 @@
+"""Migration schema cho các database đã tạo từ trước.
+
+db.create_all() chỉ tạo bảng còn thiếu, không thêm index vào bảng đã có. Mỗi
+migration dưới đây chạy đúng một lần, theo thứ tự version, và được ghi lại
+trong bảng schema_migrations. Câu lệnh dùng cú pháp chung cho SQLite và
+PostgreSQL; tên bảng "user"/"order" luôn được đặt trong dấu nháy kép. Câu
+lệnh chỉ cần cho một loại DB ghi dạng (dialect, sql), vd. đổi độ dài cột
+(SQLite không kiểm tra độ dài VARCHAR nên không cần).
+
+Chạy:  flask --app app db-upgrade
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+MIGRATIONS = [
+    (1, 'Index cho các cột truy vấn nhiều', [
+        'CREATE INDEX IF NOT EXISTS ix_user_role ON "user" (role)',
+        'CREATE INDEX IF NOT EXISTS ix_student_detail_user_id ON student_detail (user_id)',
+        'CREATE INDEX IF NOT EXISTS ix_student_detail_nganh_hoc ON student_detail (nganh_hoc)',
+        'CREATE INDEX IF NOT EXISTS ix_menu_item_loai_ten_mon ON menu_item (loai, ten_mon)',
+        'CREATE INDEX IF NOT EXISTS ix_menu_item_is_available ON menu_item (is_available)',
+        'CREATE INDEX IF NOT EXISTS ix_order_user_id_created_at ON "order" (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_order_status_created_at ON "order" (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_order_status_total_amount ON "order" (status, total_amount)',
+        'CREATE INDEX IF NOT EXISTS ix_order_created_at_id ON "order" (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_detail_order_id ON order_detail (order_id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_detail_menu_item_id ON order_detail (menu_item_id, quantity)',
+    ]),
+    (2, 'Nới cột password_hash cho hash scrypt (~162 ký tự)', [
+        ('postgresql', 'ALTER TABLE "user" ALTER COLUMN password_hash TYPE VARCHAR(255)'),
+    ]),
+]
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, description VARCHAR(200), applied_at TIMESTAMP)'))
+
+
+def applied_versions(db):
+    with db.engine.begin() as conn:
+        _ensure_version_table(conn)
+        return {row[0] for row in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def upgrade(db):
+    """Chạy các migration chưa áp dụng; trả về danh sách version vừa chạy."""
+    done = applied_versions(db)
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version in done:
+            continue
+        # Mỗi migration là một transaction: lỗi giữa chừng thì không ghi version
+        with db.engine.begin() as conn:
+            for statement in statements:
+                if isinstance(statement, tuple):
+                    dialect, statement = statement
+                    if conn.dialect.name != dialect:
+                        continue
+                conn.execute(text(statement))
+            conn.execute(text(
+                'INSERT INTO schema_migrations (version, description, applied_at) '
+                'VALUES (:version, :description, :applied_at)'),
+                {'version': version, 'description': description, 'applied_at': datetime.utcnow()})
+        applied.append(version)
+    return applied
@@ -1,6 +1,6 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from security import password_policy
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -8,15 +8,20 @@ db = SQLAlchemy()
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
-    password_hash = db.Column(db.String(120), nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(20), default='student')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_user_role', 'role'),)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_policy.hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Kiểm tra mật khẩu; hash theo cấu hình cũ được thay bằng hash mới (chưa commit)."""
+        ok, new_hash = password_policy.verify(self.password_hash, password)
+        if new_hash:
+            self.password_hash = new_hash
+        return ok
 
 class StudentDetail(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -26,7 +31,11 @@ class StudentDetail(db.Model):
     nganh_hoc = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120), nullable=False)
     sdt = db.Column(db.String(15), nullable=False)
-    user = db.relationship('User', backref='student_detail')
+    user = db.relationship('User', backref=db.backref('student_detail', uselist=False))
+    __table_args__ = (
+        db.Index('ix_student_detail_user_id', 'user_id'),
+        db.Index('ix_student_detail_nganh_hoc', 'nganh_hoc'),
+    )
 
 class MenuItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,6 +43,10 @@ class MenuItem(db.Model):
     gia = db.Column(db.Integer, nullable=False)
     loai = db.Column(db.String(50), nullable=False)
     is_available = db.Column(db.Boolean, default=True)
+    __table_args__ = (
+        db.Index('ix_menu_item_loai_ten_mon', 'loai', 'ten_mon'),
+        db.Index('ix_menu_item_is_available', 'is_available'),
+    )
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -42,6 +55,16 @@ class Order(db.Model):
     status = db.Column(db.String(20), default='pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user = db.relationship('User', backref='orders')
+    __table_args__ = (
+        # /orders, chi tiết sinh viên: lọc theo user, sắp theo thời gian
+        db.Index('ix_order_user_id_created_at', 'user_id', 'created_at'),
+        # dashboard, báo cáo, lọc đơn theo trạng thái
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        # tổng doanh thu theo trạng thái đọc từ index, không cần đọc bảng
+        db.Index('ix_order_status_total_amount', 'status', 'total_amount'),
+        # đơn gần đây và phân trang keyset (created_at, id)
+        db.Index('ix_order_created_at_id', 'created_at', 'id'),
+    )
 
 class OrderDetail(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,4 +73,45 @@ class OrderDetail(db.Model):
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Integer, nullable=False)
     order = db.relationship('Order', backref='order_details')
-    menu_item = db.relationship('MenuItem')
\ No newline at end of file
+    menu_item = db.relationship('MenuItem')
+    __table_args__ = (
+        db.Index('ix_order_detail_order_id', 'order_id'),
+        db.Index('ix_order_detail_menu_item_id', 'menu_item_id', 'quantity'),
+    )
+
+class OrderRollup(db.Model):
+    """Số đơn và doanh thu cộng dồn theo giờ (UTC) và trạng thái, dùng cho báo cáo."""
+    id = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Integer, nullable=False, default=0)
+    __table_args__ = (db.UniqueConstraint('bucket', 'status'),)
+
+
+class SearchTerm(db.Model):
+    """Chỉ mục tìm kiếm dự phòng khi không có SQLite FTS5: một dòng mỗi từ (đã bỏ dấu)."""
+    TERM_LENGTH = 64
+    kind = db.Column(db.String(10), primary_key=True)
+    term = db.Column(db.String(TERM_LENGTH), primary_key=True)
+    ref_id = db.Column(db.Integer, primary_key=True)
+    __table_args__ = (db.Index('ix_search_term_kind_ref_id', 'kind', 'ref_id'),)
+
+
+class Cart(db.Model):
+    """Giỏ hàng lưu phía server; cookie session chỉ giữ id. Tổng được cộng dồn."""
+    id = db.Column(db.String(32), primary_key=True)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class CartItem(db.Model):
+    cart_id = db.Column(db.String(32), db.ForeignKey('cart.id'), primary_key=True)
+    menu_item_id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    price = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    loai = db.Column(db.String(50))
+    added_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,96 @@
+"""Xuất đơn hàng cho kế toán: CSV hoặc NDJSON, có thể nén gzip, ghi theo luồng.
+
+Một câu SELECT duy nhất join order / order_detail / menu_item / user /
+student_detail, sắp theo (created_at, id) để dùng index ix_order_created_at_id
+(hoặc ix_order_status_created_at khi lọc trạng thái). Kết quả đọc bằng
+server-side cursor (stream_results) từng `chunk_size` dòng, và đầu ra được
+yield theo khối, nên xuất một năm đơn hàng vẫn dùng bộ nhớ cố định.
+
+- CSV: mỗi dòng là một món trong đơn (thông tin đơn lặp lại trên từng dòng).
+- NDJSON: mỗi dòng là một đơn, kèm danh sách món "items".
+"""
+import csv
+import io
+import json
+import zlib
+from itertools import groupby
+
+from models import db, User, StudentDetail, MenuItem, Order, OrderDetail
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+CSV_COLUMNS = ('order_id', 'created_at', 'status', 'order_total', 'username', 'ma_sv', 'ho_ten',
+               'nganh_hoc', 'menu_item_id', 'ten_mon', 'loai', 'quantity', 'price', 'line_total')
+ORDER_FIELDS = CSV_COLUMNS[:8]
+
+
+def _rows(filter_orders, filters, chunk_size):
+    """Các dòng (một dòng mỗi món) theo thứ tự đơn; đơn không có món vẫn có một dòng."""
+    query = db.session.query(
+        Order.id, Order.created_at, Order.status, Order.total_amount,
+        User.username, StudentDetail.ma_sv, StudentDetail.ho_ten, StudentDetail.nganh_hoc,
+        OrderDetail.menu_item_id, MenuItem.ten_mon, MenuItem.loai, OrderDetail.quantity, OrderDetail.price)\
+        .outerjoin(User, User.id == Order.user_id)\
+        .outerjoin(StudentDetail, StudentDetail.user_id == Order.user_id)\
+        .outerjoin(OrderDetail, OrderDetail.order_id == Order.id)\
+        .outerjoin(MenuItem, MenuItem.id == OrderDetail.menu_item_id)
+    query = filter_orders(query, filters)\
+        .order_by(Order.created_at, Order.id, OrderDetail.id)\
+        .execution_options(stream_results=True)\
+        .yield_per(chunk_size)
+    for row in query:
+        created_at = row[1].isoformat() if row[1] else ''
+        quantity, price = row[11], row[12]
+        line_total = quantity * price if quantity is not None and price is not None else None
+        yield (row[0], created_at) + tuple(row[2:]) + (line_total,)
+
+
+def _csv_chunks(rows, chunk_size):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM để Excel đọc đúng tiếng Việt
+    buffer.write('\ufeff')
+    writer.writerow(CSV_COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(['' if value is None else value for value in row])
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows, chunk_size):
+    lines = []
+    for order_id, order_rows in groupby(rows, key=lambda row: row[0]):
+        order_rows = list(order_rows)
+        order = dict(zip(ORDER_FIELDS, order_rows[0][:len(ORDER_FIELDS)]))
+        order['items'] = [dict(zip(CSV_COLUMNS[len(ORDER_FIELDS):], row[len(ORDER_FIELDS):]))
+                          for row in order_rows if row[len(ORDER_FIELDS)] is not None]
+        lines.append(json.dumps(order, ensure_ascii=False))
+        if len(lines) >= chunk_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def gzip_chunks(chunks):
+    """Nén gzip dần từng khối text (UTF-8)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_orders(filter_orders, filters, fmt='csv', gzip=False, chunk_size=1000):
+    """Sinh nội dung file xuất (str, hoặc bytes nếu gzip).
+
+    `filter_orders(query, filters)` áp bộ lọc giống trang /admin/orders.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f'Định dạng không hỗ trợ: {fmt}')
+    rows = _rows(filter_orders, filters, chunk_size)
+    chunks = _csv_chunks(rows, chunk_size) if fmt == 'csv' else _ndjson_chunks(rows, chunk_size)
+    return gzip_chunks(chunks) if gzip else chunks
@@ -0,0 +1,73 @@
+"""Chuyển trạng thái đơn hàng hàng loạt cho bếp / admin.
+
+Chỉ có các bước tiến: pending -> confirmed -> completed (ORDER_TRANSITIONS).
+transition_orders() nhận danh sách id, đọc trạng thái hiện tại bằng một câu
+SELECT, rồi với mỗi trạng thái nguồn chạy một câu
+
+    UPDATE "order" SET status = :to WHERE id IN (...) AND status = :from RETURNING ...
+
+Điều kiện `status = :from` giữ an toàn khi admin khác đổi cùng đơn giữa lúc đọc
+và lúc ghi: đơn không nằm trong RETURNING được báo là 'conflict'. Rollup được
+cập nhật trong cùng transaction (một upsert cho mỗi ô giờ / trạng thái); route
+commit rồi mới cập nhật DashboardCounters như các thao tác đơn lẻ.
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+import reports
+from models import db, Order
+
+ORDER_TRANSITIONS = {'pending': 'confirmed', 'confirmed': 'completed'}
+MAX_BULK_ORDERS = 500
+
+
+def matching_order_ids(status, older_than_minutes=None, limit=MAX_BULK_ORDERS):
+    """Id các đơn đang ở `status` (và đặt trước đó ít nhất `older_than_minutes` phút), cũ nhất trước.
+
+    Lấy dư một id để biết còn đơn khớp bộ lọc hay không; trả về (ids, has_more).
+    """
+    query = db.session.query(Order.id).filter(Order.status == status)
+    if older_than_minutes:
+        query = query.filter(Order.created_at <= datetime.utcnow() - timedelta(minutes=older_than_minutes))
+    ids = [order_id for (order_id,) in query.order_by(Order.created_at, Order.id).limit(limit + 1)]
+    return ids[:limit], len(ids) > limit
+
+
+def transition_orders(order_ids, to=None):
+    """Chuyển các đơn sang `to` (None: mỗi đơn tiến một bước); chưa commit.
+
+    Trả về (outcomes, changes): outcomes là danh sách {id, result, ...} theo
+    thứ tự id truyền vào, result 'updated' | 'invalid' | 'not_found' | 'conflict'; changes là
+    Counter {(trạng thái cũ, trạng thái mới): số đơn} để cập nhật counters sau commit.
+    """
+    order_ids = list(dict.fromkeys(order_ids))
+    current = dict(db.session.query(Order.id, Order.status).filter(Order.id.in_(order_ids)))
+    outcomes, groups = {}, {}
+    for order_id in order_ids:
+        status = current.get(order_id)
+        if status is None:
+            outcomes[order_id] = {'id': order_id, 'result': 'not_found'}
+        elif status not in ORDER_TRANSITIONS or (to and ORDER_TRANSITIONS[status] != to):
+            outcomes[order_id] = {'id': order_id, 'result': 'invalid', 'status': status}
+        else:
+            groups.setdefault(status, []).append(order_id)
+
+    changes, moved = Counter(), []
+    for old_status, ids in groups.items():
+        new_status = ORDER_TRANSITIONS[old_status]
+        updated = db.session.execute(
+            db.update(Order)
+            .where(Order.id.in_(ids), Order.status == old_status)
+            .values(status=new_status)
+            .returning(Order.id, Order.created_at, Order.total_amount)
+            .execution_options(synchronize_session=False)).all()
+        for order_id, created_at, amount in updated:
+            outcomes[order_id] = {'id': order_id, 'result': 'updated', 'from': old_status, 'status': new_status}
+            moved.append((created_at, amount, old_status, new_status))
+        changes[(old_status, new_status)] += len(updated)
+        for order_id in ids:
+            # Đơn đã bị đổi trạng thái bởi request khác sau câu SELECT ở trên
+            outcomes.setdefault(order_id, {'id': order_id, 'result': 'conflict'})
+
+    reports.record_status_changes(moved)
+    return [outcomes[order_id] for order_id in order_ids], changes
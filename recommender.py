@@ -0,0 +1,245 @@
+"""Gợi ý món theo ngân sách, bữa ăn và độ phổ biến, chạy ngay trong process.
+
+Các câu hỏi quen thuộc ("combo dưới 50k", "sáng nay ăn gì", "món nào bán
+chạy") chỉ cần lọc/sắp xếp thực đơn nhỏ, nên được trả lời tại chỗ thay vì gọi
+model mất vài giây. Câu hỏi tự do khác (answer() trả về None) mới chuyển cho
+chatbot.
+
+Recommender dựng sẵn các index (theo loại, theo độ phổ biến từ lịch sử
+OrderDetail) từ snapshot thực đơn; RecommenderCache dựng lại khi version thực
+đơn đổi hoặc số liệu bán hàng quá `ttl` giây.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import namedtuple
+from itertools import combinations
+
+from chatbot import normalize_question
+
+DRINK_CATEGORIES = ('Đồ uống',)
+# Bữa ăn -> các loại món phù hợp
+MEAL_CATEGORIES = {
+    'sáng': ('Đồ ăn sáng', 'Đồ ăn nhanh', 'Đồ uống'),
+    'trưa': ('Món chính', 'Đồ ăn nhanh', 'Đồ uống'),
+    'tối': ('Món chính', 'Đồ ăn nhanh', 'Đồ uống'),
+}
+MEAL_LABELS = {'sáng': 'bữa sáng', 'trưa': 'bữa trưa', 'tối': 'bữa tối'}
+# Cách gọi khác của các loại món (tên loại trong thực đơn luôn được nhận)
+CATEGORY_ALIASES = {
+    'nước': 'Đồ uống', 'uống': 'Đồ uống', 'cafe': 'Đồ uống', 'cà phê': 'Đồ uống',
+    'ăn nhanh': 'Đồ ăn nhanh', 'ăn vặt': 'Đồ ăn nhanh',
+    'cơm': 'Món chính', 'món no': 'Món chính',
+}
+POPULAR_WORDS = ('bán chạy', 'phổ biến', 'nhiều người', 'ngon nhất', 'hot', 'nổi bật', 'món ngon')
+SUGGEST_WORDS = ('gợi ý', 'nên ăn', 'ăn gì', 'món gì', 'món nào', 'có gì', 'uống gì', 'combo',
+                 'tư vấn', 'chọn', 'đề xuất')
+
+# 30k, 30 nghìn, 30.000đ, 30000 vnd, dưới 50000, có 40000 tiền...
+_MONEY = re.compile(r'(?:\b(dưới|tối đa|không quá|chưa tới|chưa đến|ngân sách)\s+)?'
+                    r'(\d{1,3}(?:[.,]\d{3})+|\d+)\s*(k|nghìn|ngàn|đồng|đ|vnđ|vnd|tiền)?\b')
+# "tối đa 50k" là giới hạn tiền, không phải bữa tối
+_MEAL = re.compile(r'\b(sáng|trưa|tối)\b(?! đa| thiểu)')
+
+# "dưới 50k" là nhỏ hơn hẳn 50k; "tối đa", "không quá", "30k" cho phép bằng
+STRICT_CUES = ('dưới', 'chưa tới', 'chưa đến')
+
+TOP_PER_CATEGORY = 8
+MAX_COMBO_FOODS = 2
+
+
+Budget = namedtuple('Budget', 'amount strict')
+
+
+def format_price(amount):
+    return f"{amount:,}đ"
+
+
+def _category_label(categories):
+    # "Món chính" -> "chính" để không thành "các món món chính"
+    names = [loai.lower() for loai in categories]
+    return ', '.join(name[4:] if name.startswith('món ') else name for name in names)
+
+
+def parse_budget(text):
+    """Budget(số tiền lớn nhất nhắc tới trong câu, có phải "dưới" không), hoặc None.
+
+    Chỉ tính số có đơn vị ("30k", "30.000đ", "30 nghìn"; số < 1000 có đơn vị hiểu
+    là nghìn) hoặc số trần có từ chỉ ngân sách đi kèm ("dưới 50000", "có 40000
+    tiền"). Số trần khác ("khóa 2021", "cơm gà 35000 còn không") không phải tiền.
+    """
+    budgets = []
+    for cue, number, unit in _MONEY.findall(unicodedata.normalize('NFC', text).lower()):
+        value = int(number.replace('.', '').replace(',', ''))
+        if unit in ('k', 'nghìn', 'ngàn') or (unit and value < 1000):
+            value *= 1000
+        elif not unit and (not cue or value < 1000):
+            # "2 món", "tối đa 2 món", "năm 2024": không phải tiền
+            continue
+        budgets.append(Budget(value, cue in STRICT_CUES))
+    return max(budgets, key=lambda b: (b.amount, not b.strict)) if budgets else None
+
+
+def _contains(text, phrases):
+    return any(re.search(r'\b' + re.escape(phrase) + r'\b', text) for phrase in phrases)
+
+
+class Recommender:
+    def __init__(self, items, popularity):
+        self.items = [item for item in items if item.is_available]
+        self.popularity = {item.id: popularity.get(item.id, 0) for item in self.items}
+        # Mỗi loại: món phổ biến trước, rẻ trước khi bằng nhau
+        self.by_category = {}
+        for item in sorted(self.items, key=lambda i: (-self.popularity[i.id], i.gia)):
+            self.by_category.setdefault(item.loai, []).append(item)
+        self.by_popularity = sorted(self.items, key=lambda i: (-self.popularity[i.id], i.gia))
+        self.aliases = {normalize_question(loai): loai for loai in self.by_category}
+        self.aliases.update({alias: loai for alias, loai in CATEGORY_ALIASES.items()
+                             if loai in self.by_category})
+
+    # ----- Hiểu câu hỏi -----
+
+    def _categories_in(self, text):
+        # Ưu tiên cụm dài ("đồ ăn nhanh" trước "ăn nhanh")
+        found = []
+        for alias in sorted(self.aliases, key=len, reverse=True):
+            if _contains(text, [alias]) and self.aliases[alias] not in found:
+                found.append(self.aliases[alias])
+                text = text.replace(alias, ' ')
+        return found
+
+    def answer(self, question):
+        """Câu trả lời cho câu hỏi gợi ý món, hoặc None nếu là câu hỏi tự do."""
+        if not self.items:
+            return None
+        text = normalize_question(question)
+        budget = parse_budget(question)
+        meal_match = _MEAL.search(text)
+        meal = meal_match.group(1) if meal_match else None
+        categories = self._categories_in(text)
+        popular = _contains(text, POPULAR_WORDS)
+        suggest = _contains(text, SUGGEST_WORDS)
+
+        if budget:
+            return self.budget_answer(budget.amount, meal, categories, strict=budget.strict)
+        if popular:
+            return self.popular_answer(meal, categories)
+        if suggest and (meal or categories):
+            return self.pick_answer(meal, categories)
+        return None
+
+    # ----- Trả lời -----
+
+    def _candidates(self, meal, categories):
+        allowed = categories or (MEAL_CATEGORIES[meal] if meal else None)
+        if allowed is None:
+            return self.by_category
+        return {loai: items for loai, items in self.by_category.items() if loai in allowed}
+
+    def best_combos(self, budget, meal=None, categories=None, limit=3):
+        """Các combo (tối đa MAX_COMBO_FOODS món ăn khác loại + 1 đồ uống) tổng không quá `budget`."""
+        groups = self._candidates(meal, categories)
+        foods = [items[:TOP_PER_CATEGORY] for loai, items in groups.items()
+                 if loai not in DRINK_CATEGORIES]
+        drinks = [item for loai, items in groups.items() if loai in DRINK_CATEGORIES
+                  for item in items[:TOP_PER_CATEGORY]]
+
+        food_sets = [()]
+        for size in range(1, MAX_COMBO_FOODS + 1):
+            for chosen_groups in combinations(foods, size):
+                food_sets.extend(self._product(chosen_groups))
+
+        combos = []
+        for food_set in food_sets:
+            for drink in [None] + drinks:
+                combo = food_set + ((drink,) if drink else ())
+                total = sum(item.gia for item in combo)
+                if combo and total <= budget:
+                    score = sum(self.popularity[item.id] for item in combo)
+                    # Có món ăn > phổ biến hơn > dùng gần hết ngân sách > ít món hơn
+                    combos.append(((bool(food_set), score, total, -len(combo)), combo, total))
+        combos.sort(key=lambda c: c[0], reverse=True)
+        return [(combo, total) for _, combo, total in combos[:limit]]
+
+    @staticmethod
+    def _product(groups):
+        result = [()]
+        for items in groups:
+            result = [prefix + (item,) for prefix in result for item in items]
+        return result
+
+    def budget_answer(self, budget, meal=None, categories=None, strict=False):
+        """strict: "dưới `budget`" (tổng phải nhỏ hơn hẳn), ngược lại "không quá `budget`"."""
+        label = f" cho {MEAL_LABELS[meal]}" if meal else ''
+        limit = budget - 1 if strict else budget
+        bound = f"{'dưới' if strict else 'không quá'} {format_price(budget)}"
+        if categories:
+            items = [item for loai in categories for item in self.by_category.get(loai, [])
+                     if item.gia <= limit]
+            if not items:
+                return f"Không có món {_category_label(categories)} nào {bound}."
+            lines = [f"- {item.ten_mon}: {format_price(item.gia)}" for item in items[:5]]
+            return f"Các món {_category_label(categories)} {bound}:\n" + "\n".join(lines)
+
+        combos = self.best_combos(limit, meal)
+        if not combos:
+            cheapest = min(self.items, key=lambda item: item.gia)
+            return (f"Tiếc quá, chưa có món nào{label} {bound}. "
+                    f"Món rẻ nhất hiện có là {cheapest.ten_mon} ({format_price(cheapest.gia)}).")
+        lines = [" + ".join(f"{item.ten_mon} ({format_price(item.gia)})" for item in combo)
+                 + f" = {format_price(total)}" for combo, total in combos]
+        return (f"Gợi ý tốt nhất{label} {bound}:\n- {lines[0]}"
+                + ("\nLựa chọn khác:\n- " + "\n- ".join(lines[1:]) if len(lines) > 1 else ''))
+
+    def popular_answer(self, meal=None, categories=None, limit=5):
+        groups = self._candidates(meal, categories)
+        allowed = {item.id for items in groups.values() for item in items}
+        items = [item for item in self.by_popularity if item.id in allowed][:limit]
+        if not items:
+            return None
+        lines = []
+        for item in items:
+            sold = self.popularity[item.id]
+            lines.append(f"- {item.ten_mon}: {format_price(item.gia)}"
+                         + (f" (đã bán {sold} phần)" if sold else ''))
+        return "Các món được chọn nhiều nhất:\n" + "\n".join(lines)
+
+    def pick_answer(self, meal=None, categories=None, per_category=2):
+        groups = self._candidates(meal, categories)
+        if not groups:
+            return None
+        title = f"Gợi ý {MEAL_LABELS[meal]}" if meal else "Gợi ý"
+        lines = []
+        for loai, items in groups.items():
+            picks = ", ".join(f"{item.ten_mon} ({format_price(item.gia)})" for item in items[:per_category])
+            lines.append(f"- {loai}: {picks}")
+        return f"{title}:\n" + "\n".join(lines)
+
+
+class RecommenderCache:
+    """Giữ Recommender của version thực đơn hiện tại; số liệu bán hàng nạp lại sau `ttl` giây."""
+
+    def __init__(self, load_popularity, ttl=600):
+        self.load_popularity = load_popularity
+        self.ttl = ttl
+        self._current = None  # (version, built_at, Recommender)
+        self._lock = threading.Lock()
+
+    def _fresh(self, snapshot):
+        current = self._current
+        if current is not None and current[0] == snapshot.version and time.time() - current[1] <= self.ttl:
+            return current[2]
+        return None
+
+    def get(self, snapshot):
+        recommender = self._fresh(snapshot)
+        if recommender is not None:
+            return recommender
+        with self._lock:
+            # Request khác có thể vừa dựng xong trong lúc chờ khóa: không nạp lại lần nữa
+            recommender = self._fresh(snapshot)
+            if recommender is None:
+                recommender = Recommender(snapshot.items, self.load_popularity())
+                self._current = (snapshot.version, time.time(), recommender)
+            return recommender
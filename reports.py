@@ -0,0 +1,241 @@
+"""Các truy vấn tổng hợp cho trang báo cáo /admin/reports.
+
+Mỗi hàm chạy một câu GROUP BY duy nhất để số truy vấn của trang không phụ
+thuộc vào số đơn hàng, số món hay số ngành học. Chuỗi thời gian (doanh thu
+theo ngày, đơn theo giờ) đọc từ bảng OrderRollup được cập nhật dần mỗi khi
+đơn hàng được tạo hoặc đổi trạng thái.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, User, StudentDetail, MenuItem, Order, OrderDetail, OrderRollup
+
+# Giờ Việt Nam (UTC+7); created_at được lưu theo UTC
+DEFAULT_TZ_OFFSET_HOURS = 7
+REPORT_RANGES = (7, 30, 90)
+
+
+def order_status_summary():
+    """Số đơn và doanh thu theo từng trạng thái: {status: (count, revenue)}."""
+    rows = db.session.query(
+        Order.status,
+        db.func.count(Order.id),
+        db.func.coalesce(db.func.sum(Order.total_amount), 0)
+    ).group_by(Order.status).all()
+    return {status: (count, revenue) for status, count, revenue in rows}
+
+
+def catalog_counts():
+    """Tổng số sinh viên và số món ăn trong một truy vấn."""
+    students = db.session.query(db.func.count(User.id))\
+        .filter(User.role == 'student').scalar_subquery()
+    menu_items = db.session.query(db.func.count(MenuItem.id)).scalar_subquery()
+    total_students, total_menu_items = db.session.query(students, menu_items).one()
+    return total_students, total_menu_items
+
+
+def top_selling_items(limit=5):
+    """Các món bán chạy nhất, tính bằng SUM(quantity) nhóm theo menu_item_id."""
+    # Gom nhóm order_detail trước (đọc từ index menu_item_id, quantity), rồi mới
+    # join vài dòng kết quả với menu_item theo khóa chính
+    sold = db.session.query(
+        OrderDetail.menu_item_id.label('menu_item_id'),
+        db.func.sum(OrderDetail.quantity).label('total_sold')
+    ).group_by(OrderDetail.menu_item_id)\
+        .order_by(db.func.sum(OrderDetail.quantity).desc())\
+        .limit(limit).subquery()
+    rows = db.session.query(MenuItem.id, MenuItem.ten_mon, MenuItem.loai, MenuItem.gia, sold.c.total_sold)\
+        .join(sold, sold.c.menu_item_id == MenuItem.id)\
+        .order_by(sold.c.total_sold.desc()).all()
+    return [{
+        'id': row.id,
+        'ten_mon': row.ten_mon,
+        'loai': row.loai,
+        'gia': row.gia,
+        'total_sold': row.total_sold or 0
+    } for row in rows]
+
+
+def item_popularity():
+    """{menu_item_id: tổng số phần đã bán}, chỉ đọc từ index (menu_item_id, quantity)."""
+    rows = db.session.query(OrderDetail.menu_item_id, db.func.sum(OrderDetail.quantity))\
+        .group_by(OrderDetail.menu_item_id).all()
+    return {menu_item_id: int(total or 0) for menu_item_id, total in rows}
+
+
+def student_order_stats(user_ids):
+    """{user_id: (số đơn, tổng chi, đơn gần nhất)} cho các sinh viên trong trang.
+
+    Một câu GROUP BY trên index (user_id, created_at), thay cho việc nạp toàn
+    bộ lịch sử đơn của từng sinh viên.
+    """
+    if not user_ids:
+        return {}
+    rows = db.session.query(
+        Order.user_id,
+        db.func.count(Order.id),
+        db.func.coalesce(db.func.sum(Order.total_amount), 0),
+        db.func.max(Order.created_at)
+    ).filter(Order.user_id.in_(user_ids)).group_by(Order.user_id).all()
+    return {user_id: (count, spend, last_order) for user_id, count, spend, last_order in rows}
+
+
+def major_stats():
+    """Số sinh viên và tổng chi tiêu theo ngành học trong một câu join."""
+    rows = db.session.query(
+        StudentDetail.nganh_hoc,
+        db.func.count(db.distinct(StudentDetail.id)),
+        db.func.coalesce(db.func.sum(Order.total_amount), 0)
+    ).outerjoin(Order, Order.user_id == StudentDetail.user_id)\
+        .filter(StudentDetail.nganh_hoc.isnot(None))\
+        .group_by(StudentDetail.nganh_hoc)\
+        .order_by(StudentDetail.nganh_hoc).all()
+    return [{
+        'nganh_hoc': nganh_hoc,
+        'student_count': student_count,
+        'total_spent': total_spent
+    } for nganh_hoc, student_count, total_spent in rows]
+
+
+def overview_stats():
+    """Các chỉ số tổng quan hiển thị ở đầu trang báo cáo."""
+    by_status = order_status_summary()
+    total_orders = sum(count for count, _ in by_status.values())
+    total_revenue = sum(revenue for _, revenue in by_status.values())
+    total_students, total_menu_items = catalog_counts()
+    completed_orders = by_status.get('completed', (0, 0))[0]
+
+    stats = {
+        'total_orders': total_orders,
+        'total_revenue': total_revenue,
+        'total_students': total_students,
+        'total_menu_items': total_menu_items,
+        'avg_order_value': round(total_revenue / total_orders) if total_orders > 0 else 0,
+        'completion_rate': round((completed_orders / total_orders * 100), 1) if total_orders > 0 else 0
+    }
+    order_stats = {status: by_status.get(status, (0, 0))[0]
+                   for status in ('pending', 'confirmed', 'completed')}
+    return stats, order_stats
+
+
+# ========== ROLLUP THEO GIỜ ==========
+
+def _hour_bucket(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _bump_rollup(bucket, status, count, revenue):
+    """Cộng dồn (count, revenue) vào ô (bucket, status) bằng một câu upsert."""
+    dialect = db.session.get_bind().dialect.name
+    insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+    stmt = insert(OrderRollup).values(bucket=bucket, status=status,
+                                      order_count=count, revenue=revenue)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['bucket', 'status'],
+        set_={
+            'order_count': OrderRollup.order_count + stmt.excluded.order_count,
+            'revenue': OrderRollup.revenue + stmt.excluded.revenue
+        })
+    db.session.execute(stmt)
+
+
+def record_order_placed(order):
+    """Ghi nhận đơn mới vào rollup; gọi trước commit để cùng một transaction."""
+    created_at = order.created_at or datetime.utcnow()
+    _bump_rollup(_hour_bucket(created_at), order.status, 1, order.total_amount or 0)
+
+
+def record_status_change(order, old_status):
+    """Chuyển đơn từ ô trạng thái cũ sang ô trạng thái mới trong rollup."""
+    if old_status == order.status:
+        return
+    bucket = _hour_bucket(order.created_at)
+    amount = order.total_amount or 0
+    _bump_rollup(bucket, old_status, -1, -amount)
+    _bump_rollup(bucket, order.status, 1, amount)
+
+
+def record_status_changes(changes):
+    """record_status_change cho nhiều đơn một lúc.
+
+    `changes` là các (created_at, total_amount, trạng thái cũ, trạng thái mới);
+    gộp theo ô (giờ, trạng thái) để mỗi ô chỉ cần một câu upsert.
+    """
+    totals = {}
+    for created_at, amount, old_status, new_status in changes:
+        if old_status == new_status:
+            continue
+        bucket = _hour_bucket(created_at)
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            count, revenue = totals.get((bucket, status), (0, 0))
+            totals[(bucket, status)] = (count + sign, revenue + sign * (amount or 0))
+    for (bucket, status), (count, revenue) in totals.items():
+        _bump_rollup(bucket, status, count, revenue)
+
+
+def rebuild_order_rollups():
+    """Tính lại toàn bộ bảng rollup từ bảng Order (dùng khi nâng cấp dữ liệu cũ)."""
+    totals = {}
+    rows = db.session.query(Order.created_at, Order.status, Order.total_amount)\
+        .execution_options(yield_per=1000)
+    for created_at, status, total_amount in rows:
+        key = (_hour_bucket(created_at), status)
+        count, revenue = totals.get(key, (0, 0))
+        totals[key] = (count + 1, revenue + (total_amount or 0))
+
+    OrderRollup.query.delete()
+    db.session.add_all(OrderRollup(bucket=bucket, status=status, order_count=count, revenue=revenue)
+                       for (bucket, status), (count, revenue) in totals.items())
+    db.session.commit()
+    return len(totals)
+
+
+def _tz_offset():
+    return timedelta(hours=current_app.config.get('REPORT_TZ_OFFSET_HOURS', DEFAULT_TZ_OFFSET_HOURS))
+
+
+def revenue_by_day(days=7, now=None):
+    """Doanh thu (không tính đơn đã hủy) của `days` ngày gần nhất theo giờ địa phương.
+
+    Trả về (labels, values) với mỗi ngày một phần tử, kể cả ngày không có đơn.
+    """
+    offset = _tz_offset()
+    today = ((now or datetime.utcnow()) + offset).date()
+    first_day = today - timedelta(days=days - 1)
+    start = datetime.combine(first_day, datetime.min.time()) - offset
+
+    rows = db.session.query(OrderRollup.bucket, db.func.sum(OrderRollup.revenue))\
+        .filter(OrderRollup.bucket >= start, OrderRollup.status != 'cancelled')\
+        .group_by(OrderRollup.bucket).all()
+
+    per_day = {}
+    for bucket, revenue in rows:
+        day = (bucket + offset).date()
+        per_day[day] = per_day.get(day, 0) + (revenue or 0)
+
+    labels, values = [], []
+    for i in range(days):
+        day = first_day + timedelta(days=i)
+        labels.append(day.strftime('%d/%m'))
+        values.append(per_day.get(day, 0))
+    return labels, values
+
+
+def orders_by_hour(days=30, now=None):
+    """Số đơn đặt theo giờ trong ngày (giờ địa phương) trong `days` ngày gần nhất."""
+    offset = _tz_offset()
+    start = (now or datetime.utcnow()) - timedelta(days=days)
+
+    rows = db.session.query(OrderRollup.bucket, db.func.sum(OrderRollup.order_count))\
+        .filter(OrderRollup.bucket >= _hour_bucket(start))\
+        .group_by(OrderRollup.bucket).all()
+
+    # Luôn hiển thị khung giờ mở cửa 07h-21h, thêm giờ khác nếu có đơn
+    hours = {f"{i:02d}": 0 for i in range(7, 22)}
+    for bucket, count in rows:
+        if count:
+            hour = f"{(bucket + offset).hour:02d}"
+            hours[hour] = hours.get(hour, 0) + count
+    return dict(sorted(hours.items()))
@@ -0,0 +1,227 @@
+"""Tìm kiếm toàn văn sinh viên và món ăn phía server.
+
+Văn bản được "gấp" bỏ dấu tiếng Việt trước khi đánh chỉ mục và trước khi tìm,
+nên "pho bo" khớp "Phở bò", "nguyen van" khớp "Nguyễn Văn". Mỗi từ trong câu
+tìm là tiền tố ("ngu" khớp "Nguyễn") và mọi từ phải cùng khớp.
+
+Hai backend cùng giao diện:
+
+- Fts5Backend: bảng ảo SQLite FTS5 (student_fts, menu_fts), rowid = id gốc.
+- TermBackend: bảng search_term (kind, term, ref_id) dùng được trên mọi DB;
+  tìm tiền tố bằng khoảng term >= 'abc' AND term < 'abc\\uffff' trên khóa chính.
+
+SearchIndex chọn FTS5 nếu SQLite hỗ trợ, ngược lại dùng search_term. Chỉ mục
+được cập nhật trong cùng transaction với thay đổi dữ liệu (route gọi
+index_student / index_menu_item trước commit). ensure() chạy ở đầu request
+đầu tiên của mỗi process: tạo bảng nếu thiếu, và nếu chỉ mục rỗng mà bảng gốc
+có dữ liệu (DB cũ, dữ liệu mẫu) thì dựng lại toàn bộ.
+"""
+import re
+import threading
+import unicodedata
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from models import db, MenuItem, SearchTerm, StudentDetail
+
+KINDS = ('student', 'menu')
+MAX_QUERY_TERMS = 8
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def fold(value):
+    """Chữ thường, bỏ dấu (kể cả đ -> d)."""
+    value = unicodedata.normalize('NFD', value or '')
+    value = ''.join(ch for ch in value if unicodedata.category(ch) != 'Mn')
+    return value.replace('đ', 'd').replace('Đ', 'd').lower()
+
+
+def terms(value):
+    return _WORD.findall(fold(value))
+
+
+def query_terms(query):
+    """Các từ khác nhau trong câu tìm (tối đa MAX_QUERY_TERMS)."""
+    found = []
+    for term in terms(query):
+        if term not in found:
+            found.append(term)
+    return found[:MAX_QUERY_TERMS]
+
+
+def student_text(student):
+    return ' '.join([student.ma_sv, student.ho_ten, student.nganh_hoc, student.email, student.sdt])
+
+
+class Fts5Backend:
+    name = 'fts5'
+    TABLES = {'student': 'student_fts', 'menu': 'menu_fts'}
+
+    def create(self, session):
+        for table in self.TABLES.values():
+            session.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} "
+                                 f"USING fts5(body, tokenize='unicode61')"))
+
+    def count(self, session, kind):
+        return session.execute(text(f'SELECT count(*) FROM {self.TABLES[kind]}')).scalar()
+
+    def replace(self, session, kind, rows):
+        table = self.TABLES[kind]
+        rows = [{'id': ref_id, 'body': ' '.join(terms(body))} for ref_id, body in rows]
+        if rows:
+            session.execute(text(f'DELETE FROM {table} WHERE rowid = :id'), rows)
+            session.execute(text(f'INSERT INTO {table} (rowid, body) VALUES (:id, :body)'), rows)
+
+    def remove(self, session, kind, ref_id):
+        session.execute(text(f'DELETE FROM {self.TABLES[kind]} WHERE rowid = :id'), {'id': ref_id})
+
+    def clear(self, session, kind):
+        session.execute(text(f'DELETE FROM {self.TABLES[kind]}'))
+
+    def matching(self, kind, words):
+        table = self.TABLES[kind]
+        match = ' '.join(f'"{word}"*' for word in words)
+        return db.select(db.literal_column('rowid')).select_from(db.table(table))\
+            .where(text(f'{table} MATCH :match').bindparams(match=match))
+
+
+class TermBackend:
+    name = 'terms'
+
+    def create(self, session):
+        SearchTerm.__table__.create(session.connection(), checkfirst=True)
+
+    def count(self, session, kind):
+        return session.query(db.func.count()).select_from(SearchTerm)\
+            .filter(SearchTerm.kind == kind).scalar()
+
+    def replace(self, session, kind, rows):
+        rows = list(rows)
+        if not rows:
+            return
+        ids = [ref_id for ref_id, _ in rows]
+        session.execute(db.delete(SearchTerm).where(SearchTerm.kind == kind, SearchTerm.ref_id.in_(ids)))
+        values = [{'kind': kind, 'term': term[:SearchTerm.TERM_LENGTH], 'ref_id': ref_id}
+                  for ref_id, body in rows for term in set(terms(body))]
+        if values:
+            session.execute(db.insert(SearchTerm).prefix_with('OR IGNORE', dialect='sqlite'), values)
+
+    def remove(self, session, kind, ref_id):
+        session.execute(db.delete(SearchTerm).where(SearchTerm.kind == kind, SearchTerm.ref_id == ref_id))
+
+    def clear(self, session, kind):
+        session.execute(db.delete(SearchTerm).where(SearchTerm.kind == kind))
+
+    def matching(self, kind, words):
+        selects = [db.select(SearchTerm.ref_id).where(
+            SearchTerm.kind == kind,
+            SearchTerm.term >= word,
+            SearchTerm.term < word + '\uffff') for word in words]
+        return selects[0] if len(selects) == 1 else db.intersect(*selects)
+
+
+class SearchIndex:
+    """Chỉ mục tìm kiếm sinh viên và món ăn; `backend` là 'fts5', 'terms' hoặc None (tự chọn)."""
+
+    def __init__(self, backend=None, menu_description=None):
+        self.preferred = backend
+        self.menu_description = menu_description or (lambda item: '')
+        self.backend = None
+        self._lock = threading.Lock()
+
+    # ----- Khởi tạo -----
+
+    def ensure(self):
+        """Tạo bảng chỉ mục (một lần mỗi process) và dựng lại nếu đang rỗng."""
+        if self.backend is not None:
+            return self.backend
+        with self._lock:
+            if self.backend is None:
+                backend = self._create_backend()
+                for kind in KINDS:
+                    if not backend.count(db.session, kind) and self._source_count(kind):
+                        self._rebuild(backend, kind)
+                db.session.commit()
+                self.backend = backend
+        return self.backend
+
+    def _create_backend(self):
+        candidates = [self.preferred] if self.preferred else ['fts5', 'terms']
+        if db.engine.dialect.name != 'sqlite' and 'fts5' in candidates:
+            candidates.remove('fts5')
+        for name in candidates:
+            backend = Fts5Backend() if name == 'fts5' else TermBackend()
+            try:
+                backend.create(db.session)
+                db.session.commit()
+                return backend
+            except OperationalError:
+                # SQLite được build không có FTS5
+                db.session.rollback()
+        raise RuntimeError(f'Không tạo được chỉ mục tìm kiếm ({", ".join(candidates)})')
+
+    def _source_count(self, kind):
+        model = StudentDetail if kind == 'student' else MenuItem
+        return db.session.query(db.func.count(model.id)).scalar()
+
+    def _rebuild(self, backend, kind, chunk=1000):
+        backend.clear(db.session, kind)
+        if kind == 'student':
+            query = StudentDetail.query.order_by(StudentDetail.id)
+            row = lambda student: (student.id, student_text(student))
+        else:
+            query = MenuItem.query.order_by(MenuItem.id)
+            row = lambda item: (item.id, self._menu_text(item))
+        batch = []
+        for obj in query.yield_per(chunk):
+            batch.append(row(obj))
+            if len(batch) >= chunk:
+                backend.replace(db.session, kind, batch)
+                batch = []
+        backend.replace(db.session, kind, batch)
+
+    def rebuild(self):
+        """Dựng lại toàn bộ chỉ mục; trả về {kind: số bản ghi}."""
+        backend = self.ensure()
+        for kind in KINDS:
+            self._rebuild(backend, kind)
+        db.session.commit()
+        return {kind: backend.count(db.session, kind) for kind in KINDS}
+
+    # ----- Cập nhật (trong transaction của route, commit cùng dữ liệu) -----
+
+    def _menu_text(self, item):
+        return ' '.join([item.ten_mon, item.loai, self.menu_description(item) or ''])
+
+    def index_students(self, students):
+        self.ensure().replace(db.session, 'student', [(s.id, student_text(s)) for s in students])
+
+    def index_student(self, student):
+        self.index_students([student])
+
+    def remove_student(self, student):
+        self.ensure().remove(db.session, 'student', student.id)
+
+    def index_menu_item(self, item):
+        self.ensure().replace(db.session, 'menu', [(item.id, self._menu_text(item))])
+
+    def remove_menu_item(self, item):
+        self.ensure().remove(db.session, 'menu', item.id)
+
+    # ----- Tìm kiếm -----
+
+    def matching(self, kind, query):
+        """Select các id khớp `query` (dùng trong .in_()), hoặc None nếu câu tìm rỗng."""
+        words = query_terms(query)
+        if not words:
+            return None
+        return self.ensure().matching(kind, words)
+
+    def search_ids(self, kind, query, limit=None):
+        select = self.matching(kind, query)
+        if select is None:
+            return []
+        if limit:
+            select = select.limit(limit)
+        return [row[0] for row in db.session.execute(select)]
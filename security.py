@@ -0,0 +1,173 @@
+"""Băm mật khẩu và giới hạn số lần đăng nhập.
+
+Giờ cao điểm (7:00, 11:30) hàng trăm sinh viên đăng nhập cùng lúc nên chi phí
+băm mật khẩu phải có giới hạn biết trước:
+
+- PasswordPolicy: thuật toán/số vòng băm cấu hình được (PASSWORD_HASH_METHOD).
+  Hash cũ yếu hơn cấu hình hiện tại được băm lại khi người dùng đăng nhập
+  đúng; hash mạnh hơn (vd. scrypt khi cấu hình là pbkdf2) được giữ nguyên.
+  Lần xác thực đúng gần đây được nhớ (theo HMAC với khóa ngẫu nhiên của
+  process) nên đăng nhập lại không phải băm lại từ đầu.
+- LoginRateLimiter: token bucket theo username và theo IP, chạy trước khi băm,
+  để đoán mật khẩu liên tục không chiếm CPU.
+
+Đo thông lượng:  python benchmarks/bench_login.py
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Mặc định của werkzeug; hash dài ~162 ký tự (cột password_hash là String(255)).
+# Chi phí mỗi lần đăng nhập lặp lại được cache, xem PasswordPolicy.verify
+DEFAULT_HASH_METHOD = 'scrypt:32768:8:1'
+# Thứ tự độ mạnh giữa các họ thuật toán; họ khác (hash cũ, không rõ) luôn yếu nhất
+_METHOD_RANKS = {'pbkdf2': 1, 'scrypt': 2}
+
+
+def hash_strength(password_hash):
+    """(hạng thuật toán, chi phí) của hash werkzeug, để so sánh hash nào mạnh hơn."""
+    method = password_hash.split('$', 1)[0].split(':')
+    try:
+        if method[0] == 'scrypt':
+            n, r, p = (int(value) for value in method[1:4])
+            return _METHOD_RANKS['scrypt'], n * r * p
+        if method[0] == 'pbkdf2':
+            return _METHOD_RANKS['pbkdf2'], int(method[2])
+    except (IndexError, ValueError):
+        pass
+    return 0, 0
+
+
+class PasswordPolicy:
+    """Băm và kiểm tra mật khẩu theo một cấu hình cố định."""
+
+    def __init__(self, method=DEFAULT_HASH_METHOD, cache_size=2048, cache_ttl=600):
+        self.method = method
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._secret = os.urandom(32)
+        self._hash_prefix = None
+        self._verified = OrderedDict()
+        self._lock = threading.Lock()
+
+    def configure(self, method=None, cache_size=None, cache_ttl=None):
+        if method:
+            self.method = method
+            self._hash_prefix = None
+        if cache_size is not None:
+            self.cache_size = cache_size
+        if cache_ttl is not None:
+            self.cache_ttl = cache_ttl
+        with self._lock:
+            self._verified.clear()
+
+    def hash(self, password):
+        return generate_password_hash(password, method=self.method)
+
+    def hash_many(self, passwords, executor=None):
+        """Băm nhiều mật khẩu, song song trên `executor` (vd. ProcessPoolExecutor) nếu có."""
+        if executor is None:
+            return [self.hash(password) for password in passwords]
+        passwords = list(passwords)
+        chunksize = max(1, len(passwords) // (4 * (os.cpu_count() or 1)))
+        return list(executor.map(partial(generate_password_hash, method=self.method),
+                                 passwords, chunksize=chunksize))
+
+    def needs_rehash(self, password_hash):
+        """Hash yếu hơn cấu hình hiện tại (không bao giờ đổi scrypt sang pbkdf2)."""
+        if self._hash_prefix is None:
+            # Cấu hình viết tắt ('pbkdf2:sha256') được werkzeug ghi đầy đủ số vòng
+            # vào hash, nên lấy tiền tố từ một hash mẫu
+            self._hash_prefix = self.hash('').split('$', 1)[0]
+        return hash_strength(password_hash) < hash_strength(self._hash_prefix)
+
+    def _cache_key(self, password_hash, password):
+        message = password_hash.encode('utf-8') + b'\0' + password.encode('utf-8')
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def verify(self, password_hash, password):
+        """Trả về (đúng mật khẩu?, hash mới nếu hash cũ yếu hơn cấu hình hiện tại)."""
+        key = self._cache_key(password_hash, password)
+        now = time.time()
+        with self._lock:
+            verified_at = self._verified.get(key)
+            cached = verified_at is not None and now - verified_at <= self.cache_ttl
+        if not cached:
+            if not check_password_hash(password_hash, password):
+                return False, None
+            with self._lock:
+                self._verified[key] = now
+                self._verified.move_to_end(key)
+                while len(self._verified) > self.cache_size:
+                    self._verified.popitem(last=False)
+        if self.needs_rehash(password_hash):
+            new_hash = self.hash(password)
+            with self._lock:
+                self._verified[self._cache_key(new_hash, password)] = now
+            return True, new_hash
+        return True, None
+
+
+class TokenBucket:
+    """`capacity` lượt, hồi `rate` lượt mỗi giây."""
+
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated_at = now
+
+
+class LoginRateLimiter:
+    """Token bucket riêng cho từng username và từng IP.
+
+    Giới hạn theo IP để rộng vì cả trường có thể đi ra cùng một IP (NAT).
+    """
+
+    def __init__(self, user_capacity=5, user_rate=1 / 30, ip_capacity=100, ip_rate=5,
+                 max_keys=10000):
+        self.limits = {
+            'user': (user_capacity, user_rate),
+            'ip': (ip_capacity, ip_rate),
+        }
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _take(self, kind, key, now):
+        capacity, rate = self.limits[kind]
+        bucket = self._buckets.get((kind, key))
+        if bucket is None:
+            bucket = self._buckets[(kind, key)] = TokenBucket(capacity, now)
+        else:
+            bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * rate)
+            bucket.updated_at = now
+        self._buckets.move_to_end((kind, key))
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def allow(self, username, ip):
+        """Lấy một lượt cho cả username và IP; False nếu một trong hai đã hết."""
+        now = time.monotonic()
+        with self._lock:
+            allowed = self._take('ip', ip, now) and self._take('user', (username or '').lower(), now)
+            # Bucket cũ nhất đã hồi đầy từ lâu; bỏ đi để dict không phình
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed
+
+    def reset(self, username):
+        """Đăng nhập đúng: trả lại đủ lượt cho username."""
+        with self._lock:
+            self._buckets.pop(('user', (username or '').lower()), None)
+
+
+password_policy = PasswordPolicy(os.getenv('PASSWORD_HASH_METHOD', DEFAULT_HASH_METHOD))
@@ -0,0 +1,195 @@
+"""Nhập / xuất danh sách sinh viên bằng CSV, đọc và ghi theo luồng.
+
+Nhập (StudentImporter.run) đọc CSV từng lô `chunk_size` dòng:
+
+1. Kiểm tra cột bắt buộc, độ dài, trùng lặp trong chính file.
+2. Kiểm tra trùng username / ma_sv với DB bằng một câu IN (...) mỗi lô.
+3. Băm mật khẩu song song trên `executor` (PasswordPolicy.hash_many): route web
+   dùng thread pool chung của app (hashlib nhả GIL khi băm), CLI dùng process pool.
+4. Ghi user + student_detail + chỉ mục tìm kiếm, commit theo lô.
+
+Sau mỗi lô run() yield một ImportReport (số dòng đã đọc, đã tạo, lỗi theo số
+dòng) để CLI in tiến độ và route trả về dạng NDJSON. Lỗi ở một dòng không làm
+hỏng cả file; lô đã commit được giữ lại.
+
+Xuất (export_students_csv) đọc theo yield_per nên bộ nhớ không phụ thuộc số
+sinh viên. File xuất dùng cùng tên cột nên có thể nhập lại (thêm cột password).
+"""
+import csv
+import io
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, StudentDetail
+
+STUDENT_COLUMNS = ('username', 'ma_sv', 'ho_ten', 'nganh_hoc', 'email', 'sdt')
+IMPORT_COLUMNS = STUDENT_COLUMNS + ('password',)
+# Khớp độ dài cột trong models.py
+MAX_LENGTHS = {'username': 80, 'ma_sv': 20, 'ho_ten': 100, 'nganh_hoc': 100, 'email': 120, 'sdt': 15}
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.error_count = 0
+        self.errors = []  # (số dòng trong file, thông báo), tối đa MAX_REPORTED_ERRORS
+        self.done = False
+
+    def error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def to_dict(self, errors_from=0):
+        """`errors_from`: chỉ gửi các lỗi mới kể từ lần báo trước."""
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': [{'line': line, 'message': message} for line, message in self.errors[errors_from:]],
+            'done': self.done,
+        }
+
+
+class StudentImporter:
+    def __init__(self, password_policy, search_index=None, counters=None, chunk_size=500, executor=None):
+        self.password_policy = password_policy
+        self.search_index = search_index
+        self.counters = counters
+        self.chunk_size = chunk_size
+        # Không có executor thì băm ngay trong thread hiện tại
+        self.executor = executor
+
+    def run(self, text_stream):
+        """Nhập từ file text (đã decode); yield ImportReport sau mỗi lô.
+
+        Ném ValueError nếu thiếu cột bắt buộc.
+        """
+        reader = csv.DictReader(text_stream)
+        fields = [name.strip() for name in reader.fieldnames or []]
+        missing = [column for column in IMPORT_COLUMNS if column not in fields]
+        if missing:
+            raise ValueError(f"Thiếu cột: {', '.join(missing)}")
+        reader.fieldnames = fields
+
+        report = ImportReport()
+        seen_usernames, seen_ma_sv = set(), set()
+        chunk = []
+        # Dòng 1 là tiêu đề
+        for line, raw in enumerate(reader, start=2):
+            report.rows += 1
+            row = self._validate(line, raw, report, seen_usernames, seen_ma_sv)
+            if row is not None:
+                chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk, report)
+                chunk = []
+                yield report
+        if chunk:
+            self._import_chunk(chunk, report)
+        report.done = True
+        yield report
+
+    def _validate(self, line, raw, report, seen_usernames, seen_ma_sv):
+        row = {column: (raw.get(column) or '').strip() for column in IMPORT_COLUMNS}
+        empty = [column for column in IMPORT_COLUMNS if not row[column]]
+        if empty:
+            report.error(line, f"Thiếu giá trị: {', '.join(empty)}")
+            return None
+        too_long = [column for column, limit in MAX_LENGTHS.items() if len(row[column]) > limit]
+        if too_long:
+            report.error(line, f"Quá dài: {', '.join(too_long)}")
+            return None
+        if row['username'] in seen_usernames:
+            report.error(line, f"Tên đăng nhập {row['username']} bị lặp trong file")
+            return None
+        if row['ma_sv'] in seen_ma_sv:
+            report.error(line, f"Mã sinh viên {row['ma_sv']} bị lặp trong file")
+            return None
+        seen_usernames.add(row['username'])
+        seen_ma_sv.add(row['ma_sv'])
+        row['line'] = line
+        return row
+
+    def _without_conflicts(self, rows, report):
+        """Bỏ các dòng trùng username / ma_sv đã có trong DB (hai câu IN cho cả lô)."""
+        taken_usernames = {name for (name,) in db.session.query(User.username)
+                           .filter(User.username.in_([row['username'] for row in rows]))}
+        taken_ma_sv = {code for (code,) in db.session.query(StudentDetail.ma_sv)
+                       .filter(StudentDetail.ma_sv.in_([row['ma_sv'] for row in rows]))}
+        kept = []
+        for row in rows:
+            if row['username'] in taken_usernames:
+                report.error(row['line'], f"Tên đăng nhập {row['username']} đã tồn tại")
+            elif row['ma_sv'] in taken_ma_sv:
+                report.error(row['line'], f"Mã sinh viên {row['ma_sv']} đã tồn tại")
+            else:
+                kept.append(row)
+        return kept
+
+    def _import_chunk(self, rows, report):
+        rows = self._without_conflicts(rows, report)
+        if not rows:
+            return
+        hashes = self.password_policy.hash_many([row['password'] for row in rows], self.executor)
+        for row, password_hash in zip(rows, hashes):
+            row['password_hash'] = password_hash
+
+        # Admin khác có thể vừa thêm trùng giữa lúc kiểm tra và lúc ghi: kiểm tra lại một lần
+        for attempt in range(2):
+            try:
+                self._insert(rows)
+                break
+            except IntegrityError:
+                db.session.rollback()
+                if attempt:
+                    for row in rows:
+                        report.error(row['line'], 'Không ghi được (trùng dữ liệu khi đang nhập)')
+                    return
+                rows = self._without_conflicts(rows, report)
+                if not rows:
+                    return
+        report.created += len(rows)
+        if self.counters is not None:
+            self.counters.student_added(len(rows))
+
+    def _insert(self, rows):
+        user_ids = dict(db.session.execute(
+            insert(User).returning(User.username, User.id, sort_by_parameter_order=True),
+            [{'username': row['username'], 'password_hash': row['password_hash'], 'role': 'student'}
+             for row in rows]).all())
+        details = [{'user_id': user_ids[row['username']],
+                    **{column: row[column] for column in STUDENT_COLUMNS if column != 'username'}}
+                   for row in rows]
+        detail_ids = db.session.execute(
+            insert(StudentDetail).returning(StudentDetail.id, sort_by_parameter_order=True),
+            details).scalars().all()
+        if self.search_index is not None:
+            self.search_index.index_students(
+                [StudentDetail(id=detail_id, **detail) for detail_id, detail in zip(detail_ids, details)])
+        db.session.commit()
+
+
+def export_students_csv(chunk_size=1000):
+    """Sinh CSV (kèm BOM cho Excel) từng khối ~chunk_size dòng, theo thứ tự id."""
+    query = db.session.query(User.username, StudentDetail.ma_sv, StudentDetail.ho_ten,
+                             StudentDetail.nganh_hoc, StudentDetail.email, StudentDetail.sdt)\
+        .join(User, User.id == StudentDetail.user_id)\
+        .order_by(StudentDetail.id)\
+        .execution_options(stream_results=True)\
+        .yield_per(chunk_size)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    buffer.write('\ufeff')
+    writer.writerow(STUDENT_COLUMNS)
+    count = 0
+    for row in query:
+        writer.writerow(row)
+        count += 1
+        if count % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
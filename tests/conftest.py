@@ -0,0 +1,28 @@
+"""Fixture dùng chung: app Flask nhỏ gắn models với một DB SQLite tạm cho mỗi test.
+
+Không import app.py (nạp .env, model Gemini, thread pool...); các module được
+kiểm thử trực tiếp với db của models.py.
+"""
+import os
+import sys
+
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from database import init_database  # noqa: E402
+from models import db  # noqa: E402
+
+
+@pytest.fixture
+def db_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(TESTING=True, SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                      DATABASE_URL=f"sqlite:///{tmp_path / 'test.db'}")
+    init_database(app, db)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,42 @@
+import threading
+
+from cache import MenuCache, MenuEntry
+
+
+def entry(gia):
+    return MenuEntry(id=1, ten_mon='Cơm gà', gia=gia, loai='Món chính', is_available=True,
+                     image=None, image_srcset=None, icon_emoji='', description='')
+
+
+def test_menu_cache_reuses_snapshot_until_invalidated():
+    calls = []
+    cache = MenuCache(lambda: calls.append(1) or [entry(30000)], ttl=60)
+    first = cache.get()
+    assert cache.get() is first and len(calls) == 1
+    cache.invalidate()
+    # Dữ liệu không đổi: dựng lại nhưng giữ snapshot (và version) cũ
+    assert cache.get() is first and len(calls) == 2
+
+
+def test_invalidate_during_rebuild_keeps_snapshot_expired():
+    price = [30000]
+    building, edited = threading.Event(), threading.Event()
+
+    def builder():
+        items = [entry(price[0])]
+        if not edited.is_set():
+            # Đọc xong DB thì admin sửa giá và invalidate() trước khi lần dựng này kết thúc
+            building.set()
+            edited.wait(5)
+        return items
+
+    cache = MenuCache(builder, ttl=60)
+    reader = threading.Thread(target=cache.get)
+    reader.start()
+    assert building.wait(5)
+    price[0] = 35000
+    cache.invalidate()
+    edited.set()
+    reader.join(5)
+
+    assert cache.get().by_id[1].gia == 35000
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from cart_store import EMPTY_SUMMARY, MemoryCartStore, SqlCartStore
+
+PHO = {'id': 1, 'name': 'Phở bò', 'price': 40000, 'loai': 'Món chính'}
+CAFE = {'id': 2, 'name': 'Cafe sữa', 'price': 15000, 'loai': 'Đồ uống'}
+ITEMS = [PHO, CAFE, {'id': 3, 'name': 'Xôi gà', 'price': 25000, 'loai': 'Món chính'}]
+
+
+def real_totals(store, cart_id):
+    lines = store.items(cart_id).values()
+    return (sum(line['quantity'] for line in lines), len(lines),
+            sum(line['quantity'] * line['price'] for line in lines))
+
+
+@pytest.fixture(params=['sql', 'memory'])
+def store(request, db_app):
+    return SqlCartStore() if request.param == 'sql' else MemoryCartStore()
+
+
+def test_totals_follow_each_change(store):
+    line, summary = store.add('c1', PHO, 2)
+    assert line['quantity'] == 2
+    assert summary == (2, 1, 80000)
+    line, summary = store.add('c1', PHO, 1)
+    assert line['quantity'] == 3
+    assert summary == (3, 1, 120000)
+
+    _, summary = store.add('c1', CAFE, 1)
+    assert summary == (4, 2, 135000)
+    _, summary = store.set_quantity('c1', PHO['id'], 1)
+    assert summary == (2, 2, 55000)
+    line, summary = store.set_price('c1', CAFE['id'], 20000)
+    assert line['price'] == 20000
+    assert summary == (2, 2, 60000)
+
+    line, summary = store.remove('c1', PHO['id'])
+    assert line['quantity'] == 0
+    assert summary == (1, 1, 20000)
+    assert tuple(store.summary('c1')) == real_totals(store, 'c1')
+
+
+def test_missing_cart_or_line(store):
+    assert store.set_quantity('nope', PHO['id'], 3) == (None, EMPTY_SUMMARY)
+    store.add('c1', PHO, 1)
+    line, summary = store.set_quantity('c1', CAFE['id'], 3)
+    assert line is None
+    assert summary == (1, 1, 40000)
+    store.clear('c1')
+    assert store.summary('c1') == EMPTY_SUMMARY
+    assert store.items('c1') == {}
+
+
+def test_concurrent_adds_keep_totals_consistent(db_app):
+    """Nhiều request cùng thêm món vào một giỏ (kể cả giỏ chưa tồn tại)."""
+    store = SqlCartStore()
+    errors = []
+
+    def worker(n):
+        try:
+            with db_app.app_context():
+                for k in range(5):
+                    store.add('shared', ITEMS[(n + k) % len(ITEMS)], 1)
+        except Exception as e:  # noqa: BLE001 - báo lỗi của thread về test
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert tuple(store.summary('shared')) == real_totals(store, 'shared')
+    assert store.summary('shared').count == 30
@@ -0,0 +1,95 @@
+import threading
+
+import pytest
+
+from chatbot import ChatBusy, ChatService, ChatTimeout, FakeChatModel, ResponseCache
+
+REPLY = 'Hôm nay có phở bò và cơm gà'
+
+
+class GatedModel(FakeChatModel):
+    """FakeChatModel chỉ bắt đầu trả lời khi test mở `gate`; đếm số chunk đã sinh."""
+
+    def __init__(self, **kwargs):
+        super().__init__(reply=REPLY, **kwargs)
+        self.gate = threading.Event()
+        self.chunks = 0
+
+    def _stream(self, words):
+        self.gate.wait(5)
+        for chunk in super()._stream(words):
+            self.chunks += 1
+            yield chunk
+
+
+def submit_eventually(service, prompt, timeout=2):
+    """Worker trả slot sau khi thấy cờ hủy ở chunk kế tiếp: thử lại trong `timeout` giây."""
+    stopped = threading.Event()
+    for _ in range(int(timeout / 0.01)):
+        try:
+            return service.submit(prompt)
+        except ChatBusy:
+            stopped.wait(0.01)
+    raise AssertionError('ChatService không trả slot')
+
+
+def test_stream_yields_chunks_in_order():
+    service = ChatService(FakeChatModel(reply=REPLY, delay=0), timeout=5)
+    chunks = list(service.submit('prompt').stream())
+    assert len(chunks) == len(REPLY.split(' '))
+    assert ''.join(chunks).strip() == REPLY
+
+
+def test_queue_full_raises_busy_and_frees_slots():
+    model = GatedModel(delay=0)
+    service = ChatService(model, max_workers=1, max_queue=1, timeout=5)
+    running, queued = service.submit('a'), service.submit('b')
+    with pytest.raises(ChatBusy):
+        service.submit('c')
+
+    model.gate.set()
+    assert running.result().strip() == REPLY
+    assert queued.result().strip() == REPLY
+    assert service.submit('d').result().strip() == REPLY
+
+
+def test_waiters_cap_is_separate_from_queue():
+    model = GatedModel(delay=0)
+    service = ChatService(model, max_workers=2, max_queue=8, timeout=5, max_waiters=1)
+    job = service.submit('a')
+    with pytest.raises(ChatBusy):
+        service.submit('b')
+    # Request bỏ đi (đóng kết nối) cũng trả chỗ chờ
+    job.close()
+    model.gate.set()
+    assert service.submit('c').result().strip() == REPLY
+
+
+def test_timeout_cancels_job():
+    model = GatedModel(delay=0)
+    service = ChatService(model, max_workers=1, max_queue=0, timeout=0.05)
+    job = service.submit('a')
+    with pytest.raises(ChatTimeout):
+        job.result()
+    assert job.cancelled.is_set()
+    model.gate.set()
+    # Worker dừng ở chunk đầu tiên sau khi bị hủy rồi trả slot
+    assert submit_eventually(service, 'b').result().strip() == REPLY
+    assert model.chunks == len(REPLY.split(' ')) + 1
+
+
+def test_closing_stream_stops_worker():
+    model = FakeChatModel(reply=' '.join(['từ'] * 50), delay=0.01)
+    service = ChatService(model, max_workers=1, max_queue=0, timeout=5, max_waiters=1)
+    stream = service.submit('a').stream()
+    next(stream)
+    stream.close()
+    # Slot và chỗ chờ được trả khi worker thấy cờ hủy
+    assert len(submit_eventually(service, 'b').result().split()) == 50
+
+
+def test_response_cache_normalizes_question_and_version():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.put(1, 'Món gì dưới 30k???', 'Bánh mì')
+    assert cache.get(1, '  món gì  dưới 30k') == 'Bánh mì'
+    assert cache.get(2, 'Món gì dưới 30k') is None
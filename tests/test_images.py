@@ -0,0 +1,100 @@
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import images
+from images import RemoteImageCache
+
+CONTENT = b'not really a jpeg'
+
+
+@pytest.fixture
+def image_server():
+    """Server HTTP cục bộ thay cho CDN: đếm số lượt tải, trả ảnh chậm `delay` giây."""
+    state = {'hits': 0, 'delay': 0.2, 'status': 200}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            state['hits'] += 1
+            time.sleep(state['delay'])
+            self.send_response(state['status'])
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(CONTENT)))
+            self.end_headers()
+            self.wfile.write(CONTENT)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state['url'] = f'http://127.0.0.1:{server.server_port}/pho.jpg'
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def make_cache(tmp_path, image_server, **kwargs):
+    return RemoteImageCache({'pho_bo': image_server['url']}, str(tmp_path), timeout=5, **kwargs)
+
+
+def test_prefetch_is_single_flight(tmp_path, image_server):
+    cache = make_cache(tmp_path, image_server)
+    futures = []
+    threads = [threading.Thread(target=lambda: futures.append(cache.prefetch('pho_bo'))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({id(future) for future in futures}) == 1
+    path = futures[0].result(timeout=5)
+    assert image_server['hits'] == 1
+    assert cache.lookup('pho_bo') == path
+    # Đã có trong cache thì không tải lại
+    assert cache.prefetch('pho_bo') is None
+    assert cache.prefetch_missing() == []
+    assert image_server['hits'] == 1
+
+
+def test_file_is_visible_only_when_complete(tmp_path, image_server):
+    cache = make_cache(tmp_path, image_server)
+    future = cache.prefetch('pho_bo')
+    # Đang tải: request vẫn nhận ảnh tạm, không có file dở dang mang tên thật
+    assert cache.lookup('pho_bo') is None
+    path = future.result(timeout=5)
+
+    digest = cache.digest('pho_bo')
+    assert os.path.basename(path) == f'remote_pho_bo.{digest}.jpg'
+    with open(path, 'rb') as f:
+        assert f.read() == CONTENT
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+    # Process mới dựng lại index từ đĩa
+    assert make_cache(tmp_path, image_server).lookup('pho_bo') == path
+
+
+def test_failed_write_leaves_no_partial_file(tmp_path, image_server, monkeypatch):
+    cache = make_cache(tmp_path, image_server)
+
+    def broken_replace(src, dst):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(images.os, 'replace', broken_replace)
+    assert cache.prefetch('pho_bo').result(timeout=5) is None
+    assert cache.lookup('pho_bo') is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_fetch_is_retried_after_delay(tmp_path, image_server):
+    image_server['status'] = 500
+    image_server['delay'] = 0
+    cache = make_cache(tmp_path, image_server, retry_after=60)
+    assert cache.prefetch('pho_bo').result(timeout=5) is None
+    # Trong retry_after không gọi lại CDN
+    assert cache.prefetch('pho_bo') is None
+    assert image_server['hits'] == 1
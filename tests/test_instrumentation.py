@@ -0,0 +1,61 @@
+import pytest
+from flask import Response, stream_with_context
+
+from instrumentation import Instrumentation, QueryBudgetExceeded
+from models import db, User
+
+
+@pytest.fixture
+def instrumented(db_app):
+    instrumentation = Instrumentation(budgets={'two_queries': 1, 'streamed': 1})
+    instrumentation.init_app(db_app, db.engine)
+
+    @db_app.route('/two')
+    def two_queries():
+        User.query.count()
+        User.query.first()
+        return 'ok'
+
+    @db_app.route('/stream')
+    def streamed():
+        def generate():
+            for _ in range(3):
+                yield f'{User.query.count()}\n'
+        return Response(stream_with_context(generate()))
+
+    return db_app, instrumentation
+
+
+def test_strict_budget_raises(instrumented):
+    app, _ = instrumented
+    app.config['QUERY_BUDGET_STRICT'] = True
+    with pytest.raises(QueryBudgetExceeded, match='two_queries chạy 2 câu SQL, vượt ngân sách 1'):
+        app.test_client().get('/two')
+
+
+def test_budget_only_logged_when_not_strict(instrumented, caplog):
+    app, instrumentation = instrumented
+    app.config['METRICS_HEADERS'] = True
+    response = app.test_client().get('/two')
+
+    assert response.status_code == 200
+    assert response.headers['X-Query-Count'] == '2'
+    assert 'vượt ngân sách 1' in caplog.text
+    stats = instrumentation.snapshot()['two_queries']
+    assert stats['requests'] == 1
+    assert stats['avg_queries'] == 2
+    assert stats['over_budget'] == 1
+    assert 'canteen_query_budget_exceeded_total{endpoint="two_queries"} 1' in instrumentation.prometheus()
+
+
+def test_streamed_body_queries_are_counted_on_close(instrumented):
+    app, instrumentation = instrumented
+    app.config['QUERY_BUDGET_STRICT'] = True
+    response = app.test_client().get('/stream')
+    assert response.get_data(as_text=True) == '0\n0\n0\n'
+    # Tổng và ngân sách được tính khi response đóng, sau khi body chạy xong
+    assert 'streamed' not in instrumentation.snapshot()
+    with pytest.raises(QueryBudgetExceeded, match='streamed chạy 3 câu SQL'):
+        response.close()
+    assert instrumentation.snapshot()['streamed']['avg_queries'] == 3
+    assert instrumentation.current is None
@@ -0,0 +1,48 @@
+import importlib
+import os
+from unittest import mock
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def canteen(tmp_path_factory):
+    """app.py với DB tạm và dữ liệu mẫu; chỉ đặt biến môi trường trong lúc import."""
+    db_path = tmp_path_factory.mktemp('canteen') / 'canteen.db'
+    with mock.patch.dict(os.environ, {'DATABASE_URL': f'sqlite:///{db_path}', 'CHAT_MODEL': 'fake'}):
+        canteen = importlib.import_module('app')
+    canteen.app.config['TESTING'] = True
+    with canteen.app.app_context():
+        canteen.db.create_all()
+        canteen.create_sample_data()
+    # Không tải ảnh từ CDN trong lúc kiểm thử
+    with mock.patch.object(canteen.remote_images, 'prefetch_missing', return_value=[]):
+        yield canteen
+
+
+@pytest.fixture
+def student(canteen):
+    client = canteen.app.test_client()
+    response = client.post('/login', data={'username': 'sv001', 'password': 'sv001'})
+    assert response.status_code == 302
+    return client
+
+
+def test_menu_with_flash_is_not_revalidated(canteen, student):
+    with canteen.app.app_context():
+        item = canteen.MenuItem.query.filter_by(is_available=True).first()
+        item_id, name = item.id, item.ten_mon
+
+    added = student.post('/add_to_cart', data={'item_id': item_id, 'quantity': 1}, follow_redirects=True)
+    assert added.status_code == 200
+    assert f'Đã thêm {name} vào giỏ hàng!' in added.get_data(as_text=True)
+    assert 'ETag' not in added.headers
+    assert added.cache_control.no_store
+
+    # Lần vào sau: trang mới không còn flash, và chỉ trang đó được dùng để trả 304
+    again = student.get('/menu')
+    assert again.status_code == 200
+    assert f'Đã thêm {name} vào giỏ hàng!' not in again.get_data(as_text=True)
+    assert again.headers['ETag']
+    revisit = student.get('/menu', headers={'If-None-Match': again.headers['ETag']})
+    assert revisit.status_code == 304
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+import reports
+from models import db, Order, OrderRollup, User
+from order_status import matching_order_ids, transition_orders
+
+
+@pytest.fixture
+def orders(db_app):
+    """Bốn đơn: pending (cũ), pending (mới), confirmed (cũ), completed; rollup đã ghi nhận."""
+    user = User(username='sv001', password_hash='-', role='student')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.utcnow()
+    created = []
+    for status, minutes, amount in (('pending', 30, 30000), ('pending', 2, 40000),
+                                    ('confirmed', 20, 25000), ('completed', 60, 15000)):
+        order = Order(user_id=user.id, status=status, total_amount=amount,
+                      created_at=now - timedelta(minutes=minutes))
+        db.session.add(order)
+        db.session.flush()
+        reports.record_order_placed(order)
+        created.append(order.id)
+    db.session.commit()
+    return created
+
+
+def statuses():
+    return dict(db.session.query(Order.id, Order.status))
+
+
+def rollup_cells():
+    return sorted((row.bucket, row.status, row.order_count, row.revenue)
+                  for row in OrderRollup.query if row.order_count or row.revenue)
+
+
+def test_advances_each_order_one_step(orders):
+    pending_old, pending_new, confirmed, completed = orders
+    outcomes, changes = transition_orders([pending_old, confirmed, completed, 999, pending_old])
+    db.session.commit()
+
+    assert outcomes == [
+        {'id': pending_old, 'result': 'updated', 'from': 'pending', 'status': 'confirmed'},
+        {'id': confirmed, 'result': 'updated', 'from': 'confirmed', 'status': 'completed'},
+        {'id': completed, 'result': 'invalid', 'status': 'completed'},
+        {'id': 999, 'result': 'not_found'},
+    ]
+    assert changes == {('pending', 'confirmed'): 1, ('confirmed', 'completed'): 1}
+    assert statuses() == {pending_old: 'confirmed', pending_new: 'pending',
+                          confirmed: 'completed', completed: 'completed'}
+
+
+def test_target_status_only_applies_matching_transition(orders):
+    pending_old, pending_new, confirmed, _ = orders
+    outcomes, changes = transition_orders([pending_old, pending_new, confirmed], to='completed')
+    db.session.commit()
+
+    assert [outcome['result'] for outcome in outcomes] == ['invalid', 'invalid', 'updated']
+    assert changes == {('confirmed', 'completed'): 1}
+
+
+def test_concurrent_change_is_reported_as_conflict(orders):
+    pending_old, pending_new, _, _ = orders
+    engine = db.engine
+
+    fired = []
+
+    # Admin khác xác nhận đơn giữa câu SELECT và câu UPDATE
+    def other_admin(conn, cursor, statement, parameters, context, executemany):
+        if not fired and statement.lstrip().upper().startswith('UPDATE "ORDER"'):
+            fired.append(True)
+            cursor.execute('UPDATE "order" SET status = ? WHERE id = ?', ('confirmed', pending_old))
+
+    event.listen(engine, 'before_cursor_execute', other_admin)
+    try:
+        outcomes, changes = transition_orders([pending_old, pending_new], to='confirmed')
+        db.session.commit()
+    finally:
+        event.remove(engine, 'before_cursor_execute', other_admin)
+
+    assert outcomes[0] == {'id': pending_old, 'result': 'conflict'}
+    assert outcomes[1]['result'] == 'updated'
+    assert changes == {('pending', 'confirmed'): 1}
+
+
+def test_rollup_matches_full_rebuild(orders):
+    transition_orders(orders)
+    transition_orders(orders, to='completed')
+    db.session.commit()
+    incremental = rollup_cells()
+
+    reports.rebuild_order_rollups()
+    assert incremental == rollup_cells()
+
+
+def test_matching_order_ids_filters_by_age(orders):
+    pending_old, pending_new, _, _ = orders
+    assert matching_order_ids('pending') == ([pending_old, pending_new], False)
+    assert matching_order_ids('pending', older_than_minutes=10) == ([pending_old], False)
+    assert matching_order_ids('pending', limit=1) == ([pending_old], True)
@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+
+import pytest
+
+from recommender import Budget, Recommender, parse_budget
+
+
+def item(id, ten_mon, loai, gia):
+    return SimpleNamespace(id=id, ten_mon=ten_mon, loai=loai, gia=gia, is_available=True)
+
+
+@pytest.fixture
+def recommender():
+    items = [
+        item(1, 'Cơm gà', 'Món chính', 35000),
+        item(2, 'Cơm sườn', 'Món chính', 30000),
+        item(3, 'Bánh mì', 'Đồ ăn sáng', 15000),
+        item(4, 'Trà đá', 'Đồ uống', 5000),
+        item(5, 'Nước cam', 'Đồ uống', 20000),
+    ]
+    return Recommender(items, {1: 10, 2: 5, 4: 8})
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('combo dưới 50k', Budget(50000, True)),
+    ('có 50 nghìn ăn gì', Budget(50000, False)),
+    ('món nào 30000đ', Budget(30000, False)),
+    ('tầm 30.000 vnd', Budget(30000, False)),
+    ('tối đa 45000 thì ăn gì', Budget(45000, False)),
+    ('em có 40000 tiền', Budget(40000, False)),
+    ('không quá 25k, dưới 20k', Budget(25000, False)),
+    ('dưới 50000', Budget(50000, True)),
+])
+def test_parse_budget_with_unit_or_cue(text, expected):
+    assert parse_budget(text) == expected
+
+
+@pytest.mark.parametrize('text', [
+    'Tôi sinh viên khóa 2021, nên ăn gì buổi trưa?',
+    'cơm gà 35000 còn không?',
+    'cho 2 món, tối đa 3 người',
+    'đơn 1024 của em đâu rồi',
+])
+def test_parse_budget_ignores_bare_numbers(text):
+    assert parse_budget(text) is None
+
+
+def test_bare_year_is_not_a_budget(recommender):
+    answer = recommender.answer('Tôi sinh viên khóa 2021, nên ăn gì buổi trưa?')
+    assert '2,021đ' not in answer
+    assert answer.startswith('Gợi ý bữa trưa')
+
+
+def test_bare_price_question_goes_to_chatbot(recommender):
+    assert recommender.answer('cơm gà 35000 còn không?') is None
+
+
+def test_budget_question(recommender):
+    answer = recommender.answer('combo dưới 50k')
+    assert answer.startswith('Gợi ý tốt nhất dưới 50,000đ:')
+    assert 'Cơm gà (35,000đ) + Trà đá (5,000đ) = 40,000đ' in answer
+
+
+def test_under_budget_is_strict(recommender):
+    # Combo đúng 50,000đ: được khi "không quá 50k", không được khi "dưới 50k"
+    assert '= 50,000đ' in recommender.answer('không quá 50k ăn gì')
+    assert '= 50,000đ' not in recommender.answer('combo dưới 50k')
+    assert 'Cơm gà' not in recommender.answer('cơm dưới 35k')
+    assert recommender.answer('cơm dưới 30k') == 'Không có món chính nào dưới 30,000đ.'
+
+
+def test_category_wording(recommender):
+    answer = recommender.answer('cơm tối đa 35k')
+    assert answer.startswith('Các món chính không quá 35,000đ:')
+    assert 'món món' not in answer
+    assert recommender.answer('đồ uống dưới 30k').startswith('Các món đồ uống dưới 30,000đ:')
@@ -0,0 +1,38 @@
+from werkzeug.security import generate_password_hash
+
+from security import DEFAULT_HASH_METHOD, PasswordPolicy, hash_strength
+
+SCRYPT = 'scrypt:32768:8:1'
+
+
+def test_default_is_at_least_werkzeug_default():
+    assert hash_strength(PasswordPolicy().hash('x')) >= hash_strength(generate_password_hash('x'))
+    assert DEFAULT_HASH_METHOD == SCRYPT
+
+
+def test_scrypt_hash_is_not_downgraded_to_pbkdf2():
+    policy = PasswordPolicy('pbkdf2:sha256:600000')
+    password_hash = generate_password_hash('sv001', method=SCRYPT)
+    assert policy.verify(password_hash, 'sv001') == (True, None)
+
+
+def test_weaker_hashes_are_upgraded():
+    policy = PasswordPolicy(SCRYPT)
+    for method in ('pbkdf2:sha256:100000', 'scrypt:16384:8:1'):
+        ok, new_hash = policy.verify(generate_password_hash('sv001', method=method), 'sv001')
+        assert ok and new_hash.startswith(SCRYPT + '$')
+        assert policy.verify(new_hash, 'sv001') == (True, None)
+
+
+def test_pbkdf2_rehashed_only_when_fewer_rounds():
+    policy = PasswordPolicy('pbkdf2:sha256:600000')
+    stronger = generate_password_hash('sv001', method='pbkdf2:sha256:700000')
+    assert policy.verify(stronger, 'sv001') == (True, None)
+    ok, new_hash = policy.verify(generate_password_hash('sv001', method='pbkdf2:sha256:1000'), 'sv001')
+    assert ok and new_hash.startswith('pbkdf2:sha256:600000$')
+
+
+def test_wrong_password_is_not_rehashed():
+    policy = PasswordPolicy(SCRYPT)
+    weak = generate_password_hash('sv001', method='pbkdf2:sha256:1000')
+    assert policy.verify(weak, 'wrong') == (False, None)